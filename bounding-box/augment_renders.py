@@ -0,0 +1,219 @@
+"""
+    Render-once, augment-many: applies the glare, blur and exposure effects of the Blender compositor
+    (see `set_filter_nodes` in render.py) to already rendered images, producing several cheap variants
+    per render instead of one full Cycles render per variant.
+"""
+
+import os
+import csv
+import json
+import argparse
+import multiprocessing
+
+import cv2
+import numpy as np
+
+GLARE_TYPES = ['FOG_GLOW', 'SIMPLE_STAR', 'STREAKS', 'GHOSTS']
+# display gamma used to move the 8-bit renders to (approximately) linear light and back
+GAMMA = 2.2
+
+
+def sample_filter_params(rng, filters, max_blur=3):
+    '''Sample random filter parameters.
+
+    Uses the same distributions as `set_filter_nodes` in render.py and returns the parameters in the same `result_dict` layout, with the same defaults for filters that are not applied. The one difference is blur, which is drawn as a whole number of pixels up to `max_blur` (the node version always rounds down to 0).
+
+    args:
+        rng: The numpy random generator to draw from.
+        filters: What filters to apply ('Glare', 'Blur', 'Exposure').
+        max_blur: The largest blur size in pixels.
+
+    returns:
+        result_dict: The parameters of each filter.
+    '''
+    result_dict = {
+        'Glare':{
+            'mix':-1,
+            'threshold': 8,
+            'type': 'None'
+        },
+
+        'Blur':{
+            'size_x':0,
+            'size_y':0
+        },
+
+        'Exposure': -8.15
+    }
+    if 'Glare' in filters:
+        result_dict['Glare']['mix'] = rng.random()*1.0-1.0
+        result_dict['Glare']['type'] = GLARE_TYPES[rng.integers(0,4)]
+        result_dict['Glare']['threshold'] = rng.beta(1,4)
+
+    if 'Blur' in filters:
+        result_dict['Blur']['size_x'] = int(rng.integers(0, max_blur+1))
+        result_dict['Blur']['size_y'] = int(rng.integers(0, max_blur+1))
+
+    if 'Exposure' in filters:
+        result_dict['Exposure'] = rng.uniform(-2, 0)
+
+    return result_dict
+
+
+def _line_kernel(length, angle, falloff=0.9):
+    '''Build a normalized streak kernel through the center at the given angle (degrees), decaying exponentially with distance.'''
+    size = 2*length+1
+    kernel = np.zeros((size, size), np.float32)
+    steps = np.arange(-length, length+1)
+    xs = np.rint(length + steps*np.cos(np.deg2rad(angle))).astype(int)
+    ys = np.rint(length + steps*np.sin(np.deg2rad(angle))).astype(int)
+    np.maximum.at(kernel, (ys, xs), falloff**np.abs(steps))
+    return kernel / kernel.sum()
+
+
+def glare(image, glare_type, threshold, size=32):
+    '''Compute the glare added by the bright parts of a linear image.
+
+    args:
+        image: Linear float32 BGR image.
+        glare_type: One of GLARE_TYPES.
+        threshold: Brightness above which pixels produce glare.
+        size: Reach of the glare in pixels.
+
+    returns:
+        glare_img: The glare image (to be added to the original).
+    '''
+    bright = np.maximum(image - threshold, 0)
+    if not bright.any():
+        return np.zeros_like(image)
+
+    if glare_type == 'FOG_GLOW':
+        glare_img = sum(cv2.GaussianBlur(bright, (0, 0), sigma) for sigma in (size/8, size/4, size/2)) / 3
+    elif glare_type == 'SIMPLE_STAR':
+        glare_img = sum(cv2.filter2D(bright, -1, _line_kernel(size, angle)) for angle in (0, 90)) / 2
+    elif glare_type == 'STREAKS':
+        glare_img = sum(cv2.filter2D(bright, -1, _line_kernel(size, angle)) for angle in (0, 45, 90, 135)) / 4
+    elif glare_type == 'GHOSTS':
+        # scaled (and mirrored, for negative scales) copies of the bright spots about the image center
+        h, w = bright.shape[:2]
+        blurred = cv2.GaussianBlur(bright, (0, 0), size/8)
+        glare_img = np.zeros_like(image)
+        for scale in (-1.5, -0.7, 0.5, 1.3):
+            matrix = np.array([[scale, 0, (1-scale)*w/2], [0, scale, (1-scale)*h/2]], np.float32)
+            glare_img += cv2.warpAffine(blurred, matrix, (w, h))
+        glare_img /= 4
+    else:
+        raise ValueError(f"Unknown glare type {glare_type}")
+    return glare_img
+
+
+def apply_filters(image, result_dict, filters):
+    '''Apply the glare, blur and exposure described by a `result_dict` to an 8-bit image.
+
+    The color channels are processed in linear light; an alpha channel, if present, is kept unchanged.
+
+    args:
+        image: The 8-bit BGR or BGRA image.
+        result_dict: The filter parameters, as returned by sample_filter_params.
+        filters: What filters to apply; the defaults in result_dict for the other filters are ignored.
+
+    returns:
+        out: The filtered 8-bit image.
+    '''
+    color = (image[:, :, 0:3].astype(np.float32) / 255.0) ** GAMMA
+
+    if 'Glare' in filters:
+        # mix follows the Blender node: -1 adds no glare, 0 half of it, 1 all of it
+        weight = (result_dict['Glare']['mix'] + 1) / 2
+        color = color + weight*glare(color, result_dict['Glare']['type'], result_dict['Glare']['threshold'])
+
+    size_x = result_dict['Blur']['size_x']
+    size_y = result_dict['Blur']['size_y']
+    if 'Blur' in filters and (size_x or size_y):
+        color = cv2.GaussianBlur(color, (2*size_x+1, 2*size_y+1), 0)
+
+    if 'Exposure' in filters:
+        color = color * 2.0**result_dict['Exposure']
+
+    out = image.copy()
+    out[:, :, 0:3] = np.clip(np.rint(np.clip(color, 0, 1) ** (1/GAMMA) * 255), 0, 255).astype(np.uint8)
+    return out
+
+
+def _augment_image(task):
+    '''Write every variant of one render. Run in a worker process.'''
+    image_path, output_path, seed, index, variants, filters, max_blur = task
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    records = []
+    for k in range(variants):
+        rng = np.random.default_rng([seed, index, k])
+        result_dict = sample_filter_params(rng, filters, max_blur)
+        variant_name = f"{stem}_v{k}"
+        cv2.imwrite(os.path.join(output_path, variant_name + ".png"), apply_filters(image, result_dict, filters))
+        records.append((stem, variant_name, result_dict))
+    return records
+
+
+def augment_renders(input_path, output_path, variants, filters, workers=1, seed=0, max_blur=3):
+    '''Produce augmented variants of every render in a folder.
+
+    Writes `<image>_v<k>.png` for each variant, an `augmentations.csv` file with the parameters of each variant, and, if the input folder has one, a `bounding_box_data.csv` with the bounding box of the source render for each variant (the filters do not move the spacecraft).
+
+    args:
+        input_path: The folder with rendered images (e.g. output/trial_1).
+        output_path: The folder to write the variants to.
+        variants: How many variants to make per render.
+        filters: What Blur / Glare / Exposure filters to apply.
+        workers: The number of worker processes.
+        seed: The base seed; variant k of render n is seeded with (seed, n, k).
+        max_blur: The largest blur size in pixels.
+    '''
+    os.makedirs(output_path, exist_ok=True)
+    image_names = sorted(f for f in os.listdir(input_path) if f.endswith(".png"))
+    tasks = [(os.path.join(input_path, name), output_path, seed, n, variants, filters, max_blur)
+             for n, name in enumerate(image_names)]
+
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_augment_image, tasks)
+    else:
+        results = [_augment_image(task) for task in tasks]
+
+    with open(os.path.join(output_path, 'augmentations.csv'), 'w', newline='') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(['image', 'source', 'augmentations'])
+        for records in results:
+            for stem, variant_name, result_dict in records:
+                csvwriter.writerow([variant_name, stem, json.dumps(result_dict)])
+
+    # the renders are written as image_0<i>.png for row i of the bounding box csv
+    bbox_path = os.path.join(input_path, 'bounding_box_data.csv')
+    if os.path.isfile(bbox_path):
+        with open(bbox_path, 'r', newline='') as csvfile:
+            rows = list(csv.reader(csvfile))
+        boxes = {"image_0" + row[0]: row[1:] for row in rows[1:]}
+        with open(os.path.join(output_path, 'bounding_box_data.csv'), 'w', newline='') as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(rows[0])
+            for records in results:
+                for stem, variant_name, _ in records:
+                    if stem in boxes:
+                        csvwriter.writerow([variant_name] + boxes[stem])
+
+    print(f"Wrote {sum(len(r) for r in results)} variants of {len(tasks)} renders to {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply randomized glare, blur and exposure to rendered images.")
+    parser.add_argument("input_path", type=str, help="Folder with rendered images (e.g. output/trial_1).")
+    parser.add_argument("output_path", type=str, help="Folder to write the augmented variants to.")
+    parser.add_argument("--variants", type=int, default=4, help="Number of variants per render.")
+    parser.add_argument("--filters", type=str, nargs="+", default=['Glare', 'Blur', 'Exposure'],
+                        choices=['Glare', 'Blur', 'Exposure'], help="Filters to apply.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("--seed", type=int, default=0, help="Base seed for the filter parameters.")
+    parser.add_argument("--max_blur", type=int, default=3, help="Largest blur size in pixels.")
+    args = parser.parse_args()
+
+    augment_renders(args.input_path, args.output_path, args.variants, args.filters, args.workers, args.seed, args.max_blur)
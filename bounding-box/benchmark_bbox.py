@@ -0,0 +1,164 @@
+"""
+    times the vectorized bounding box against the previous per-vertex version on the bundled spacecraft models.
+    run with: blender -b no_spacecraft.blend --python benchmark_bbox.py -- [--spacecraft ACRIMSAT ...]
+"""
+
+import bpy
+import bpy_extras
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from mathutils import Euler
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from mesh_geometry import MeshBuffer, bounding_box, load_hull
+
+RES_X = 1280
+RES_Y = 1024
+
+
+def line_from_points(x1,y1, x2,y2):
+    '''Generate a line from two points, as render.py did for the per-vertex version.
+
+    returns:
+        m: The slope of the line.
+        b: The y-intercept of the line.
+    '''
+    if(x2-x1 == 0):
+        return -100000000, -10000000
+    m = (y2-y1) /(x2-x1)
+    b = y1-m*x1
+    return m,b
+
+
+def bounding_box_per_vertex(obj, cam, scene, res_x, res_y):
+    '''The bounding box as render.py computed it before, one `matrix_world @ co` and `world_to_camera_view` call per vertex and one `line_from_points` clip per edge.
+
+    args:
+        obj: The mesh object we want the bounding box around.
+        cam: The camera object which is taking the image.
+        scene: The scene whose render settings define the camera frame.
+        res_x: The width of the image.
+        res_y: The height of the image.
+
+    returns:
+        box: (X_min, Y_min, X_max, Y_max) in pixels.
+    '''
+    in_image = []
+    for edge in obj.data.edges:
+        verts = [obj.matrix_world @ obj.data.vertices[v].co for v in edge.vertices]
+        coords_2d = [bpy_extras.object_utils.world_to_camera_view(scene, cam, coord) for coord in verts]
+        one_true = False
+        one_false = False
+        points = []
+        for x, y, d in coords_2d:
+            my_x = res_x*x
+            my_y = res_y-res_y*y
+            points.append(tuple((my_x, my_y)))
+            if my_x<=res_x and my_x>=0 and my_y <=res_y and my_y >=0:
+                one_true = True
+            else:
+                one_false = True
+        if one_false and one_true:
+            m, b = line_from_points(points[0][0], points[0][1], points[1][0], points[1][1])
+            if b<min(res_y, max(points[0][1], points[1][1])) and b>max(0, min(points[0][1], points[1][1])) :
+                in_image.append(tuple((0,b)))
+            elif -b/m<min(res_x, max(points[0][0], points[1][0])) and -b/m>max(0, min(points[1][0], points[1][0])):
+                in_image.append(tuple((-b/m,0)))
+            elif m*res_x+b<min(res_y, max(points[0][1], points[1][1])) and m*res_x+b>max(0, min(points[0][1], points[1][1])):
+                in_image.append(tuple((res_x,m*res_x+b)))
+            elif (res_y-b)/m<min(res_x, max(points[0][0], points[1][0])) and (res_y-b)/m>max(0, min(points[0][0], points[1][0])):
+                in_image.append(tuple(((res_y-b)/m,res_y)))
+
+    verts = [obj.matrix_world @ vert.co for vert in obj.data.vertices]
+    coords_2d = [bpy_extras.object_utils.world_to_camera_view(scene, cam, coord) for coord in verts]
+    for x, y, d in coords_2d:
+        my_x = int(res_x*x)
+        my_y = int(res_y-res_y*y)
+        if my_x<=res_x and my_x>=0 and my_y <=res_y and my_y >=0:
+            in_image.append(tuple((res_x*x,res_y-res_y*y)))
+
+    return (
+        int(min(in_image, key = lambda i : i[0])[0]),
+        int(min(in_image, key = lambda i : i[1])[1]),
+        int(max(in_image, key = lambda i : i[0])[0]),
+        int(max(in_image, key = lambda i : i[1])[1])
+    )
+
+
+def best_time(function, repeats):
+    '''Run a function several times.
+
+    returns:
+        seconds: The fastest run time.
+        result: The result of the last run.
+    '''
+    best = float("inf")
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start_time)
+    return best, result
+
+
+def benchmark(spacecraft_dir, names, repeats):
+    '''Import each spacecraft, frame it with the render camera and time both bounding box versions.
+
+    args:
+        spacecraft_dir: The path to the spacecraft fbx file folder.
+        names: The spacecraft names (keys of names.json) to benchmark, or None for all of them.
+        repeats: How often each version is timed; the fastest run counts.
+    '''
+    with open(os.path.join(spacecraft_dir, "names.json"), "r") as json_file:
+        spacecraft_vector = json.load(json_file)
+
+    scene = bpy.context.scene
+    scene.render.resolution_x = RES_X
+    scene.render.resolution_y = RES_Y
+    cam = bpy.data.objects["Camera_Real"]
+    cam.data.angle = 14*3.1415/180
+
+    print(f"{'spacecraft':<16}{'vertices':>10}{'edges':>10}{'hull':>8}{'per-vertex s':>14}{'numpy s':>10}{'hull s':>10}{'speedup':>9}  same box")
+    for sc in names or sorted(spacecraft_vector):
+        entry = spacecraft_vector[sc]
+        objects_before = set(bpy.data.objects.keys())
+        fbx_path = os.path.join(spacecraft_dir, entry["file"])
+        bpy.ops.import_scene.fbx(filepath=fbx_path, directory=spacecraft_dir)
+        obj = bpy.data.objects.get(entry["name"])
+        if obj is None:
+            print(f"{sc:<16}skipped: no object named {entry['name']}")
+        else:
+            # look at the spacecraft from its maximum standoff distance
+            obj.location = (0, 0, 0)
+            cam.location = (0, -entry["maxStand"], 0)
+            cam.rotation_euler = Euler((math.pi / 2, 0, 0))
+            bpy.context.view_layer.update()
+
+            mesh = MeshBuffer(obj)
+            hull = load_hull(fbx_path, mesh)
+            new_time, new_box = best_time(lambda: bounding_box(mesh, cam, scene, RES_X, RES_Y), repeats)
+            hull_time, hull_box = best_time(lambda: bounding_box(mesh, cam, scene, RES_X, RES_Y, hull), repeats)
+            if obj.type == 'MESH' and len(mesh.meshes) == 1:
+                old_time, old_box = best_time(lambda: bounding_box_per_vertex(obj, cam, scene, RES_X, RES_Y), repeats)
+                old_columns = f"{old_time:>14.4f}{new_time:>10.4f}{hull_time:>10.4f}{old_time / hull_time:>8.1f}x  {old_box == new_box == hull_box}"
+            else:
+                # the per-vertex version only handled a single mesh
+                old_columns = f"{'-':>14}{new_time:>10.4f}{hull_time:>10.4f}{'-':>9}  {new_box == hull_box}"
+            print(f"{sc:<16}{len(mesh):>10}{len(mesh.edges):>10}{len(hull):>8}{old_columns} {hull_box}")
+
+        for obj_name in set(bpy.data.objects.keys()) - objects_before:
+            bpy.data.objects.remove(bpy.data.objects[obj_name], do_unlink=True)
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="Time the vectorized bounding box on the bundled spacecraft models.")
+    parser.add_argument("--spacecraft_dir", type=str, default="../data/loadable_spacecraft/", help="Folder with the fbx files and names.json.")
+    parser.add_argument("--spacecraft", type=str, nargs="+", default=None, help="Spacecraft names from names.json (all by default).")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per version; the fastest counts.")
+    args = parser.parse_args(argv)
+
+    benchmark(args.spacecraft_dir, args.spacecraft, args.repeats)
@@ -0,0 +1,462 @@
+"""
+    vectorized mesh projection helpers shared by the render scripts.
+"""
+
+import hashlib
+import os
+import numpy as np
+
+# suffix of the convex hull cache written next to each fbx file
+HULL_CACHE_SUFFIX = ".hull.npz"
+
+
+def mesh_local_coords(obj):
+    '''Get the local coordinates of all vertices of a mesh object with a single `foreach_get` call.
+
+    args:
+        obj: The mesh object.
+
+    returns:
+        coords: (N, 3) array of the vertex coordinates.
+    '''
+    vertices = obj.data.vertices
+    co = np.empty(len(vertices) * 3, dtype=np.float32)
+    vertices.foreach_get("co", co)
+    return co.reshape(-1, 3).astype(np.float64)
+
+
+def mesh_edges(obj):
+    '''Get the vertex indices of all edges of a mesh object with a single `foreach_get` call.
+
+    args:
+        obj: The mesh object.
+
+    returns:
+        edges: (E, 2) array of vertex indices.
+    '''
+    edges = obj.data.edges
+    indices = np.empty(len(edges) * 2, dtype=np.int32)
+    edges.foreach_get("vertices", indices)
+    return indices.reshape(-1, 2)
+
+
+def mesh_triangles(obj):
+    '''Get the vertex indices of the triangulated faces of a mesh object with a single `foreach_get` call.
+
+    args:
+        obj: The mesh object.
+
+    returns:
+        triangles: (T, 3) array of vertex indices.
+    '''
+    obj.data.calc_loop_triangles()
+    triangles = obj.data.loop_triangles
+    indices = np.empty(len(triangles) * 3, dtype=np.int32)
+    triangles.foreach_get("vertices", indices)
+    return indices.reshape(-1, 3)
+
+
+def hierarchy_meshes(root):
+    '''Get the root object and every mesh object below it, e.g. the parts of a spacecraft imported under an `_root` empty.
+
+    args:
+        root: The imported spacecraft object.
+
+    returns:
+        meshes: List of the mesh objects, the root first if it is a mesh.
+    '''
+    meshes = [root] if root.type == 'MESH' else []
+    for child in root.children:
+        meshes.extend(hierarchy_meshes(child))
+    return meshes
+
+
+class MeshBuffer:
+    '''All meshes of a spacecraft hierarchy merged into one vertex buffer.
+
+    The vertices of every mesh below the root are read once, moved into the root's local coordinates and stored one mesh after the other, with the edges and triangles renumbered to match. As the spacecraft is rigid, each frame then needs a single transform by the root's world matrix for the whole spacecraft. The bounding box, the raycasts and the point clouds all use this buffer. The scene must be up to date (`bpy.context.view_layer.update()`) when it is built.
+
+    args:
+        root: The imported spacecraft object, a mesh or an empty with meshes below it.
+    '''
+
+    def __init__(self, root):
+        self.root = root
+        self.meshes = hierarchy_meshes(root)
+        if not self.meshes:
+            raise ValueError(f"{root.name} has no meshes")
+        to_root = np.linalg.inv(np.array(root.matrix_world, dtype=np.float64))
+        coords, edges, triangles, offsets = [], [], [], [0]
+        for obj in self.meshes:
+            matrix = to_root @ np.array(obj.matrix_world, dtype=np.float64)
+            coords.append(mesh_local_coords(obj) @ matrix[:3, :3].T + matrix[:3, 3])
+            edges.append(mesh_edges(obj) + offsets[-1])
+            triangles.append(mesh_triangles(obj) + offsets[-1])
+            offsets.append(offsets[-1] + len(coords[-1]))
+        self.coords = np.concatenate(coords)
+        self.edges = np.concatenate(edges)
+        self.triangles = np.concatenate(triangles)
+        # vertex range of each mesh in the buffer
+        self.offsets = np.array(offsets)
+        self._bvh = None
+
+    @property
+    def name(self):
+        return self.root.name
+
+    def __len__(self):
+        return len(self.coords)
+
+    def matrix(self):
+        '''The current world matrix of the root as a (4, 4) array.'''
+        return np.array(self.root.matrix_world, dtype=np.float64)
+
+    def world_coords(self, coords=None):
+        '''Transform points in the root's local coordinates to world space, by default all the vertices.
+
+        args:
+            coords: Optional (N, 3) array of points in the root's local coordinates.
+
+        returns:
+            coords: (N, 3) array of world space points.
+        '''
+        matrix = self.matrix()
+        return (self.coords if coords is None else coords) @ matrix[:3, :3].T + matrix[:3, 3]
+
+    def world_vertex(self, index):
+        '''Get the world space position of a single vertex of the buffer.
+
+        args:
+            index: The vertex index.
+
+        returns:
+            vertex: (x, y, z) tuple.
+        '''
+        return tuple(self.world_coords(self.coords[index:index + 1])[0])
+
+    def ray_cast(self, origin, direction, distance=1.0e30):
+        '''Cast a ray against all meshes of the spacecraft.
+
+        The triangles of the buffer are put in a BVH tree (in the root's local coordinates) on the first call; each cast only moves the ray into those coordinates.
+
+        args:
+            origin: World space start of the ray.
+            direction: World space direction of the ray.
+            distance: The maximum distance along the ray, in world units.
+
+        returns:
+            hit: The world space (x, y, z) of the closest hit, or None if the ray misses.
+        '''
+        from mathutils import Vector
+        from mathutils.bvhtree import BVHTree
+
+        if self._bvh is None:
+            self._bvh = BVHTree.FromPolygons(self.coords.tolist(), self.triangles.tolist())
+        matrix = self.matrix()
+        to_root = np.linalg.inv(matrix)
+        local_origin = to_root[:3, :3] @ np.asarray(origin, dtype=np.float64) + to_root[:3, 3]
+        local_direction = to_root[:3, :3] @ np.asarray(direction, dtype=np.float64)
+        # the distance is measured in world units, the tree in local ones
+        scale = np.linalg.norm(local_direction) / max(np.linalg.norm(direction), 1e-30)
+        location, _, _, _ = self._bvh.ray_cast(Vector(local_origin), Vector(local_direction), distance * scale)
+        if location is None:
+            return None
+        return tuple(matrix[:3, :3] @ np.array(location) + matrix[:3, 3])
+
+
+def fbx_fingerprint(fbx_path):
+    '''Get the size, modification time and content hash of an fbx file.
+
+    args:
+        fbx_path: The path to the fbx file.
+
+    returns:
+        fingerprint: (size, mtime_ns, sha1 hex digest).
+    '''
+    stat = os.stat(fbx_path)
+    digest = hashlib.sha1()
+    with open(fbx_path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            digest.update(block)
+    return stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+
+def convex_hull_coords(coords):
+    '''Compute the convex hull vertices of a point set with `bmesh.ops.convex_hull`.
+
+    args:
+        coords: (N, 3) array of points, e.g. the vertices of a MeshBuffer.
+
+    returns:
+        hull: (H, 3) array of the hull vertices. All points if they are too flat for a hull.
+    '''
+    import bmesh
+
+    bm = bmesh.new()
+    try:
+        for co in coords:
+            bm.verts.new(co)
+        result = bmesh.ops.convex_hull(bm, input=bm.verts)
+        hull = [tuple(v.co) for v in result["geom"] if isinstance(v, bmesh.types.BMVert)]
+    finally:
+        bm.free()
+    if len(hull) < 4:
+        return np.asarray(coords, dtype=np.float32)
+    return np.array(hull, dtype=np.float32)
+
+
+def load_hull(fbx_path, mesh):
+    '''Get the convex hull of a spacecraft, from the cache next to its fbx file if it is still valid.
+
+    The cache `<fbx>.hull.npz` records the object name and the size, modification time and hash of the fbx file. It is used if the name matches and the file is unchanged (only re-hashed when its size or time changed), and rebuilt otherwise.
+
+    args:
+        fbx_path: The path to the fbx file the spacecraft was imported from.
+        mesh: The MeshBuffer of the imported spacecraft.
+
+    returns:
+        hull: (H, 3) array of the hull vertices in the root's local coordinates.
+    '''
+    cache_path = fbx_path + HULL_CACHE_SUFFIX
+    stat = os.stat(fbx_path)
+    cached = None
+    if os.path.isfile(cache_path):
+        with np.load(cache_path, allow_pickle=False) as cache:
+            if str(cache["name"]) == mesh.name and int(cache["vertex_count"]) == len(mesh):
+                if int(cache["size"]) == stat.st_size and int(cache["mtime_ns"]) == stat.st_mtime_ns:
+                    return cache["hull"]
+                cached = (str(cache["sha1"]), cache["hull"])
+
+    size, mtime_ns, sha1 = fbx_fingerprint(fbx_path)
+    if cached is not None and cached[0] == sha1:
+        # the file was only touched; the cache is rewritten with its new time
+        hull = cached[1]
+    else:
+        hull = convex_hull_coords(mesh.coords)
+    try:
+        np.savez(cache_path, hull=hull, name=mesh.name, vertex_count=len(mesh),
+                 size=size, mtime_ns=mtime_ns, sha1=sha1)
+    except OSError:
+        # e.g. a read-only data folder; the hull is just recomputed next time
+        pass
+    return hull
+
+
+def camera_view_coords(scene, cam, coords):
+    '''Project world space points into the camera view, like `bpy_extras.object_utils.world_to_camera_view` but for all points at once.
+
+    args:
+        scene: The scene whose render settings define the camera frame.
+        cam: The camera object.
+        coords: (N, 3) array of world space points.
+
+    returns:
+        view: (N, 3) array of (x, y, depth), with x and y from 0 to 1 across the camera frame (bottom left origin) and depth the distance in front of the camera.
+    '''
+    to_camera = np.array(cam.matrix_world.normalized().inverted(), dtype=np.float64)
+    local = coords @ to_camera[:3, :3].T + to_camera[:3, 3]
+    depth = -local[:, 2]
+
+    # top right, bottom right and bottom left corners of the frame
+    frame = np.array([tuple(v) for v in cam.data.view_frame(scene=scene)[:3]], dtype=np.float64)
+    if cam.data.type != 'ORTHO':
+        # the frame corners are scaled to the depth of each point
+        behind = depth == 0
+        scale = -np.where(behind, 1, depth)[:, None] / frame[:, 2]
+        frame_x = frame[:, 0] * scale
+        frame_y = frame[:, 1] * scale
+    else:
+        behind = np.zeros(len(depth), dtype=bool)
+        frame_x = np.broadcast_to(frame[:, 0], (len(depth), 3))
+        frame_y = np.broadcast_to(frame[:, 1], (len(depth), 3))
+
+    min_x, max_x = frame_x[:, 2], frame_x[:, 1]
+    min_y, max_y = frame_y[:, 1], frame_y[:, 0]
+    view = np.empty((len(depth), 3))
+    view[:, 0] = (local[:, 0] - min_x) / (max_x - min_x)
+    view[:, 1] = (local[:, 1] - min_y) / (max_y - min_y)
+    view[:, 2] = depth
+    # points in the camera plane are mapped to the frame center
+    view[behind] = (0.5, 0.5, 0.0)
+    return view
+
+
+def clip_edges(pixels, edges, res_x, res_y):
+    '''Clip the edges that leave the image to its border, all at once.
+
+    Every edge with an end outside the image is clipped to the image rectangle as a segment (Liang-Barsky), so vertical and horizontal edges and edges that cross the whole image are handled exactly.
+
+    args:
+        pixels: (N, 2) array of the projected vertices in pixels (top left origin).
+        edges: (E, 2) array of vertex indices.
+        res_x: The width of the image.
+        res_y: The height of the image.
+
+    returns:
+        in_image: (K, 2) array of the points where the clipped edges meet the image border, in pixels.
+    '''
+    inside = (pixels[:, 0] <= res_x) & (pixels[:, 0] >= 0) & (pixels[:, 1] <= res_y) & (pixels[:, 1] >= 0)
+    # edges with both ends inside add nothing the vertices do not
+    edges = edges[~(inside[edges[:, 0]] & inside[edges[:, 1]])]
+    start = pixels[edges[:, 0]]
+    delta = pixels[edges[:, 1]] - start
+
+    # the segment start + t * delta is inside where p * t <= q for each of the four borders
+    p = np.column_stack([-delta[:, 0], delta[:, 0], -delta[:, 1], delta[:, 1]])
+    q = np.column_stack([start[:, 0], res_x - start[:, 0], start[:, 1], res_y - start[:, 1]])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = q / p
+    t_enter = np.max(np.where(p < 0, t, 0), axis=1, initial=0)
+    t_exit = np.min(np.where(p > 0, t, 1), axis=1, initial=1)
+    # edges parallel to a border and outside of it never enter the image
+    visible = (t_enter <= t_exit) & ~np.any((p == 0) & (q < 0), axis=1)
+
+    start, delta = start[visible], delta[visible]
+    t_enter, t_exit = t_enter[visible], t_exit[visible]
+    points = np.concatenate([start + t_enter[:, None] * delta, start + t_exit[:, None] * delta])
+    # keep the clipped ends that lie on the border, the others are vertices inside the image
+    on_border = np.concatenate([t_enter > 0, t_exit < 1])
+    return np.clip(points[on_border], 0, (res_x, res_y))
+
+
+class FrameGeometry:
+    '''The spacecraft as the camera sees it in one frame.
+
+    Built once the final pose of the frame is set; the lighting setup and every label written for the frame read from it, so nothing is projected twice. The bounding box is computed right away (from the hull alone where possible); the projection of all vertices is only made when the hull alone is not enough, and then kept.
+
+    Besides the box, the frame knows how much of the spacecraft the image cuts off (`truncation`), which lets the render scripts reject poor frames before paying for a render (see `cull_reason`).
+
+    args:
+        mesh: The MeshBuffer of the spacecraft.
+        cam: The camera object which is taking the image.
+        scene: The scene whose render settings define the camera frame.
+        res_x: The width of the image.
+        res_y: The height of the image.
+        hull: Optional (H, 3) array of the convex hull vertices in the root's local coordinates (see `load_hull`).
+    '''
+
+    def __init__(self, mesh, cam, scene, res_x, res_y, hull=None):
+        self.mesh = mesh
+        self.cam = cam
+        self.scene = scene
+        self.res_x = res_x
+        self.res_y = res_y
+        self._world = None
+        self._view = None
+        self.box, self.truncation = self._bounding_box(hull)
+
+    @property
+    def world(self):
+        '''(N, 3) array of the world space vertices of the spacecraft in this frame.'''
+        if self._world is None:
+            self._world = self.mesh.world_coords()
+        return self._world
+
+    @property
+    def view(self):
+        '''(N, 3) array of the vertices in the camera view (see `camera_view_coords`).'''
+        if self._view is None:
+            self._view = camera_view_coords(self.scene, self.cam, self.world)
+        return self._view
+
+    @property
+    def pixels(self):
+        '''(N, 2) array of the projected vertices in pixels (top left origin).'''
+        return np.column_stack([self.res_x*self.view[:, 0], self.res_y-self.res_y*self.view[:, 1]])
+
+    @property
+    def center(self):
+        '''(x, y) center of the bounding box in pixels.'''
+        X_min, Y_min, X_max, Y_max = self.box
+        return np.array([X_min+(X_max-X_min)/2, Y_min+(Y_max-Y_min)/2])
+
+    @property
+    def area(self):
+        '''Area of the bounding box in pixels, 0 if the spacecraft is out of frame.'''
+        if self.box is None:
+            return 0
+        X_min, Y_min, X_max, Y_max = self.box
+        return (X_max-X_min)*(Y_max-Y_min)
+
+    def cull_reason(self, min_area=0.0, max_truncation=1.0):
+        '''Check whether the frame is worth rendering.
+
+        args:
+            min_area: The smallest bounding box area to accept, as a fraction of the image area.
+            max_truncation: The largest fraction of the spacecraft's projected box the image may cut off.
+
+        returns:
+            reason: None if the frame passes, otherwise why it does not ("out of frame", "too small" or "truncated").
+        '''
+        if self.box is None:
+            return "out of frame"
+        if self.area < min_area*self.res_x*self.res_y:
+            return "too small"
+        if self.truncation > max_truncation:
+            return "truncated"
+        return None
+
+    def _bounding_box(self, hull):
+        res_x, res_y = self.res_x, self.res_y
+        if hull is not None:
+            view = camera_view_coords(self.scene, self.cam, self.mesh.world_coords(hull))
+            pixels = np.column_stack([res_x*view[:, 0], res_y-res_y*view[:, 1]])
+            if np.all(view[:, 2] > 0) and np.all((pixels >= 0) & (pixels <= (res_x, res_y))):
+                X_min, Y_min = pixels.min(axis=0).astype(int)
+                X_max, Y_max = pixels.max(axis=0).astype(int)
+                return (int(X_min), int(Y_min), int(X_max), int(Y_max)), 0.0
+            # the hull spans the same box as the full mesh, so it gives the unclipped extent
+            extent_view, extent_pixels = view, pixels
+        else:
+            extent_view, extent_pixels = self.view, self.pixels
+
+        pixels = self.pixels
+        in_image = clip_edges(pixels, self.mesh.edges, res_x, res_y)
+
+        # vertices are tested at whole pixels (truncated towards zero), but kept at subpixel precision
+        whole = np.trunc(pixels)
+        inside = (whole[:, 0] <= res_x) & (whole[:, 0] >= 0) & (whole[:, 1] <= res_y) & (whole[:, 1] >= 0)
+        points = np.concatenate([in_image, pixels[inside]])
+        if len(points) == 0:
+            return None, 1.0
+
+        X_min, Y_min = points.min(axis=0).astype(int)
+        X_max, Y_max = points.max(axis=0).astype(int)
+        box = (
+            int(X_min),
+            int(Y_min),
+            int(X_max),
+            int(Y_max)
+        )
+
+        # share of the unclipped box outside the image; vertices behind the camera have no meaningful projection
+        if np.any(extent_view[:, 2] <= 0):
+            return box, 1.0
+        extent = np.prod(extent_pixels.max(axis=0) - extent_pixels.min(axis=0))
+        clipped = np.prod(points.max(axis=0) - points.min(axis=0))
+        return box, float(np.clip(1 - clipped/extent, 0, 1)) if extent > 0 else 0.0
+
+
+def bounding_box(mesh, cam, scene, res_x, res_y, hull=None):
+    '''Get the pixel bounding box of a spacecraft in the camera image.
+
+    All vertices of the spacecraft's MeshBuffer are transformed and projected at once (see `MeshBuffer.world_coords` and `camera_view_coords`). The box covers the projected vertices inside the image and the points where the edges that leave the image are clipped to its border.
+
+    With a convex hull (see `load_hull`), only the hull vertices are projected first. If they are all in front of the camera and inside the image, so is the whole spacecraft, and their box is its box. Otherwise all vertices are projected and the edges clipped.
+
+    args:
+        mesh: The MeshBuffer of the spacecraft we want the bounding box around.
+        cam: The camera object which is taking the image.
+        scene: The scene whose render settings define the camera frame.
+        res_x: The width of the image.
+        res_y: The height of the image.
+        hull: Optional (H, 3) array of the convex hull vertices in the root's local coordinates (see `load_hull`).
+
+    returns:
+        X_min: The minimum x coordinate pixel for the bounding box.
+        Y_min: The minimum y coordinate pixel for the bounding box.
+        X_max: The maximum x coordinate pixel for the bounding box.
+        Y_max: The maximum y coordinate pixel for the bounding box.
+        (None instead if no part of the spacecraft is in the image.)
+    '''
+    return FrameGeometry(mesh, cam, scene, res_x, res_y, hull).box
@@ -10,6 +10,9 @@ import csv
 import random
 import copy
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from mesh_geometry import MeshBuffer
+
 
 
 
@@ -211,7 +214,7 @@ def filter(number, epsilon):
     if(abs(number)<epsilon):
         return 0
     return number 
-def move_objects(camera, spacecraft, min_standoff, max_standoff, bias):
+def move_objects(camera, spacecraft, spacecraft_mesh, min_standoff, max_standoff, bias):
     '''Move the objects in the scene.
     
     Rotate the spacecraft and move the camera. Make sure that the maximum delta poses are still enforced, and make sure that the center pixel of the camera still hits the spacecraft. This is an assumption we are making for the LRF.
@@ -219,6 +222,7 @@ def move_objects(camera, spacecraft, min_standoff, max_standoff, bias):
     args:
         camera: The camera object.
         spacecraft: The spacecraft object.
+        spacecraft_mesh: The MeshBuffer with all meshes of the spacecraft, used to pick the target and for the raycast.
         min_standoff: How close the camera is allowed to get to the spacecraft.
         max_standoff: How far the camera is allowed to get from the spacecraft.
         bias: The rotation bias for the spacecraft, so that we are actually rotating in a certian direction.
@@ -244,7 +248,7 @@ def move_objects(camera, spacecraft, min_standoff, max_standoff, bias):
     raycast_failed = True
     while (raycast_failed):
         bpy.context.view_layer.update()
-        target = spacecraft.matrix_world @ random.choice(spacecraft.data.vertices).co
+        target = Vector(spacecraft_mesh.world_vertex(random.randrange(len(spacecraft_mesh))))
         # #move the camera to the targets y/z location, and randomly select some x walk, making sure that we aren't too close / too far
         x = camera.location.x
         x = x+random.uniform(-1.0,1.0)
@@ -257,7 +261,7 @@ def move_objects(camera, spacecraft, min_standoff, max_standoff, bias):
         for obj in bpy.context.scene.objects:
             obj.hide_render = obj.hide_render
         #find out the closest point between the camera and the target.
-        #raycasting is done in local reference frame...
+        #raycasting is done against all meshes of the spacecraft at once...
         #TODO: make sure we aren't ray casting through the center of the spacecraft, but through the taget point..
         print(target)
         cam_pos = camera.location
@@ -265,10 +269,10 @@ def move_objects(camera, spacecraft, min_standoff, max_standoff, bias):
         ray_direction = (vertex-cam_pos).normalized()
         ray_length = max_standoff*5
         ray_direction *= ray_length
-        scan = spacecraft.ray_cast(spacecraft.matrix_world.inverted() @ cam_pos, spacecraft.matrix_world.inverted() @ ray_direction)
+        scan = spacecraft_mesh.ray_cast(cam_pos, ray_direction)
         print(scan)
-        if(scan[0]):
-            intersection_point = spacecraft.matrix_world @ scan[1]
+        if(scan is not None):
+            intersection_point = Vector(scan)
             raycast_failed = False
             print("Ray Cast successful!")
         else:
@@ -283,14 +287,17 @@ def main():
     leftover -= r2*r2
     r3 = random.choice([-1,1])*np.sqrt(leftover)
     spacecraft_vector, spacecraft, camera, rot_bias = initialize(light_loc=((r1,r2,r3)))
+    #gather all meshes of the spacecraft into one vertex buffer
+    bpy.context.view_layer.update()
+    spacecraft_mesh = MeshBuffer(spacecraft)
     #get the spacecraft id
     sc_id = spacecraft_vector[spacecraft_name]["label"]
     #get the min & max standoff distances...
     min_s = spacecraft_vector[spacecraft_name]["minStand"]
     max_s = spacecraft_vector[spacecraft_name]["maxStand"]
     #get a random point on the spacecraft to look at, and set the camera to be looking at that point.
-    rpi = random.choice(range(0,len(spacecraft.data.vertices)))
-    ref_point = copy.deepcopy(spacecraft.matrix_world @ spacecraft.data.vertices[rpi].co)
+    rpi = random.choice(range(0,len(spacecraft_mesh)))
+    ref_point = Vector(spacecraft_mesh.world_vertex(rpi))
     print("REFERENCE POINT: ", rpi)
     #record the reference point
     #orient the camera to be looking along the x-axis
@@ -305,7 +312,7 @@ def main():
     for i in range(0,NUMBER_OF_IMAGES-1):
         render(output_path, i)
         update_data(i,sc_id, spacecraft, ref_point, orig_rot, rpi, ip, camera, orig_cam_loc)
-        ip = move_objects(camera, spacecraft, min_s, max_s, rot_bias)
+        ip = move_objects(camera, spacecraft, spacecraft_mesh, min_s, max_s, rot_bias)
     
     render(output_path, NUMBER_OF_IMAGES-1)
     update_data(NUMBER_OF_IMAGES-1, sc_id, spacecraft, ref_point, orig_rot, rpi, ip,camera, orig_cam_loc)
@@ -0,0 +1,145 @@
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import cv2
+
+# Reduced-resolution decode modes, largest reduction first
+REDUCED_MODES = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+def image_size(path):
+    """
+    Read the (width, height) of a PNG or JPEG file from its header without decoding it.
+
+    Args:
+        path (str): Path to the image.
+
+    Returns:
+        tuple: (width, height), or None if the format is not recognised.
+    """
+    with open(path, "rb") as f:
+        head = f.read(24)
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and len(head) >= 24:
+            width, height = struct.unpack(">II", head[16:24])
+            return width, height
+        if not head.startswith(b"\xff\xd8"):
+            return None
+
+        # Walk the JPEG markers until a start-of-frame segment
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            code = marker[1]
+            if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+                continue
+            length_bytes = f.read(2)
+            if len(length_bytes) < 2:
+                return None
+            length = struct.unpack(">H", length_bytes)[0]
+            if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">xHH", f.read(5))
+                return width, height
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+class AssetCache:
+    """
+    LRU cache of decoded images keyed by (path, target size), bounded by memory use.
+
+    Cached arrays are shared between callers and are marked read-only. The cache can be used from
+    several threads; images are decoded outside the lock.
+
+    Args:
+        max_bytes (int): Memory limit for the cached pixel data.
+        reduced_decode (bool): Decode resized images at 1/2, 1/4 or 1/8 resolution when the
+            source is at least that much larger than the target size.
+    """
+
+    def __init__(self, max_bytes=1024 * 1024 * 1024, reduced_decode=True):
+        self.max_bytes = max_bytes
+        self.reduced_decode = reduced_decode
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, size=None):
+        """
+        Return the decoded image at path, resized to size if given.
+
+        Args:
+            path (str): Path to the image.
+            size (tuple, optional): Target (width, height). The image is returned unchanged
+                (all channels, full resolution) if None.
+
+        Returns:
+            np.ndarray: Decoded image.
+        """
+        key = (path, size)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        image = self._decode(path, size)
+        image.flags.writeable = False
+        with self._lock:
+            if image.nbytes <= self.max_bytes and key not in self._entries:
+                self._entries[key] = image
+                self.current_bytes += image.nbytes
+                while self.current_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.current_bytes -= evicted.nbytes
+                    self.evictions += 1
+        return image
+
+    def _decode(self, path, size):
+        if size is None:
+            image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if image is None:
+                raise ValueError(f"Could not decode image {path}")
+            return image
+
+        flags = cv2.IMREAD_UNCHANGED
+        if self.reduced_decode:
+            source_size = image_size(path)
+            if source_size is not None:
+                for factor, mode in REDUCED_MODES:
+                    if source_size[0] >= size[0] * factor and source_size[1] >= size[1] * factor:
+                        flags = mode
+                        break
+        image = cv2.imread(path, flags)
+        if image is None:
+            raise ValueError(f"Could not decode image {path}")
+        if (image.shape[1], image.shape[0]) != size:
+            image = cv2.resize(image, size)
+        return image
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        """
+        Describe the cache usage, for sizing the memory limit.
+
+        Returns:
+            str: Hit rate, lookups, evictions and memory in use.
+        """
+        return (f"Asset cache: {self.hit_rate:.1%} hit rate ({self.hits} hits, {self.misses} misses), "
+                f"{self.evictions} evictions, {self.current_bytes / 2**20:.1f} of "
+                f"{self.max_bytes / 2**20:.1f} MiB in use.")
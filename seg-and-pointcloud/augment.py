@@ -0,0 +1,151 @@
+import cv2
+import numpy as np
+
+from labels import YoloLabel
+from sprites import Sprite, alpha_bounds
+
+# Default ranges for the in-plane sprite augmentation
+SCALE_RANGE = (0.5, 1.5)
+ROTATION_RANGE = (-180.0, 180.0)
+FLIP_PROB = 0.5
+
+
+def random_affine(rng, sprite, scale_range=SCALE_RANGE, rotation_range=ROTATION_RANGE, flip_prob=FLIP_PROB):
+    """
+    Draw a random in-plane scale, flip, rotation and translation for a sprite.
+
+    The transform is taken about the sprite's center, and the translation is drawn so that the
+    transformed sprite stays inside the frame (it is centered if it is larger than the frame).
+
+    Args:
+        rng (np.random.Generator): Random generator.
+        sprite (Sprite): Sprite to transform.
+        scale_range (tuple): Range of the uniform scale factor.
+        rotation_range (tuple): Range of the rotation in degrees.
+        flip_prob (float): Probability of a horizontal flip.
+
+    Returns:
+        np.ndarray: 2x3 affine matrix mapping frame pixel coordinates before the transform to after.
+    """
+    scale = rng.uniform(*scale_range)
+    angle = np.deg2rad(rng.uniform(*rotation_range))
+    flip = -1.0 if rng.random() < flip_prob else 1.0
+
+    cos, sin = np.cos(angle), np.sin(angle)
+    linear = scale * np.array([[cos, -sin], [sin, cos]]) @ np.diag([flip, 1.0])
+
+    # Extent of the transformed sprite corners around its center
+    h, w = sprite.image.shape[:2]
+    center = np.array([sprite.x + (w - 1) / 2, sprite.y + (h - 1) / 2])
+    corners = np.array([[sprite.x, sprite.y], [sprite.x + w - 1, sprite.y],
+                        [sprite.x, sprite.y + h - 1], [sprite.x + w - 1, sprite.y + h - 1]], dtype=np.float64)
+    extent = (corners - center) @ linear.T
+    low = -extent.min(axis=0)
+    high = np.array([sprite.frame_width - 1, sprite.frame_height - 1]) - extent.max(axis=0)
+    new_center = np.where(low <= high, low + rng.random(2) * (high - low),
+                          np.array([sprite.frame_width - 1, sprite.frame_height - 1]) / 2)
+
+    return np.hstack([linear, (new_center - linear @ center)[:, None]])
+
+
+def warp_sprite(sprite, matrix):
+    """
+    Apply an affine transform to a sprite, keeping the result cropped to its alpha bounding box.
+
+    Colours are premultiplied by alpha while resampling, so transparent pixels do not bleed into
+    the edges of the object.
+
+    Args:
+        sprite (Sprite): Sprite to transform.
+        matrix (np.ndarray): 2x3 affine matrix in frame pixel coordinates.
+
+    Returns:
+        Sprite: Transformed sprite in the same frame.
+    """
+    h, w = sprite.image.shape[:2]
+    corners = np.array([[0, 0], [w - 1, 0], [0, h - 1], [w - 1, h - 1]], dtype=np.float64)
+    corners += (sprite.x, sprite.y)
+    moved = corners @ matrix[:, :2].T + matrix[:, 2]
+
+    # Region of the frame the transformed sprite can touch
+    x0 = max(int(np.floor(moved[:, 0].min())), 0)
+    y0 = max(int(np.floor(moved[:, 1].min())), 0)
+    x1 = min(int(np.ceil(moved[:, 0].max())) + 1, sprite.frame_width)
+    y1 = min(int(np.ceil(moved[:, 1].max())) + 1, sprite.frame_height)
+    if x1 <= x0 or y1 <= y0:
+        return Sprite(np.zeros((1, 1, 4), dtype=np.uint8), 0, 0, sprite.frame_width, sprite.frame_height)
+
+    # Map sprite-local pixels to region-local pixels
+    local = matrix.copy()
+    local[:, 2] += matrix[:, :2] @ np.array([sprite.x, sprite.y]) - np.array([x0, y0])
+
+    image = sprite.image.astype(np.float32)
+    image[:, :, 0:3] *= image[:, :, 3:4] / 255.0
+    warped = cv2.warpAffine(image, local, (x1 - x0, y1 - y0), flags=cv2.INTER_LINEAR,
+                            borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    alpha = warped[:, :, 3:4]
+    np.divide(warped[:, :, 0:3] * 255.0, alpha, out=warped[:, :, 0:3], where=alpha > 0)
+    warped = np.clip(np.rint(warped), 0, 255).astype(np.uint8)
+
+    bounds = alpha_bounds(warped[:, :, 3])
+    if bounds is None:
+        return Sprite(np.zeros((1, 1, 4), dtype=np.uint8), 0, 0, sprite.frame_width, sprite.frame_height)
+    by0, by1, bx0, bx1 = bounds
+    return Sprite(warped[by0:by1, bx0:bx1], x0 + int(bx0), y0 + int(by0), sprite.frame_width, sprite.frame_height)
+
+
+def transform_labels(labels, matrix, warped_sprite):
+    """
+    Move YOLO labels along with an affine sprite transform.
+
+    Polygons are transformed point by point and clipped to the frame. With a single label the
+    bounding box is taken from the warped alpha channel, which is pixel exact; with several labels
+    (one per part) each box is the bounding box of its transformed polygon.
+
+    Args:
+        labels (list): YoloLabel entries of the untransformed sprite.
+        matrix (np.ndarray): 2x3 affine matrix in frame pixel coordinates.
+        warped_sprite (Sprite): Result of warp_sprite for the same matrix.
+
+    Returns:
+        list: Transformed YoloLabel entries.
+    """
+    frame = np.array([warped_sprite.frame_width, warped_sprite.frame_height], dtype=np.float64)
+    transformed = []
+    for label in labels:
+        polygon = label.polygon
+        if len(polygon):
+            points = polygon * frame @ matrix[:, :2].T + matrix[:, 2]
+            points = np.clip(points, 0, frame - 1)
+            polygon = points / frame
+
+        if len(labels) == 1 or not len(polygon):
+            h, w = warped_sprite.image.shape[:2]
+            x0, y0, x1, y1 = warped_sprite.x, warped_sprite.y, warped_sprite.x + w, warped_sprite.y + h
+        else:
+            x0, y0 = np.floor(points.min(axis=0))
+            x1, y1 = np.floor(points.max(axis=0)) + 1
+        bbox = np.array([(x0 + x1) / 2 / frame[0], (y0 + y1) / 2 / frame[1],
+                         (x1 - x0) / frame[0], (y1 - y0) / frame[1]])
+        transformed.append(YoloLabel(label.class_id, bbox, polygon))
+    return transformed
+
+
+def augment_sprite(rng, sprite, labels, scale_range=SCALE_RANGE, rotation_range=ROTATION_RANGE, flip_prob=FLIP_PROB):
+    """
+    Randomly scale, flip, rotate and translate a sprite in-plane, together with its labels.
+
+    Args:
+        rng (np.random.Generator): Random generator.
+        sprite (Sprite): Sprite to augment.
+        labels (list): YoloLabel entries of the sprite.
+        scale_range (tuple): Range of the uniform scale factor.
+        rotation_range (tuple): Range of the rotation in degrees.
+        flip_prob (float): Probability of a horizontal flip.
+
+    Returns:
+        tuple: (augmented Sprite, transformed YoloLabel entries)
+    """
+    matrix = random_affine(rng, sprite, scale_range, rotation_range, flip_prob)
+    warped = warp_sprite(sprite, matrix)
+    return warped, transform_labels(labels, matrix, warped)
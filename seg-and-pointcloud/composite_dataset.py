@@ -0,0 +1,117 @@
+import os
+import argparse
+import itertools
+
+from asset_cache import AssetCache
+from augment import FLIP_PROB, ROTATION_RANGE, SCALE_RANGE
+from gen_seg_pipe import augment_item, composite_object, read_sources
+from labels import load_label_manifest, read_yolo_label
+from sprites import load_sprite_index
+
+
+class CompositeDataset:
+    """
+    Composite images generated in memory, with the same selection and overlay logic as gen_seg_pipe.py.
+
+    Sample i is the composite that `gen_seg_pipe.py --seed <seed>` writes as image i + 1, together
+    with its parsed YOLO label, so a trainer can stream composites without writing them to disk.
+    The dataset does not depend on any training framework: it can be indexed and iterated directly,
+    and also works as a map-style dataset (e.g. a torch DataLoader with workers) when `length` is set.
+
+    When iterated, the samples are split between worker processes by index. The worker is taken
+    from `worker_id`/`num_workers` if given, otherwise from torch's worker info if torch is
+    installed and the dataset is iterated inside a DataLoader worker.
+
+    Args:
+        objects_folder (str): Folder of transparent object renders, or a sprite folder.
+        masks_folder (str): Folder of the YOLO label files of the renders (a label manifest is also understood).
+        backgrounds_folder (str): Folder of background images.
+        seed (int): Base seed for selecting objects and backgrounds.
+        length (int, optional): Number of samples. Iteration never ends if None.
+        cache_mb (int): Memory limit of each process's decoded image cache, in MiB.
+        full_decode (bool): Decode backgrounds at full resolution before resizing.
+        augment (bool): Randomly scale, flip, rotate and move each object in-plane, as with
+            `gen_seg_pipe.py --augment`, and transform its labels to match.
+        scale_range (tuple): Range of the augmentation scale factor.
+        rotation_range (tuple): Range of the augmentation rotation in degrees.
+        flip_prob (float): Probability of a horizontal flip when augmenting.
+        worker_id (int, optional): Index of this worker when sharding the iteration by hand.
+        num_workers (int, optional): Number of workers when sharding the iteration by hand.
+
+    Yields:
+        tuple: (image, labels) with the (H, W, 4) BGRA composite and a list of YoloLabel entries.
+    """
+
+    def __init__(self, objects_folder, masks_folder, backgrounds_folder, seed=0, length=None,
+                 cache_mb=1024, full_decode=False, augment=False, scale_range=SCALE_RANGE,
+                 rotation_range=ROTATION_RANGE, flip_prob=FLIP_PROB, worker_id=None, num_workers=None):
+        # Settings in the form read_sources and augment_item expect from the command line
+        self.folders = argparse.Namespace(objects_folder=objects_folder, backgrounds_folder=backgrounds_folder,
+                                          masks_folder=masks_folder, scale_range=scale_range,
+                                          rotation_range=rotation_range, flip_prob=flip_prob)
+        self.augment = augment
+        self.masks_folder = masks_folder
+        self.seed = seed
+        self.length = length
+        self.cache_mb = cache_mb
+        self.full_decode = full_decode
+        self.worker_id = worker_id
+        self.num_workers = num_workers
+
+        self.sprite_index = load_sprite_index(objects_folder)
+        if self.sprite_index is not None:
+            self.object_files = sorted(self.sprite_index)
+        else:
+            self.object_files = sorted(f for f in os.listdir(objects_folder) if f.endswith((".png", ".jpg")))
+        self.background_files = sorted(f for f in os.listdir(backgrounds_folder) if f.endswith((".jpg", ".png")))
+        self.label_manifest = load_label_manifest(masks_folder)
+
+        # Created on first use, so that every worker process decodes into its own cache
+        self._cache = None
+        self._cache_pid = None
+
+    @property
+    def cache(self):
+        if self._cache is None or self._cache_pid != os.getpid():
+            self._cache = AssetCache(self.cache_mb * 2**20, reduced_decode=not self.full_decode)
+            self._cache_pid = os.getpid()
+        return self._cache
+
+    def __len__(self):
+        if self.length is None:
+            raise TypeError("CompositeDataset without a length is unbounded")
+        return self.length
+
+    def __getitem__(self, index):
+        if self.length is not None and not 0 <= index < self.length:
+            raise IndexError(index)
+        item = read_sources(index, self.folders, self.object_files, self.background_files, self.seed,
+                            self.cache, sprite_index=self.sprite_index)
+        if self.augment:
+            augment_item(item, self.folders, self.seed)
+            labels = item["labels"]
+        else:
+            labels = read_yolo_label(self.masks_folder, item["mask_file"], self.label_manifest)
+        image = composite_object(item["object_img"], item["background_img"])
+        return image, labels
+
+    def _worker_info(self):
+        if self.num_workers is not None:
+            return self.worker_id or 0, self.num_workers
+        try:
+            from torch.utils.data import get_worker_info
+        except ImportError:
+            return 0, 1
+        info = get_worker_info()
+        if info is None:
+            return 0, 1
+        return info.id, info.num_workers
+
+    def __iter__(self):
+        worker_id, num_workers = self._worker_info()
+        if self.length is None:
+            indices = itertools.count(worker_id, num_workers)
+        else:
+            indices = range(worker_id, self.length, num_workers)
+        for index in indices:
+            yield self[index]
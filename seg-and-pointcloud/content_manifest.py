@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+
+from labels import replace_text
+
+
+def file_hash(path, block_size=2**20):
+    """
+    Returns:
+        str: SHA-1 hex digest of a file's content.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ContentManifest:
+    """
+    Record of which inputs each output of a folder was made from, for incremental reprocessing.
+
+    Every input is fingerprinted by size, modification time and content hash, and every output
+    by the inputs it was made from and the files it consists of. On the next run an output is
+    current if it was made with the same settings from the same inputs, none of those inputs has
+    changed and its files still exist. Inputs are only re-hashed when their size or modification
+    time changed, so checking an unchanged folder costs one stat per file.
+
+    Args:
+        path (str): Manifest file (JSON). Loaded if it exists.
+        settings (dict): Settings that affect the outputs. If they differ from the ones stored in
+            the manifest, every output is out of date.
+    """
+
+    def __init__(self, path, settings):
+        self.path = path
+        # Normalized the way JSON stores them (e.g. tuples become lists), so they compare equal after loading
+        self.settings = json.loads(json.dumps(settings))
+        self.outputs = {}
+        self.inputs = {}
+        self.hashed = 0
+        self._previous_inputs = {}
+        if os.path.isfile(path):
+            with open(path, "r") as json_file:
+                data = json.load(json_file)
+            if data["settings"] == self.settings:
+                self.outputs = data["outputs"]
+                self._previous_inputs = data["inputs"]
+
+    def fingerprint(self, input_path):
+        """
+        Fingerprint an input, reusing the hash of the previous run if its size and mtime are unchanged.
+
+        Args:
+            input_path (str): Input file.
+
+        Returns:
+            dict: {"size", "mtime_ns", "sha1"}.
+        """
+        if input_path not in self.inputs:
+            stat = os.stat(input_path)
+            previous = self._previous_inputs.get(input_path)
+            if previous is not None and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+                sha1 = previous["sha1"]
+            else:
+                sha1 = file_hash(input_path)
+                self.hashed += 1
+            self.inputs[input_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": sha1}
+        return self.inputs[input_path]
+
+    def is_current(self, key, sources):
+        """
+        Check whether an output is up to date.
+
+        Args:
+            key (str): Name of the output.
+            sources (list): Input paths the output would be made from now.
+
+        Returns:
+            bool
+        """
+        record = self.outputs.get(key)
+        if record is None or record["sources"] != sources:
+            return False
+        for source in sources:
+            previous = self._previous_inputs.get(source)
+            if previous is None or previous["sha1"] != self.fingerprint(source)["sha1"]:
+                return False
+        return all(os.path.exists(f) for f in record["files"])
+
+    def record(self, key, sources, files):
+        """
+        Record an output that was just made.
+
+        Args:
+            key (str): Name of the output.
+            sources (list): Input paths it was made from.
+            files (list): Files it consists of. Files that were not written are left out.
+        """
+        for source in sources:
+            self.fingerprint(source)
+        self.outputs[key] = {"sources": sources, "files": [f for f in files if os.path.exists(f)]}
+
+    def prune(self, keys):
+        """
+        Delete the files of the recorded outputs that are not in `keys` and forget them.
+
+        Args:
+            keys (iterable): Names of the outputs to keep.
+
+        Returns:
+            int: Number of outputs removed.
+        """
+        keep = set(keys)
+        removed = [key for key in self.outputs if key not in keep]
+        for key in removed:
+            for f in self.outputs.pop(key)["files"]:
+                if os.path.exists(f):
+                    os.remove(f)
+        return len(removed)
+
+    def save(self):
+        """
+        Write the manifest, keeping the fingerprints of the inputs of the recorded outputs.
+        """
+        for record in self.outputs.values():
+            for source in record["sources"]:
+                if source not in self.inputs and source in self._previous_inputs:
+                    self.inputs[source] = self._previous_inputs[source]
+        used = {source for record in self.outputs.values() for source in record["sources"]}
+        data = {
+            "settings": self.settings,
+            "inputs": {path: fingerprint for path, fingerprint in sorted(self.inputs.items()) if path in used},
+            "outputs": dict(sorted(self.outputs.items())),
+        }
+        # Written to a temporary file first, so an interrupted run leaves the previous manifest intact
+        replace_text(self.path, json.dumps(data))
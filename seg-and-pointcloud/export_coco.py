@@ -0,0 +1,180 @@
+import os
+import json
+import argparse
+
+import cv2
+import numpy as np
+
+from asset_cache import image_size
+from labels import list_labels, load_label_manifest, read_yolo_label
+from mask_store import MASK_STORE, MaskStore, encode_rle, rle_from_string, rle_to_string
+
+
+class MaskSource:
+    """
+    The masks written by gen_masks.py, either as _mask.png files or as a mask store.
+
+    Args:
+        mask_folder (str): Output mask folder of gen_masks.py.
+    """
+
+    def __init__(self, mask_folder):
+        self.mask_folder = mask_folder
+        store_path = os.path.join(mask_folder, MASK_STORE)
+        self.store = MaskStore(store_path) if os.path.isfile(store_path) else None
+
+    def _png_path(self, stem):
+        return os.path.join(self.mask_folder, f"{stem}_mask.png")
+
+    def size(self, stem):
+        """
+        Returns:
+            tuple: (width, height) of the mask of an image, or None if it has no mask.
+        """
+        if self.store is not None:
+            if stem not in self.store:
+                return None
+            _, _, height, width = self.store.index[stem]
+            return width, height
+        png_path = self._png_path(stem)
+        return image_size(png_path) if os.path.isfile(png_path) else None
+
+    def rle(self, stem):
+        """
+        Returns:
+            tuple: (COCO RLE dict, area in pixels) of the mask of an image.
+        """
+        if self.store is not None:
+            rle = self.store.read_rle(stem)
+            counts = rle_from_string(rle["counts"])
+        else:
+            mask = cv2.imread(self._png_path(stem), cv2.IMREAD_GRAYSCALE)
+            counts = encode_rle(mask)
+            rle = {"size": list(mask.shape), "counts": rle_to_string(counts)}
+        return rle, int(counts[1::2].sum())
+
+
+def polygon_area(points):
+    """
+    Returns:
+        float: Area of a polygon given as (N, 2) points (shoelace formula).
+    """
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _write_array(f, items):
+    """Write the JSON objects of an iterable as a JSON array, one at a time."""
+    f.write("[")
+    for k, item in enumerate(items):
+        if k:
+            f.write(",\n")
+        f.write(json.dumps(item))
+    f.write("]")
+
+
+def write_coco(output_path, images, annotations, class_ids, names=None):
+    """
+    Write a COCO instance segmentation file while its entries are produced.
+
+    Args:
+        output_path (str): COCO JSON file to write.
+        images (iterable): Image entries.
+        annotations (iterable): Annotation entries, consumed after the images.
+        class_ids (iterable): Category IDs, only read once the annotations are written, so it can
+            be a set the annotation generator fills.
+        names (list, optional): Category names indexed by class ID. The ID is used as name if not given.
+    """
+    with open(output_path, "w") as f:
+        f.write('{"images": ')
+        _write_array(f, images)
+        f.write(',\n"annotations": ')
+        _write_array(f, annotations)
+        f.write(',\n"categories": ')
+        categories = [{"id": int(class_id), "name": names[class_id] if names and class_id < len(names) else str(class_id)}
+                      for class_id in sorted(class_ids)]
+        _write_array(f, categories)
+        f.write("}\n")
+
+
+def export_coco(label_folder, mask_folder, output_path, segmentation="polygon", names=None, image_extension=".png"):
+    """
+    Export the YOLO labels and masks written by gen_masks.py as a COCO instance segmentation file.
+
+    The file is written while the labels are read, so the dataset is never held in memory as a
+    whole. Each label line becomes an annotation with its bounding box and polygon converted to
+    pixels. Images with a single label line get the pixel count of their mask as area, and with
+    segmentation "rle" the mask itself (RLE encoded) as segmentation; the polygon area is used
+    otherwise.
+
+    Args:
+        label_folder (str): Folder with the YOLO label files (a label manifest is also understood).
+        mask_folder (str): Folder with the _mask.png files or the masks.rle mask store.
+        output_path (str): COCO JSON file to write.
+        segmentation (str): "polygon" or "rle".
+        names (list, optional): Category names indexed by class ID. The ID is used as name if not given.
+        image_extension (str): Extension of the image files the labels belong to.
+    """
+    masks = MaskSource(mask_folder)
+    manifest = load_label_manifest(label_folder)
+
+    # Labels without a mask have no known frame size and are left out
+    images = []
+    for label_name in list_labels(label_folder):
+        stem = os.path.splitext(label_name)[0]
+        size = masks.size(stem)
+        if size is None:
+            print(f"Skipping {label_name}: no mask.")
+            continue
+        images.append((len(images) + 1, label_name, stem, size))
+
+    class_ids = set()
+    annotation_count = 0
+
+    def image_entries():
+        for image_id, _, stem, (width, height) in images:
+            yield {"id": image_id, "file_name": stem + image_extension, "width": width, "height": height}
+
+    def annotation_entries():
+        nonlocal annotation_count
+        for image_id, label_name, stem, (width, height) in images:
+            labels = read_yolo_label(label_folder, label_name, manifest)
+            mask_rle = mask_area = None
+            if len(labels) == 1:
+                mask_rle, mask_area = masks.rle(stem)
+            for label in labels:
+                center_x, center_y, box_width, box_height = label.bbox * (width, height, width, height)
+                polygon = label.polygon * (width, height)
+                annotation = {
+                    "id": annotation_count + 1,
+                    "image_id": image_id,
+                    "category_id": label.class_id,
+                    "bbox": [center_x - box_width / 2, center_y - box_height / 2, box_width, box_height],
+                    "area": mask_area if mask_area is not None else polygon_area(polygon),
+                    "iscrowd": 0,
+                }
+                if segmentation == "rle" and mask_rle is not None:
+                    annotation["segmentation"] = mask_rle
+                else:
+                    annotation["segmentation"] = [polygon.reshape(-1).tolist()] if len(polygon) else []
+                class_ids.add(label.class_id)
+                annotation_count += 1
+                yield annotation
+
+    write_coco(output_path, image_entries(), annotation_entries(), class_ids, names)
+
+    print(f"Exported {len(images)} images and {annotation_count} annotations to {output_path}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export YOLO labels and masks from gen_masks.py as COCO JSON.")
+    parser.add_argument("label_folder", type=str, help="Path to the folder containing YOLO label files.")
+    parser.add_argument("mask_folder", type=str, help="Path to the folder containing _mask.png files or masks.rle.")
+    parser.add_argument("output_path", type=str, help="COCO JSON file to write.")
+    parser.add_argument("--segmentation", choices=["polygon", "rle"], default="polygon",
+                        help="Use the YOLO polygons or the RLE encoded masks as segmentation.")
+    parser.add_argument("--names", type=str, nargs="+", default=None, help="Category names, indexed by class ID.")
+    parser.add_argument("--image_extension", type=str, default=".png", help="Extension of the image files.")
+
+    args = parser.parse_args()
+    export_coco(args.label_folder, args.mask_folder, args.output_path, args.segmentation, args.names, args.image_extension)
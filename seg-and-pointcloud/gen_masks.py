@@ -1,67 +1,502 @@
 import os
 import cv2
+import time
 import numpy as np
 import argparse
+import multiprocessing
 
-def generate_yolo_files_and_masks(image_folder, output_txt_folder, output_mask_folder, class_id):
+from content_manifest import ContentManifest
+from labels import parse_yolo_label
+from mask_store import MASK_STORE, MaskStore, MaskStoreWriter, encode_rle, rle_to_string
+from sprites import SPRITE_INDEX, alpha_bounds, load_sprite_index
+
+# How the polygons of objects made of several separate parts are written
+POLYGON_MODES = ["merged", "parts", "none"]
+# How the binary masks are written: one PNG per image, or all of them RLE encoded in one mask store
+MASK_FORMATS = ["png", "rle"]
+# Simplification tolerance (pixels) beyond which max_vertices stops being enforced
+MAX_EPSILON = 2**12
+# Content manifest written to the label folder by incremental runs
+MASKS_MANIFEST = "gen_masks_manifest.json"
+
+
+def closest_points(a, b):
+    """
+    Find the closest pair of points of two contours without a full distance matrix.
+
+    The distance of a point of `a` to the outline of `b` (cv2.pointPolygonTest) is a lower bound of
+    its distance to any point of `b`, so the points of `a` are tried in order of that bound and the
+    search stops once the bound exceeds the closest distance found. Memory stays linear in the
+    contour lengths. Ties are resolved like an argmin over the full matrix.
+
+    Args:
+        a (np.ndarray): (Na, 2) contour points.
+        b (np.ndarray): (Nb, 2) contour points.
+
+    Returns:
+        tuple: (index in a, index in b) of the closest pair.
+    """
+    outline = b.reshape(-1, 1, 2).astype(np.float32)
+    bounds = np.array([abs(cv2.pointPolygonTest(outline, (float(x), float(y)), True)) for x, y in a])
+    b64 = b.astype(np.int64)
+    best = (np.inf, 0, 0)
+    for i in np.argsort(bounds, kind="stable"):
+        # Squared distances are exact integers; the bound is compared with some slack for rounding
+        if bounds[i] ** 2 > best[0] + 1:
+            break
+        distances = ((b64 - a[i]) ** 2).sum(axis=1)
+        j = int(distances.argmin())
+        if (distances[j], i, j) < best:
+            best = (distances[j], int(i), j)
+    return best[1], best[2]
+
+
+def merge_contours(contours):
+    """
+    Join the contours of separate parts into a single polygon.
+
+    Consecutive parts are connected through their closest pair of points. The polygon goes around
+    the first part, out along each connection to the last part and around it, and back along the
+    same connections, so the connections have no area.
+
+    Args:
+        contours (list): Contours from cv2.findContours, in the order they are to be connected.
+
+    Returns:
+        np.ndarray: (N, 2) polygon points.
+    """
+    parts = [contour.reshape(-1, 2) for contour in contours]
+    if len(parts) == 1:
+        return parts[0]
+
+    # Closest points (index in part k, index in part k + 1) of each pair of consecutive parts
+    links = [closest_points(a, b) for a, b in zip(parts[:-1], parts[1:])]
+
+    forward, backward = [], []
+    for k, part in enumerate(parts):
+        entry_index = links[k - 1][1] if k > 0 else None
+        exit_index = links[k][0] if k < len(links) else None
+        if entry_index is None or exit_index is None:
+            # The first and last parts are traced all the way round, back to where they connect
+            start = exit_index if entry_index is None else entry_index
+            forward.append(np.roll(part, -start, axis=0))
+            forward.append(part[start:start + 1])
+        else:
+            # The other parts are traced from entry to exit on the way out and on to entry on the way back
+            rolled = np.roll(part, -entry_index, axis=0)
+            split = (exit_index - entry_index) % len(part)
+            forward.append(rolled[:split + 1])
+            backward.append(np.vstack([rolled[split:], rolled[:1]]))
+    return np.concatenate(forward + backward[::-1])
+
+
+def simplify_polygon(contours, epsilon=0.0, max_vertices=None):
+    """
+    Simplify contours with the Douglas-Peucker algorithm and join them into one polygon.
+
+    Args:
+        contours (list): Contours of the parts, in the order merge_contours connects them.
+        epsilon (float): Largest distance in pixels between a simplified contour and the original.
+            0 keeps every contour point.
+        max_vertices (int, optional): Largest number of polygon points. If the polygon has more,
+            the smallest tolerance (to within 1/16 pixel) that makes it fit is searched for.
+
+    Returns:
+        np.ndarray: (N, 2) polygon points.
+    """
+    def approximate(tolerance):
+        if tolerance <= 0:
+            return merge_contours(contours)
+        return merge_contours([cv2.approxPolyDP(contour, tolerance, True) for contour in contours])
+
+    polygon = approximate(epsilon)
+    if not max_vertices or len(polygon) <= max_vertices:
+        return polygon
+
+    # Double the tolerance until the polygon fits, then bisect between the last two tolerances
+    low, high = epsilon, max(epsilon * 2, 0.5)
+    fitted = approximate(high)
+    while len(fitted) > max_vertices and high < MAX_EPSILON:
+        low, high = high, high * 2
+        fitted = approximate(high)
+    while high - low > 1 / 16:
+        middle = (low + high) / 2
+        candidate = approximate(middle)
+        if len(candidate) <= max_vertices:
+            high, fitted = middle, candidate
+        else:
+            low = middle
+    return fitted
+
+
+def polygon_iou(labels, mask, origin, frame_width, frame_height):
+    """
+    Compare the area covered by the polygons of some labels with a binary mask.
+
+    Args:
+        labels (list): YoloLabel entries, with polygons normalized by the frame size.
+        mask (np.ndarray): Boolean mask of a region of the frame.
+        origin (tuple): (x, y) position of the mask region in the frame.
+        frame_width (int): Width of the frame.
+        frame_height (int): Height of the frame.
+
+    Returns:
+        float: Intersection over union of the filled polygons and the mask.
+    """
+    filled = np.zeros(mask.shape, dtype=np.uint8)
+    for label in labels:
+        if len(label.polygon):
+            # Rasterized with 4 fractional bits, so the rounding of the written coordinates counts
+            points = (label.polygon * (frame_width, frame_height) - origin) * 16
+            cv2.fillPoly(filled, [np.rint(points).astype(np.int32)], 1, shift=4)
+    filled = filled.astype(bool)
+    union = np.count_nonzero(filled | mask)
+    return np.count_nonzero(filled & mask) / union if union else 1.0
+
+
+def format_label_line(class_id, bbox, polygon, frame_width, frame_height, decimals=None):
+    """
+    Format one YOLO label line.
+
+    Args:
+        class_id (int): Class ID of the label.
+        bbox (tuple): (x, y, w, h) bounding box in frame pixels.
+        polygon (np.ndarray, optional): (N, 2) polygon in frame pixels.
+        frame_width (int): Width of the frame the coordinates are normalized by.
+        frame_height (int): Height of the frame the coordinates are normalized by.
+        decimals (int, optional): Number of decimal places of the coordinates. Full precision if None.
+
+    Returns:
+        str: The label line.
+    """
+    x, y, w, h = bbox
+    center_x = (x + w / 2) / frame_width
+    center_y = (y + h / 2) / frame_height
+    width = w / frame_width
+    height = h / frame_height
+    values = [center_x, center_y, width, height]
+
+    # Optional: Get segmentation mask points
+    if polygon is not None and len(polygon):
+        for px, py in polygon:
+            values.append(px / frame_width)
+            values.append(py / frame_height)
+
+    if decimals is None:
+        return " ".join([str(class_id)] + [str(v) for v in values]) + "\n"
+    return " ".join([str(class_id)] + [f"{v:.{decimals}f}" for v in values]) + "\n"
+
+
+def label_alpha(alpha_channel, class_id, origin=(0, 0), frame_size=None, polygons="merged", epsilon=0.0,
+                max_vertices=None, decimals=None, report=False):
+    """
+    Compute the binary mask and YOLO label lines of an object from its alpha channel.
+
+    The bounding box is taken directly from the rows and columns of the alpha channel that hold
+    object pixels, so it covers every part of the object. Contours are only traced when polygons
+    are written: with "merged" every part is joined into one polygon (see merge_contours) on a
+    single line with the overall bounding box, with "parts" each part gets its own line with its
+    own bounding box and polygon, and with "none" only the bounding box is written. Each polygon
+    line can be simplified (see simplify_polygon) and its coordinates rounded to fixed decimals.
+
+    Args:
+        alpha_channel (np.ndarray): (H, W) alpha channel, non-zero on the object.
+        class_id (int): Class ID for the YOLO labels.
+        origin (tuple): (x, y) position of the alpha channel in the rendered frame.
+        frame_size (tuple, optional): (width, height) of the frame. The size of the alpha channel if not given.
+        polygons (str): One of POLYGON_MODES.
+        epsilon (float): Polygon simplification tolerance in pixels.
+        max_vertices (int, optional): Largest number of points of a polygon line.
+        decimals (int, optional): Number of decimal places of the coordinates.
+        report (bool): Also return the unsimplified full-precision label lines.
+
+    Returns:
+        tuple: (mask, lines, raw lines): the (frame height, frame width) uint8 mask, 255 on the
+            object, and the label lines, which are empty if the object has no pixels. The raw lines
+            are only filled with report.
+    """
+    x0, y0 = origin
+    if frame_size is None:
+        frame_height, frame_width = alpha_channel.shape
+    else:
+        frame_width, frame_height = frame_size
+
+    # Create a binary mask (object=white, background=black)
+    mask = np.zeros((frame_height, frame_width), dtype=np.uint8)
+    mask[y0:y0 + alpha_channel.shape[0], x0:x0 + alpha_channel.shape[1]] = (alpha_channel > 0).astype(np.uint8) * 255
+
+    bounds = alpha_bounds(alpha_channel)
+    if bounds is None:
+        return mask, [], []
+    by0, by1, bx0, bx1 = bounds
+    bbox = (x0 + int(bx0), y0 + int(by0), int(bx1 - bx0), int(by1 - by0))
+    lines = []
+    raw_lines = []
+
+    if polygons == "none":
+        lines.append(format_label_line(class_id, bbox, None, frame_width, frame_height, decimals))
+        if report:
+            raw_lines.append(format_label_line(class_id, bbox, None, frame_width, frame_height))
+    else:
+        # Find contours from the alpha channel for the polygons
+        # (padded so that sprites cropped tight to the object trace the same as the full frame)
+        binary = np.pad((alpha_channel > 0).astype(np.uint8), 1)
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x0 - 1, y0 - 1))
+        # Order the parts left to right, so that the output does not depend on the tracing order
+        contours = sorted(contours, key=lambda contour: tuple(cv2.boundingRect(contour)))
+        if polygons == "merged":
+            groups = [(bbox, contours)]
+        else:
+            groups = [(cv2.boundingRect(contour), [contour]) for contour in contours]
+        for group_bbox, group in groups:
+            polygon = simplify_polygon(group, epsilon, max_vertices)
+            lines.append(format_label_line(class_id, group_bbox, polygon, frame_width, frame_height, decimals))
+            if report:
+                raw_lines.append(format_label_line(class_id, group_bbox, merge_contours(group), frame_width, frame_height))
+    return mask, lines, raw_lines
+
+
+def generate_yolo_file_and_mask(image_folder, image_name, output_txt_folder, output_mask_folder, class_id, sprite_index=None,
+                                polygons="merged", epsilon=0.0, max_vertices=None, decimals=None, report=False,
+                                mask_format="png"):
+    """
+    Generate the YOLO label and binary mask of a single image (see label_alpha).
+
+    Args:
+        image_folder (str): Path to the folder containing input images or sprites.
+        image_name (str): File name of the image in image_folder.
+        output_txt_folder (str): Path to save YOLO label files.
+        output_mask_folder (str): Path to save binary mask images.
+        class_id (int): Class ID for the YOLO labels.
+        sprite_index (dict, optional): Sprite index of image_folder if it is a sprite folder.
+        polygons (str): One of POLYGON_MODES.
+        epsilon (float): Polygon simplification tolerance in pixels.
+        max_vertices (int, optional): Largest number of points of a polygon line.
+        decimals (int, optional): Number of decimal places of the coordinates.
+        report (bool): Also compare the written labels with unsimplified full-precision ones.
+        mask_format (str): "png" to write the mask next to the others, "rle" to return it encoded
+            for the caller to store.
+
+    Returns:
+        dict: "report": (raw vertices, vertices, raw bytes, bytes, raw IoU, IoU) if report is set,
+            with the IoUs of the label polygons against the alpha mask (None without polygons);
+            "rle": (COCO RLE string as bytes, height, width) of the mask with mask_format "rle".
+            None if the image has no alpha channel and was skipped.
+    """
+    # Load the image
+    image_path = os.path.join(image_folder, image_name)
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+
+    # Check if the image has an alpha channel
+    if image.shape[-1] != 4:
+        return None
+    alpha_channel = image[:, :, 3]
+
+    # Position of the image in the rendered frame
+    if sprite_index is not None:
+        entry = sprite_index[image_name]
+        x0, y0 = entry["x"], entry["y"]
+        frame_width, frame_height = entry["frame_width"], entry["frame_height"]
+    else:
+        x0, y0 = 0, 0
+        frame_height, frame_width = alpha_channel.shape
+
+    mask, lines, raw_lines = label_alpha(alpha_channel, class_id, (x0, y0), (frame_width, frame_height), polygons,
+                                         epsilon, max_vertices, decimals, report)
+    result = {}
+    if mask_format == "rle":
+        result["rle"] = (rle_to_string(encode_rle(mask)).encode("ascii"), frame_height, frame_width)
+    else:
+        mask_path = os.path.join(output_mask_folder, f"{os.path.splitext(image_name)[0]}_mask.png")
+        cv2.imwrite(mask_path, mask)
+
+    txt_path = os.path.join(output_txt_folder, f"{os.path.splitext(image_name)[0]}.txt")
+    if not lines:
+        # A label written for an earlier version of the image no longer applies
+        if os.path.lexists(txt_path):
+            os.remove(txt_path)
+        if report:
+            result["report"] = (0, 0, 0, 0, None, None)
+        return result
+
+    # Write YOLO format file
+    with open(txt_path, "w") as f:
+        f.write("".join(lines))
+
+    if not report:
+        return result
+    labels = parse_yolo_label("".join(lines))
+    raw_labels = parse_yolo_label("".join(raw_lines))
+    raw_iou = iou = None
+    if polygons != "none":
+        object_mask = alpha_channel > 0
+        raw_iou = polygon_iou(raw_labels, object_mask, (x0, y0), frame_width, frame_height)
+        iou = polygon_iou(labels, object_mask, (x0, y0), frame_width, frame_height)
+    result["report"] = (sum(len(label.polygon) for label in raw_labels), sum(len(label.polygon) for label in labels),
+                        len("".join(raw_lines)), len("".join(lines)), raw_iou, iou)
+    return result
+
+
+def _process_chunk(task):
+    image_folder, image_names, output_txt_folder, output_mask_folder, class_id, sprite_index, options = task
+    results = []
+    for image_name in image_names:
+        result = generate_yolo_file_and_mask(image_folder, image_name, output_txt_folder, output_mask_folder,
+                                             class_id, sprite_index, **options)
+        if result is not None:
+            results.append((image_name, result))
+    return results
+
+
+def format_simplification_report(results):
+    """
+    Summarize how much polygon simplification and rounding shrank the labels and what it cost in IoU.
+
+    Args:
+        results (list): (image name, result of generate_yolo_file_and_mask) pairs.
+
+    Returns:
+        str: Multi-line report.
+    """
+    results = [(name, result["report"]) for name, result in results]
+    raw_vertices = sum(r[0] for _, r in results)
+    vertices = sum(r[1] for _, r in results)
+    raw_bytes = sum(r[2] for _, r in results)
+    written_bytes = sum(r[3] for _, r in results)
+    lines = [f"Label bytes: {raw_bytes / 1024:.1f} KiB -> {written_bytes / 1024:.1f} KiB ({written_bytes / max(raw_bytes, 1):.1%})"]
+    if raw_vertices:
+        lines.append(f"Polygon points: {raw_vertices} -> {vertices} ({vertices / raw_vertices:.1%})")
+
+    compared = [(name, r[4], r[5]) for name, r in results if r[4] is not None]
+    if compared:
+        raw_ious = np.array([c[1] for c in compared])
+        ious = np.array([c[2] for c in compared])
+        losses = raw_ious - ious
+        worst = int(losses.argmax())
+        lines.append(f"IoU against the alpha mask: {raw_ious.mean():.4f} unsimplified, {ious.mean():.4f} written "
+                     f"(mean loss {losses.mean():.4f}, largest {losses[worst]:.4f} on {compared[worst][0]})")
+    return "\n".join(lines)
+
+
+def generate_yolo_files_and_masks(image_folder, output_txt_folder, output_mask_folder, class_id, workers=1, chunk_size=32,
+                                  polygons="merged", epsilon=0.0, max_vertices=None, decimals=None, report=False,
+                                  incremental=False, mask_format="png"):
     """
     Generate YOLO format labels and binary masks from images with alpha channels.
 
+    The image folder can also be a sprite folder made by sprites.py, in which case only the cropped
+    sprites are decoded and the labels and masks are placed in the original frame.
+
+    With more than one worker the sorted image list is split into chunks that are processed by a
+    process pool. Every image is handled independently, so the files written are the same as in a
+    serial run.
+
+    With mask_format "rle" the masks are not written as PNGs but COCO RLE encoded into a single
+    mask store (see mask_store.py) in the mask folder, in which each mask is found by the stem of
+    its image.
+
+    Incremental runs keep a content manifest (see ContentManifest) in the label folder and only
+    process the images that are new or have changed since the last run with the same settings.
+    The labels and masks of images that no longer exist are deleted.
+
     Args:
-        image_folder (str): Path to the folder containing input images.
+        image_folder (str): Path to the folder containing input images or sprites.
         output_txt_folder (str): Path to save YOLO label files.
         output_mask_folder (str): Path to save binary mask images.
         class_id (int): Class ID for the YOLO labels.
+        workers (int): Number of worker processes.
+        chunk_size (int): Number of images handed to a worker at a time.
+        polygons (str): How to write the polygons of objects with several parts (see
+            generate_yolo_file_and_mask).
+        epsilon (float): Polygon simplification tolerance in pixels.
+        max_vertices (int, optional): Largest number of points of a polygon line.
+        decimals (int, optional): Number of decimal places of the coordinates.
+        report (bool): Print how much smaller the labels are than unsimplified full-precision ones
+            and how much IoU against the alpha mask that costs.
+        incremental (bool): Only process new and changed images.
+        mask_format (str): One of MASK_FORMATS.
     """
     # Create output folders if they don't exist
     os.makedirs(output_txt_folder, exist_ok=True)
     os.makedirs(output_mask_folder, exist_ok=True)
 
-    for image_name in os.listdir(image_folder):
-        if image_name.endswith((".png", ".jpg", ".jpeg")):
-            # Load the image
-            image_path = os.path.join(image_folder, image_name)
-            image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-
-            # Check if the image has an alpha channel
-            if image.shape[-1] == 4:
-                alpha_channel = image[:, :, 3]
-
-                # Create a binary mask (object=white, background=black)
-                mask = (alpha_channel > 0).astype(np.uint8) * 255
-                mask_path = os.path.join(output_mask_folder, f"{os.path.splitext(image_name)[0]}_mask.png")
-                cv2.imwrite(mask_path, mask)
-
-                # Find contours from the alpha channel for YOLO bounding box
-                contours, _ = cv2.findContours((alpha_channel > 0).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-                if contours:
-                    # Get bounding box
-                    x, y, w, h = cv2.boundingRect(contours[0])
-                    center_x = (x + w / 2) / image.shape[1]
-                    center_y = (y + h / 2) / image.shape[0]
-                    width = w / image.shape[1]
-                    height = h / image.shape[0]
-
-                    # Optional: Get segmentation mask points
-                    segmentation = []
-                    for point in contours[0]:
-                        px, py = point[0]
-                        segmentation.append(px / image.shape[1])
-                        segmentation.append(py / image.shape[0])
-
-                    # Write YOLO format file
-                    txt_path = os.path.join(output_txt_folder, f"{os.path.splitext(image_name)[0]}.txt")
-                    with open(txt_path, "w") as f:
-                        # Write bounding box
-                        f.write(f"{class_id} {center_x} {center_y} {width} {height}")
-                        # Write segmentation mask if needed
-                        if segmentation:
-                            seg_str = " " + " ".join(map(str, segmentation))
-                            f.write(seg_str)
-                        f.write("\n")
+    sprite_index = load_sprite_index(image_folder)
+
+    image_names = sorted(f for f in os.listdir(image_folder) if f.endswith((".png", ".jpg", ".jpeg")))
+    if sprite_index is not None:
+        image_names = [f for f in image_names if f in sprite_index]
+
+    start_time = time.time()
+    options = dict(polygons=polygons, epsilon=epsilon, max_vertices=max_vertices, decimals=decimals, report=report,
+                   mask_format=mask_format)
+    store_path = os.path.join(output_mask_folder, MASK_STORE)
+    previous_store = None
+    if mask_format == "rle" and os.path.isfile(store_path):
+        previous_store = MaskStore(store_path)
+
+    todo = image_names
+    if incremental:
+        settings = dict(options, image_folder=os.path.abspath(image_folder), output_mask_folder=os.path.abspath(output_mask_folder),
+                        class_id=class_id)
+        del settings["report"]
+        manifest = ContentManifest(os.path.join(output_txt_folder, MASKS_MANIFEST), settings)
+
+        def sources(image_name):
+            # The position of a sprite in its frame comes from the sprite index
+            paths = [os.path.abspath(os.path.join(image_folder, image_name))]
+            if sprite_index is not None:
+                paths.append(os.path.abspath(os.path.join(image_folder, SPRITE_INDEX)))
+            return paths
+
+        pruned = manifest.prune(image_names)
+        todo = [f for f in image_names if not manifest.is_current(f, sources(f))]
+        if mask_format == "rle":
+            # The masks of current images are only kept if they made it into the store
+            stale = set(todo)
+            todo = [f for f in image_names
+                    if f in stale or previous_store is None or os.path.splitext(f)[0] not in previous_store]
+        print(f"{len(image_names) - len(todo)} images are up to date ({manifest.hashed} hashed), {len(todo)} to process, "
+              f"{pruned} removed.")
+    input_bytes = sum(os.path.getsize(os.path.join(image_folder, f)) for f in todo)
+
+    chunks = [todo[k:k + chunk_size] for k in range(0, len(todo), chunk_size)]
+    tasks = [(image_folder, chunk, output_txt_folder, output_mask_folder, class_id, sprite_index, options)
+             for chunk in chunks]
+    if workers > 1 and len(chunks) > 1:
+        with multiprocessing.Pool(min(workers, len(chunks))) as pool:
+            results = [r for chunk_results in pool.imap(_process_chunk, tasks) for r in chunk_results]
+    else:
+        results = [r for task in tasks for r in _process_chunk(task)]
+    processed = len(results)
+
+    if mask_format == "rle":
+        # Rewritten as a whole, copying the masks of the images that were not processed again
+        rles = {name: result["rle"] for name, result in results}
+        with MaskStoreWriter(store_path + ".tmp") as writer:
+            for image_name in image_names:
+                stem = os.path.splitext(image_name)[0]
+                if image_name in rles:
+                    writer.write_rle(stem, *rles[image_name])
+                elif incremental and previous_store is not None and stem in previous_store:
+                    rle = previous_store.read_rle(stem)
+                    writer.write_rle(stem, rle["counts"].encode("ascii"), *rle["size"])
+        os.replace(store_path + ".tmp", store_path)
+
+    if incremental:
+        for image_name in todo:
+            stem = os.path.splitext(image_name)[0]
+            manifest.record(image_name, sources(image_name),
+                            [os.path.abspath(os.path.join(output_txt_folder, stem + ".txt")),
+                             os.path.abspath(os.path.join(output_mask_folder, stem + "_mask.png"))])
+        manifest.save()
+    elapsed = time.time() - start_time
 
     print("YOLO files and masks generated successfully!")
+    print(f"Processed {processed} of {len(todo)} images ({input_bytes / 2**20:.1f} MiB) in {elapsed:.2f} seconds: "
+          f"{processed / max(elapsed, 1e-9):.1f} images/s, {input_bytes / 2**20 / max(elapsed, 1e-9):.1f} MiB/s "
+          f"on {workers if workers > 1 and len(chunks) > 1 else 1} processes.")
+    if report:
+        print(format_simplification_report(results))
 
 
 if __name__ == "__main__":
@@ -70,7 +505,23 @@ if __name__ == "__main__":
     parser.add_argument("output_txt_folder", type=str, help="Path to save YOLO label files.")
     parser.add_argument("output_mask_folder", type=str, help="Path to save binary mask images.")
     parser.add_argument("class_id", type=int, help="Class ID for the YOLO labels.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes.")
+    parser.add_argument("--chunk_size", type=int, default=32, help="Number of images handed to a worker at a time.")
+    parser.add_argument("--polygons", choices=POLYGON_MODES, default="merged",
+                        help="Join the parts of an object into one polygon, write one line per part, or write no polygons.")
+    parser.add_argument("--epsilon", type=float, default=0.0,
+                        help="Polygon simplification tolerance in pixels (0 keeps every contour point).")
+    parser.add_argument("--max_vertices", type=int, default=None, help="Largest number of points of a polygon line.")
+    parser.add_argument("--decimals", type=int, default=None, help="Decimal places of the coordinates (full precision if not given).")
+    parser.add_argument("--report", action="store_true",
+                        help="Report the label size reduction and the IoU loss against the alpha mask.")
+    parser.add_argument("--mask_format", choices=MASK_FORMATS, default="png",
+                        help="Write a _mask.png per image, or all masks RLE encoded into a single masks.rle file.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process images that are new or changed since the last incremental run, and remove outputs of deleted images.")
 
     args = parser.parse_args()
 
-    generate_yolo_files_and_masks(args.image_folder, args.output_txt_folder, args.output_mask_folder, args.class_id)
+    generate_yolo_files_and_masks(args.image_folder, args.output_txt_folder, args.output_mask_folder, args.class_id,
+                                  args.workers, args.chunk_size, args.polygons, args.epsilon, args.max_vertices,
+                                  args.decimals, args.report, args.incremental, args.mask_format)
@@ -1,39 +1,123 @@
+import os
 import cv2
+import time
+import argparse
+import multiprocessing
+import numpy as np
 
-image_path = "output/trial_01/image_03.png"
-image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-
-background_path = "../data/background/sky.jpg"
-background = cv2.imread(background_path, cv2.IMREAD_UNCHANGED)
-
-dimx, dimy, dimz = image.shape
-for i in range(0,dimx):
-    for j in range(0,dimy):
-        if(image[i][j][3] == 0):
-            image[i][j] = [0,0,0,255]
-        else:
-            image[i][j] = [255, 255, 255,255]
-
-
-# xmin = int(xmin)
-# ymin = int(ymin)
-# xmax = int(xmax)
-# ymax = int(ymax)
-
-# color = (0,0,255)
-# thickness = 2
-# image = cv2.rectangle(image, (xmin, ymin), (xmax, ymax), color, thickness)
-output_path = "image1.png"
-cv2.imwrite(output_path, image)
-image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-
-output_path = "image2.png"
-for i in range(0, dimx):
-    for j in range(0,dimy):
-        if image[i][j][3] == 0:
-            image[i][j][0] = background[(int) (i/3)][(int) (j/3)][0]
-            image[i][j][1] = background[(int) (i/3)][(int) (j/3)][1]
-            image[i][j][2] = background[(int) (i/3)][(int) (j/3)][2]
-            image[i][j][3] = 255
-
-cv2.imwrite(output_path, image)
\ No newline at end of file
+# Trials with fewer images than this are processed in-process, since starting a pool costs more than it saves
+MIN_POOL_IMAGES = 16
+
+
+def background_index_maps(height, width, background_shape, scale=3):
+    """
+    Precompute which background pixel fills each pixel of a render.
+
+    The background is sampled at (row / scale, column / scale), so it appears magnified by `scale`
+    from the top-left corner. Rows and columns past the end of the background wrap around.
+
+    Args:
+        height (int): Height of the renders.
+        width (int): Width of the renders.
+        background_shape (tuple): Shape of the background image.
+        scale (float): Magnification of the background.
+
+    Returns:
+        tuple: (rows, cols) index arrays of length height and width.
+    """
+    rows = (np.arange(height) / scale).astype(int) % background_shape[0]
+    cols = (np.arange(width) / scale).astype(int) % background_shape[1]
+    return rows, cols
+
+
+def segment_image(image, background_fill):
+    """
+    Build the segmented image and the background-filled image of a transparent render.
+
+    Args:
+        image (np.ndarray): BGRA render, transparent where there is no spacecraft.
+        background_fill (np.ndarray): BGR background sampled to the size of the render.
+
+    Returns:
+        tuple: (segmented, full) BGR images. `segmented` is white on the spacecraft and black
+            elsewhere; `full` is the render with its transparent pixels replaced by the background.
+    """
+    transparent = image[:, :, 3:4] == 0
+    segmented = np.where(transparent, 0, 255).astype(np.uint8).repeat(3, axis=2)
+    full = np.where(transparent, background_fill, image[:, :, 0:3])
+    return segmented, full
+
+
+# Per-process state, filled in by _init_worker
+_worker_state = {}
+
+
+def _init_worker(background_path, scale):
+    background = cv2.imread(background_path, cv2.IMREAD_COLOR)
+    if background is None:
+        raise ValueError(f"Could not read background {background_path}")
+    _worker_state.update(background=background, scale=scale, fills={})
+
+
+def _process_image(task):
+    image_path, output_folder = task
+    image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+    image_name = os.path.basename(image_path)
+    if image is None or image.ndim != 3 or image.shape[-1] != 4:
+        print(f"Skipping {image_name}: no alpha channel.")
+        return 0
+
+    # The renders of a trial share one size, so the sampled background is built once per size
+    fills = _worker_state["fills"]
+    size = image.shape[:2]
+    if size not in fills:
+        background = _worker_state["background"]
+        rows, cols = background_index_maps(size[0], size[1], background.shape, _worker_state["scale"])
+        fills[size] = background[np.ix_(rows, cols)]
+    segmented, full = segment_image(image, fills[size])
+
+    suffix = image_name[len("image_"):]
+    cv2.imwrite(os.path.join(output_folder, "segmented_" + suffix), segmented)
+    cv2.imwrite(os.path.join(output_folder, "full_" + suffix), full)
+    return 1
+
+
+def process_trial(trial_folder, background_path, output_folder=None, scale=3, workers=1):
+    """
+    Write a segmented image and a background-filled image for every render of a trial.
+
+    For each `image_XX.png`, `segmented_XX.png` and `full_XX.png` are written to the output folder.
+
+    Args:
+        trial_folder (str): Folder with the transparent renders, e.g. output/trial_01.
+        background_path (str): Background image to fill the transparent pixels with.
+        output_folder (str, optional): Folder to write to. Defaults to the trial folder.
+        scale (float): Magnification of the background.
+        workers (int): Number of worker processes for large trials.
+    """
+    output_folder = output_folder or trial_folder
+    os.makedirs(output_folder, exist_ok=True)
+    image_names = sorted(f for f in os.listdir(trial_folder) if f.startswith("image_") and f.endswith(".png"))
+    tasks = [(os.path.join(trial_folder, name), output_folder) for name in image_names]
+
+    start_time = time.time()
+    if workers > 1 and len(tasks) >= MIN_POOL_IMAGES:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(background_path, scale)) as pool:
+            done = sum(pool.imap_unordered(_process_image, tasks))
+    else:
+        _init_worker(background_path, scale)
+        done = sum(_process_image(task) for task in tasks)
+    end_time = time.time()
+    print(f"Segmented {done} images in {end_time - start_time:.2f} seconds.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write segmented and background-filled images for a trial of transparent renders.")
+    parser.add_argument("trial_folder", type=str, help="Path to the folder containing the rendered image_XX.png files.")
+    parser.add_argument("--background", type=str, default="../data/background/sky.jpg", help="Background image to fill in.")
+    parser.add_argument("--output_folder", type=str, default=None, help="Folder to write to (defaults to the trial folder).")
+    parser.add_argument("--scale", type=float, default=3, help="Magnification of the background.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes for large trials.")
+
+    args = parser.parse_args()
+    process_trial(args.trial_folder, args.background, args.output_folder, args.scale, args.workers)
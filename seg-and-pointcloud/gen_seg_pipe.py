@@ -1,93 +1,626 @@
 import os
 import cv2
 import random
+import hashlib
+import functools
 import time
 import argparse
+import multiprocessing
+from multiprocessing import shared_memory
 import numpy as np
 
-def overlay_object_on_background(object_img, background_img):
+from asset_cache import AssetCache
+from content_manifest import ContentManifest
+from augment import FLIP_PROB, ROTATION_RANGE, SCALE_RANGE, augment_sprite
+from labels import format_yolo_label, link_or_copy, read_yolo_label, replace_text, write_label_manifest
+from pipeline import BufferPool, Stage, format_stage_report, merge_stage_stats, run_pipeline
+from shards import ShardWriter, list_shards, remove_shards
+from sprites import SPRITE_INDEX, Sprite, alpha_bounds, crop_to_alpha, load_sprite_index, sprite_from_entry
+
+# Content manifest written to the output masks folder by incremental runs
+COMPOSITES_MANIFEST = "gen_seg_pipe_manifest.json"
+# Arguments that change the composites or labels written for an index
+OUTPUT_SETTINGS = ["seed", "full_decode", "label_mode", "augment", "scale_range", "rotation_range", "flip_prob",
+                   "png_compression"]
+
+
+def tile_background(background_img, height, width):
+    """
+    Return the RGB channels of a background covering (height, width), wrapping around like the original per-pixel lookup.
+
+    Args:
+        background_img (np.ndarray): Background image (3 or 4 channels).
+        height (int): Required height.
+        width (int): Required width.
+
+    Returns:
+        np.ndarray: View or tiled copy of the background with shape (height, width, 3).
+    """
+    background_rgb = background_img[:, :, 0:3]
+    bh, bw = background_rgb.shape[:2]
+    if bh < height or bw < width:
+        reps = (-(-height // bh), -(-width // bw), 1)
+        background_rgb = np.tile(background_rgb, reps)
+    return background_rgb[:height, :width]
+
+
+def blend_region(out, object_region, background_rgb, y0, x0):
+    """
+    Alpha blend an RGBA region onto the background in place, with its top-left corner at (x0, y0).
+
+    Args:
+        out (np.ndarray): (H, W, 4) composite buffer that already holds the background.
+        object_region (np.ndarray): RGBA pixels to blend.
+        background_rgb (np.ndarray): (H, W, 3) background the buffer was filled with.
+        y0 (int): Row of the region in the frame.
+        x0 (int): Column of the region in the frame.
+    """
+    y1 = y0 + object_region.shape[0]
+    x1 = x0 + object_region.shape[1]
+
+    # Integer blend, rounded to nearest: alpha 0 gives the background and alpha 255 the object exactly
+    alpha = object_region[:, :, 3:4].astype(np.uint16)
+    blended = object_region[:, :, 0:3] * alpha
+    blended += background_rgb[y0:y1, x0:x1] * (255 - alpha)
+    blended += 127
+    blended //= 255
+    out[y0:y1, x0:x1, 0:3] = blended
+
+
+def overlay_object_on_background(object_img, background_img, out=None):
     """
     Overlay an object with transparency onto a background image.
 
+    The background is copied into the output everywhere, and the object is alpha blended on top
+    of it only inside the bounding region of its non-transparent pixels. Fully transparent pixels
+    take the background colour and fully opaque pixels keep the object colour; the output alpha is
+    always 255.
+
     Args:
         object_img (np.ndarray): Object image with an alpha channel.
         background_img (np.ndarray): Background image to overlay onto.
+        out (np.ndarray, optional): Preallocated (H, W, 4) uint8 buffer to write the composite into.
+            A new buffer is allocated if it is None or has the wrong shape.
 
     Returns:
         np.ndarray: Composite image with the object overlaid on the background.
     """
-    dimx, dimy, _ = object_img.shape
-    for i in range(dimx):
-        for j in range(dimy):
-            if object_img[i, j, 3] == 0:  # Transparent pixel
-                object_img[i, j, 0:3] = background_img[i % background_img.shape[0], j % background_img.shape[1], 0:3]
-                object_img[i, j, 3] = 255  # Make it non-transparent
-    return object_img
+    dimx, dimy = object_img.shape[:2]
+    if out is None or out.shape != (dimx, dimy, 4):
+        out = np.empty((dimx, dimy, 4), dtype=np.uint8)
+
+    background_rgb = tile_background(background_img, dimx, dimy)
+    out[:, :, 0:3] = background_rgb
+    out[:, :, 3] = 255
+
+    bounds = alpha_bounds(object_img[:, :, 3])
+    if bounds is not None:
+        y0, y1, x0, x1 = bounds
+        blend_region(out, object_img[y0:y1, x0:x1], background_rgb, y0, x0)
+    return out
+
+
+def overlay_sprite_on_background(sprite, background_img, out=None):
+    """
+    Overlay a cropped sprite onto a background image at the position it was rendered at.
+
+    Gives the same result as overlay_object_on_background on the full-frame render, while only
+    touching the pixels of the sprite.
+
+    Args:
+        sprite (Sprite): Cropped object image with its offset and frame size.
+        background_img (np.ndarray): Background image to overlay onto.
+        out (np.ndarray, optional): Preallocated (H, W, 4) uint8 buffer to write the composite into.
+
+    Returns:
+        np.ndarray: Composite image with the object overlaid on the background.
+    """
+    dimx, dimy = sprite.frame_height, sprite.frame_width
+    if out is None or out.shape != (dimx, dimy, 4):
+        out = np.empty((dimx, dimy, 4), dtype=np.uint8)
+
+    background_rgb = tile_background(background_img, dimx, dimy)
+    out[:, :, 0:3] = background_rgb
+    out[:, :, 3] = 255
+    blend_region(out, sprite.image, background_rgb, sprite.y, sprite.x)
+    return out
+
+
+def composite_object(object_img, background_img, out=None):
+    """
+    Overlay a full-frame object image or a Sprite onto a background image.
+    """
+    if isinstance(object_img, Sprite):
+        return overlay_sprite_on_background(object_img, background_img, out=out)
+    return overlay_object_on_background(object_img, background_img, out=out)
+
+
+@functools.lru_cache(maxsize=8)
+def _file_keys(file_names):
+    """
+    Returns:
+        np.ndarray: Stable 64-bit hash of each file stem, as uint64.
+    """
+    return np.array([int.from_bytes(hashlib.blake2b(os.path.splitext(name)[0].encode(), digest_size=8).digest(), "little")
+                     for name in file_names], dtype=np.uint64)
+
+
+def rendezvous_index(file_names, seed, count, salt):
+    """
+    Pick a file for one composite by rendezvous (highest random weight) hashing.
+
+    Every file gets a pseudo-random score from its stem and (seed, count, salt), and the highest
+    score wins. Adding a file only changes the images where the new file scores highest, and
+    removing one only the images that picked it, unlike drawing an index into the file list.
+
+    Args:
+        file_names (list): Sorted file names to choose from.
+        seed (int): Base seed of the run.
+        count (int): Index of the composite image.
+        salt (int): Separates the choices made for the same image (object, background).
+
+    Returns:
+        int: Index into file_names.
+    """
+    digest = hashlib.blake2b(f"{seed}:{count}:{salt}".encode(), digest_size=8).digest()
+    x = _file_keys(tuple(file_names)) ^ np.uint64(int.from_bytes(digest, "little"))
+    # splitmix64 finalizer, so that every bit of the key and the image affects the score
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return int(np.argmax(x))
+
+
+def select_sources(seed, count, object_files, background_files):
+    """
+    Pick the object and background used for one composite.
+
+    The choice depends only on the run seed, the image index and the file names, so every image
+    is the same no matter how the index range is split between workers, and adding or removing a
+    render or background only changes the images that pick (or picked) it (see rendezvous_index).
+
+    Args:
+        seed (int): Base seed of the run.
+        count (int): Index of the composite image.
+        object_files (list): Sorted object image file names.
+        background_files (list): Sorted background image file names.
+
+    Returns:
+        tuple: (object_idx, background_idx)
+    """
+    return rendezvous_index(object_files, seed, count, 0), rendezvous_index(background_files, seed, count, 1)
+
+
+def create_background_bank(backgrounds_folder, background_files, size, cache):
+    """
+    Decode every background once into a shared-memory bank of RGB frames.
+
+    Args:
+        backgrounds_folder (str): Path to the folder containing background images.
+        background_files (list): Background file names, in bank order.
+        size (tuple): (width, height) every background is resized to.
+        cache (AssetCache): Cache used to decode the backgrounds.
+
+    Returns:
+        tuple: (SharedMemory block, np.ndarray view of shape (N, height, width, 3)).
+            The caller owns the block and must close and unlink it.
+    """
+    shape = (len(background_files), size[1], size[0], 3)
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+    bank = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    for idx, background_file in enumerate(background_files):
+        background_img = cache.get(os.path.join(backgrounds_folder, background_file), size)
+        bank[idx] = background_img[:, :, 0:3]
+    return shm, bank
+
+
+def read_sources(count, args, object_files, background_files, seed, cache, background_bank=None, sprite_index=None):
+    """
+    Select and load the object and background for one composite image.
+
+    Args:
+        count (int): Index of the composite image.
+        args: Command-line arguments containing paths to input/output folders.
+        object_files (list): Sorted object image file names.
+        background_files (list): Sorted background image file names.
+        seed (int): Base seed of the run.
+        cache (AssetCache): Cache of decoded object and background images.
+        background_bank (np.ndarray, optional): Pre-decoded backgrounds from create_background_bank.
+        sprite_index (dict, optional): Sprite index of args.objects_folder if it is a sprite folder.
+
+    Returns:
+        dict: Image index, decoded object (image or Sprite) and background images, frame size and
+            the source mask file name.
+    """
+    # Select an object, its mask, and a background for this image index
+    object_idx, background_idx = select_sources(seed, count, object_files, background_files)
+
+    object_file = object_files[object_idx]
+    mask_file = object_file.replace(".png", ".txt")
+    background_file = background_files[background_idx]
+
+    # Load object and background images
+    object_img = cache.get(os.path.join(args.objects_folder, object_file))
+    if sprite_index is not None:
+        object_img = sprite_from_entry(object_img, sprite_index[object_file])
+        size = (object_img.frame_width, object_img.frame_height)
+    else:
+        size = (object_img.shape[1], object_img.shape[0])
+
+    # Backgrounds in the bank are already resized to match object dimensions
+    if background_bank is not None and background_bank.shape[1:3] == (size[1], size[0]):
+        background_img = background_bank[background_idx]
+    else:
+        background_img = cache.get(os.path.join(args.backgrounds_folder, background_file), size)
+
+    return {"count": count, "object_img": object_img, "background_img": background_img, "size": size,
+            "mask_file": mask_file}
+
+
+def augment_item(item, args, seed):
+    """
+    Randomly scale, flip, rotate and translate the object of a composite, and transform its labels to match.
+
+    The transform is drawn from an RNG seeded by the run seed and the image index, so it does not
+    depend on how the work is split between workers.
+
+    Args:
+        item (dict): Composite inputs, as built by read_sources. Updated in place with the
+            transformed sprite and the label text to write.
+        args: Arguments with masks_folder, scale_range, rotation_range and flip_prob.
+        seed (int): Base seed of the run.
+
+    Returns:
+        dict: The updated item.
+    """
+    rng = np.random.default_rng([seed, item["count"], 1])
+    sprite = item["object_img"]
+    if not isinstance(sprite, Sprite):
+        sprite = crop_to_alpha(sprite)
+    labels = read_yolo_label(args.masks_folder, item["mask_file"])
+    sprite, labels = augment_sprite(rng, sprite, labels, args.scale_range, args.rotation_range, args.flip_prob)
+    item["object_img"] = sprite
+    item["labels"] = labels
+    return item
+
+
+def write_outputs(item, args, write_params, shard_writer=None):
+    """
+    Encode a composite image and propagate its source mask file next to it.
+
+    Depending on args.label_mode the mask file is copied, hardlinked, or left to the label
+    manifest that generate_composite_images writes at the end of the run. Augmented composites
+    get their transformed labels written instead. With a shard writer, the image and its label
+    are appended to the shards as `image_XXXXX.png` and `image_XXXXX.txt` instead.
+
+    Args:
+        item (dict): Composite image and source mask file name, as built by composite_range.
+        args: Command-line arguments containing paths to input/output folders.
+        write_params (list): Parameters passed to cv2.imwrite.
+        shard_writer (ShardWriter, optional): Writer of the tar shards to store the sample in.
+    """
+    count = item["count"]
+
+    if shard_writer is not None:
+        ok, png = cv2.imencode(".png", item["composite_img"], write_params)
+        if not ok:
+            raise ValueError(f"Could not encode image {count + 1}")
+        if "labels" in item:
+            label = format_yolo_label(item["labels"]).encode()
+        else:
+            with open(os.path.join(args.masks_folder, item["mask_file"]), 'rb') as mask_file_content:
+                label = mask_file_content.read()
+        shard_writer.write(f"image_{count + 1:05d}", {"png": png.tobytes(), "txt": label})
+        return
+
+    # Save the new image
+    output_image_path = os.path.join(args.output_images_folder, f"image_{count + 1:05d}.png")
+    cv2.imwrite(output_image_path, item["composite_img"], write_params)
+
+    output_mask_path = os.path.join(args.output_masks_folder, f"image_{count + 1:05d}.txt")
+    # Labels are replaced rather than written in place, as an earlier hardlink run may have linked them to the sources
+    if "labels" in item:
+        replace_text(output_mask_path, format_yolo_label(item["labels"]))
+        return
+
+    # The object pixels do not move, so the source mask applies unchanged
+    if args.label_mode == "manifest":
+        return
+    source_mask_path = os.path.join(args.masks_folder, item["mask_file"])
+    if args.label_mode == "hardlink":
+        link_or_copy(source_mask_path, output_mask_path)
+        return
+
+    # Copy the corresponding mask .txt file to the new folder
+    with open(source_mask_path, 'r') as mask_file_content:
+        mask_data = mask_file_content.read()
+    replace_text(output_mask_path, mask_data)
+
+
+def composite_range(counts, args, object_files, background_files, seed, cache, background_bank=None, sprite_index=None,
+                    shard_prefix="shards_00"):
+    """
+    Generate the composite images and masks for a range of image indices.
+
+    The work is split into read, composite and write stages. With args.pipeline the stages run
+    concurrently on their own threads joined by bounded queues; otherwise they run one after the
+    other for each image. Either way every stage is timed.
+
+    With args.shard_mb set, the range is written to its own series of tar shards in
+    args.output_images_folder. In pipeline mode the samples are appended in the order they finish,
+    which is not necessarily the order of their indices.
+
+    Args:
+        counts (range): Image indices to generate.
+        args: Command-line arguments containing paths to input/output folders.
+        object_files (list): Sorted object image file names.
+        background_files (list): Sorted background image file names.
+        seed (int): Base seed of the run.
+        cache (AssetCache): Cache of decoded object and background images.
+        background_bank (np.ndarray, optional): Pre-decoded backgrounds from create_background_bank.
+        sprite_index (dict, optional): Sprite index of args.objects_folder if it is a sprite folder.
+        shard_prefix (str): File name prefix of the shards of this range.
+
+    Returns:
+        list: Stage.stats() of the read, composite and write stages.
+    """
+    if args.shard_mb is None:
+        return _composite_range(counts, args, object_files, background_files, seed, cache, background_bank,
+                                sprite_index)
+    with ShardWriter(args.output_images_folder, shard_prefix, args.shard_mb * 2**20) as shard_writer:
+        return _composite_range(counts, args, object_files, background_files, seed, cache, background_bank,
+                                sprite_index, shard_writer)
+
+
+def _composite_range(counts, args, object_files, background_files, seed, cache, background_bank=None,
+                     sprite_index=None, shard_writer=None):
+    write_params = []
+    if args.png_compression is not None:
+        write_params = [cv2.IMWRITE_PNG_COMPRESSION, args.png_compression]
+
+    def read(count):
+        return read_sources(count, args, object_files, background_files, seed, cache, background_bank, sprite_index)
+
+    if not args.pipeline:
+        composite_buffer = None
+
+        def composite(item):
+            nonlocal composite_buffer
+            if args.augment:
+                augment_item(item, args, seed)
+            composite_buffer = composite_object(item["object_img"], item["background_img"], out=composite_buffer)
+            item["composite_img"] = composite_buffer
+            return item
+
+        stages = [
+            Stage("read", read),
+            Stage("composite", composite),
+            Stage("write", lambda item: write_outputs(item, args, write_params, shard_writer)),
+        ]
+        for count in counts:
+            item = count
+            for stage in stages:
+                item = stage(item)
+        return [stage.stats() for stage in stages]
+
+    # Composites wait in the write queue, so the pool needs a buffer for every slot that can hold one
+    buffers = BufferPool(args.queue_size + args.composite_threads + args.encode_threads)
+
+    def composite(item):
+        if args.augment:
+            augment_item(item, args, seed)
+        width, height = item["size"]
+        out = buffers.acquire((height, width, 4))
+        try:
+            item["composite_img"] = composite_object(item["object_img"], item["background_img"], out=out)
+        except BaseException:
+            buffers.release(out)
+            raise
+        return item
+
+    def write(item):
+        try:
+            write_outputs(item, args, write_params, shard_writer)
+        finally:
+            buffers.release(item["composite_img"])
+
+    stages = [
+        Stage("read", read, args.decode_threads),
+        Stage("composite", composite, args.composite_threads),
+        Stage("write", write, args.encode_threads, discard=lambda item: buffers.release(item["composite_img"])),
+    ]
+    run_pipeline(counts, stages, args.queue_size)
+    return [stage.stats() for stage in stages]
+
+
+# Per-process state for pool workers, filled in by _init_worker
+_worker_state = {}
+
+
+def _init_worker(args, object_files, background_files, seed, bank_name, bank_shape, sprite_index):
+    shm = shared_memory.SharedMemory(name=bank_name)
+    _worker_state.update(
+        args=args,
+        object_files=object_files,
+        background_files=background_files,
+        seed=seed,
+        sprite_index=sprite_index,
+        shm=shm,
+        cache=AssetCache(args.cache_mb * 2**20, reduced_decode=not args.full_decode),
+        background_bank=np.ndarray(bank_shape, dtype=np.uint8, buffer=shm.buf),
+    )
+
+
+def _composite_shard(task):
+    worker, counts = task
+    state = _worker_state
+    cache = state["cache"]
+    hits, misses = cache.hits, cache.misses
+    stage_stats = composite_range(counts, state["args"], state["object_files"], state["background_files"],
+                                  state["seed"], cache, state["background_bank"], state["sprite_index"],
+                                  f"shards_{worker:02d}")
+    return cache.hits - hits, cache.misses - misses, stage_stats
 
 
 def generate_composite_images(args):
     """
     Generate composite images by overlaying objects on backgrounds and save corresponding masks.
 
+    With more than one worker, the backgrounds are decoded once into a shared-memory bank and each
+    worker process composites its own contiguous slice of the image indices. Image selection is
+    seeded per index, so the output is identical for any number of workers.
+
+    Incremental runs keep a content manifest (see ContentManifest) in the output masks folder and
+    only generate the images whose object, label or background changed or that did not exist yet.
+    Images past --num_images are deleted. Sources are picked by rendezvous hashing of their names,
+    so adding or removing renders or backgrounds only changes the sources of the images that pick them.
+
     Args:
         args: Command-line arguments containing paths to input/output folders.
     """
     # Create output directories if they don't exist
     os.makedirs(args.output_images_folder, exist_ok=True)
-    os.makedirs(args.output_masks_folder, exist_ok=True)
+    if args.shard_mb is None:
+        os.makedirs(args.output_masks_folder, exist_ok=True)
+    else:
+        # Each worker writes its own shards, so shards of an earlier run with more workers would be left over
+        removed = remove_shards(args.output_images_folder)
+        if removed:
+            print(f"Removed {removed} shard and index files of an earlier run.")
 
-    # Get a list of files
-    object_files = [f for f in os.listdir(args.objects_folder) if f.endswith((".png", ".jpg"))]
+    # Get a sorted list of files so that selection does not depend on directory order
+    sprite_index = load_sprite_index(args.objects_folder)
+    if sprite_index is not None:
+        object_files = sorted(sprite_index)
+    else:
+        object_files = sorted(f for f in os.listdir(args.objects_folder) if f.endswith((".png", ".jpg")))
     mask_files = [f for f in os.listdir(args.masks_folder) if f.endswith(".txt")]
-    background_files = [f for f in os.listdir(args.backgrounds_folder) if f.endswith((".jpg", ".png"))]
+    background_files = sorted(f for f in os.listdir(args.backgrounds_folder) if f.endswith((".jpg", ".png")))
 
     # Check if object and mask lists are aligned
     assert len(object_files) == len(mask_files), "Mismatch between object and mask counts!"
 
-    # Generate images
-    start_time = time.time()
-    for count in range(args.num_images):
-        # Randomly select an object, its mask, and a background
-        object_idx = random.randint(0, len(object_files) - 1)
-        background_idx = random.randint(0, len(background_files) - 1)
+    seed = args.seed if args.seed is not None else random.randrange(2**32)
+    print(f"Using seed {seed}.")
 
-        object_file = object_files[object_idx]
-        mask_file = object_file.replace(".png", ".txt")
-        background_file = background_files[background_idx]
+    start_time = time.time()
+    counts = range(args.num_images)
+    if args.incremental:
+        settings = {name: getattr(args, name) for name in OUTPUT_SETTINGS}
+        settings.update({folder: os.path.abspath(getattr(args, folder)) for folder in
+                         ["objects_folder", "masks_folder", "backgrounds_folder", "output_images_folder"]})
+        manifest = ContentManifest(os.path.join(args.output_masks_folder, COMPOSITES_MANIFEST), settings)
 
-        # Load object and background images
-        object_img = cv2.imread(os.path.join(args.objects_folder, object_file), cv2.IMREAD_UNCHANGED)
-        background_img = cv2.imread(os.path.join(args.backgrounds_folder, background_file), cv2.IMREAD_UNCHANGED)
+        def sources(count):
+            object_idx, background_idx = select_sources(seed, count, object_files, background_files)
+            paths = [os.path.join(args.objects_folder, object_files[object_idx]),
+                     os.path.join(args.masks_folder, object_files[object_idx].replace(".png", ".txt")),
+                     os.path.join(args.backgrounds_folder, background_files[background_idx])]
+            if sprite_index is not None:
+                paths.append(os.path.join(args.objects_folder, SPRITE_INDEX))
+            return [os.path.abspath(path) for path in paths]
 
-        # Resize background to match object dimensions
-        background_img = cv2.resize(background_img, (object_img.shape[1], object_img.shape[0]))
+        pruned = manifest.prune(f"image_{count + 1:05d}" for count in counts)
+        counts = [count for count in counts if not manifest.is_current(f"image_{count + 1:05d}", sources(count))]
+        invalidated = sum(f"image_{count + 1:05d}" in manifest.outputs for count in counts)
+        print(f"{args.num_images - len(counts)} images are up to date ({manifest.hashed} sources hashed), "
+              f"{len(counts)} to generate ({invalidated} invalidated, {len(counts) - invalidated} new), {pruned} removed.")
 
-        # Overlay the object on the background
-        composite_img = overlay_object_on_background(object_img.copy(), background_img)
+    # Generate images
+    cache = AssetCache(args.cache_mb * 2**20, reduced_decode=not args.full_decode)
+    workers = max(1, min(args.workers, len(counts)))
+    if workers == 1:
+        stage_stats = composite_range(counts, args, object_files, background_files, seed, cache,
+                                      sprite_index=sprite_index)
+    else:
+        # All renders share one frame size, so the bank is sized from the first object image
+        if sprite_index is not None:
+            first_entry = sprite_index[object_files[0]]
+            size = (first_entry["frame_width"], first_entry["frame_height"])
+        else:
+            first_object = cache.get(os.path.join(args.objects_folder, object_files[0]))
+            size = (first_object.shape[1], first_object.shape[0])
+        shm, bank = create_background_bank(args.backgrounds_folder, background_files, size, cache)
+        try:
+            bounds = np.linspace(0, len(counts), workers + 1).astype(int)
+            shards = [(k, counts[bounds[k]:bounds[k + 1]]) for k in range(workers)]
+            initargs = (args, object_files, background_files, seed, shm.name, bank.shape, sprite_index)
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+                shard_stats = []
+                for hits, misses, stats in pool.imap_unordered(_composite_shard, shards):
+                    cache.hits += hits
+                    cache.misses += misses
+                    shard_stats.append(stats)
+            stage_stats = merge_stage_stats(*shard_stats)
+        finally:
+            del bank
+            shm.close()
+            shm.unlink()
 
-        # Save the new image
-        output_image_path = os.path.join(args.output_images_folder, f"image_{count + 1:05d}.png")
-        cv2.imwrite(output_image_path, composite_img)
+    if args.label_mode == "manifest":
+        # Selection depends only on (seed, index), so the manifest is rebuilt without the workers
+        entries = []
+        for count in range(args.num_images):
+            object_idx, _ = select_sources(seed, count, object_files, background_files)
+            mask_file = object_files[object_idx].replace(".png", ".txt")
+            entries.append((f"image_{count + 1:05d}.txt", os.path.join(args.masks_folder, mask_file)))
+        write_label_manifest(args.output_masks_folder, entries)
 
-        # Copy the corresponding mask .txt file to the new folder
-        output_mask_path = os.path.join(args.output_masks_folder, f"image_{count + 1:05d}.txt")
-        with open(os.path.join(args.masks_folder, mask_file), 'r') as mask_file_content:
-            mask_data = mask_file_content.read()
-        with open(output_mask_path, 'w') as output_mask_file:
-            output_mask_file.write(mask_data)
+    if args.incremental:
+        for count in counts:
+            name = f"image_{count + 1:05d}"
+            manifest.record(name, sources(count), [os.path.abspath(os.path.join(args.output_images_folder, name + ".png")),
+                                                   os.path.abspath(os.path.join(args.output_masks_folder, name + ".txt"))])
+        manifest.save()
 
     end_time = time.time()
-    print(f"Generated {args.num_images} images and masks in {end_time - start_time:.2f} seconds.")
+    print(f"Generated {len(counts)} images and masks in {end_time - start_time:.2f} seconds.")
+    if args.shard_mb is not None:
+        print(f"Wrote {len(list_shards(args.output_images_folder))} shards to {args.output_images_folder}.")
+    print(cache.summary())
+    print(format_stage_report(stage_stats, end_time - start_time))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate composite images by overlaying objects on backgrounds.")
-    parser.add_argument("objects_folder", type=str, help="Path to the folder containing object images.")
+    parser.add_argument("objects_folder", type=str, help="Path to the folder containing object images, or sprites made by sprites.py.")
     parser.add_argument("masks_folder", type=str, help="Path to the folder containing YOLO-style mask files.")
     parser.add_argument("backgrounds_folder", type=str, help="Path to the folder containing background images.")
-    parser.add_argument("output_images_folder", type=str, help="Path to save composite images.")
-    parser.add_argument("output_masks_folder", type=str, help="Path to save copied YOLO-style masks.")
+    parser.add_argument("output_images_folder", type=str, help="Path to save composite images (or their shards with --shard_mb).")
+    parser.add_argument("output_masks_folder", type=str, help="Path to save copied YOLO-style masks (unused with --shard_mb).")
     parser.add_argument("--num_images", type=int, default=10000, help="Number of images to generate.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes to composite with.")
+    parser.add_argument("--cache_mb", type=int, default=1024, help="Memory limit of the decoded image cache, per process, in MiB.")
+    parser.add_argument("--full_decode", action="store_true", help="Decode backgrounds at full resolution before resizing.")
+    parser.add_argument("--label_mode", choices=["copy", "hardlink", "manifest"], default="copy",
+                        help="Copy each source mask file, hardlink it, or write a single labels_manifest.csv instead.")
+    parser.add_argument("--augment", action="store_true",
+                        help="Randomly scale, flip, rotate and move each object in-plane and transform its labels to match.")
+    parser.add_argument("--scale_range", type=float, nargs=2, default=SCALE_RANGE, metavar=("MIN", "MAX"),
+                        help="Range of the --augment scale factor.")
+    parser.add_argument("--rotation_range", type=float, nargs=2, default=ROTATION_RANGE, metavar=("MIN", "MAX"),
+                        help="Range of the --augment rotation in degrees.")
+    parser.add_argument("--flip_prob", type=float, default=FLIP_PROB, help="Probability of a horizontal flip with --augment.")
+    parser.add_argument("--pipeline", action="store_true", help="Run the read, composite and write stages concurrently on threads.")
+    parser.add_argument("--decode_threads", type=int, default=2, help="Read/decode threads in --pipeline mode.")
+    parser.add_argument("--composite_threads", type=int, default=2, help="Compositing threads in --pipeline mode.")
+    parser.add_argument("--encode_threads", type=int, default=4, help="PNG encode/write threads in --pipeline mode.")
+    parser.add_argument("--queue_size", type=int, default=16, help="Capacity of each queue between pipeline stages.")
+    parser.add_argument("--png_compression", type=int, default=None, choices=range(10), metavar="[0-9]",
+                        help="zlib level for the output PNGs (OpenCV default if not given).")
+    parser.add_argument("--shard_mb", type=int, default=None,
+                        help="Write images and labels into tar shards of at most this many MiB instead of loose files.")
+    parser.add_argument("--seed", type=int, default=None, help="Base seed for image selection (random if not given).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only generate images whose sources changed since the last incremental run, and remove images past --num_images.")
 
     args = parser.parse_args()
+    if args.augment and args.label_mode != "copy":
+        parser.error("--augment writes transformed labels, so it needs --label_mode copy")
+    if args.shard_mb is not None and args.label_mode != "copy":
+        parser.error("--shard_mb stores a copy of each label in the shards, so it needs --label_mode copy")
+    if args.incremental and (args.seed is None or args.shard_mb is not None):
+        parser.error("--incremental needs a fixed --seed and loose output files (no --shard_mb)")
     generate_composite_images(args)
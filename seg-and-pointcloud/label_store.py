@@ -0,0 +1,451 @@
+import os
+import time
+import argparse
+
+import numpy as np
+
+from export_coco import write_coco
+from labels import list_labels, load_label_manifest, parse_yolo_label, replace_file, replace_text, resolve_label_path
+
+# Default file name of a label store
+LABEL_STORE = "labels.npz"
+# Text formats a label store can be written out in (COCO is written as one JSON file, see export_coco)
+VIEWS = ["yolo", "bbox", "segment"]
+
+
+class LabelStore:
+    """
+    The labels of a whole dataset in a handful of numpy columns, saved as a single .npz file.
+
+    There is one row per image (name, source label file, split) and one row per label line
+    (image row, class ID, normalized bbox and the span of its polygon in one shared point array).
+    Label files in a particular format are views of the same columns that are only formatted
+    when they are read or exported, so dropping the bbox, going back to the full labels or
+    producing COCO boxes never modifies the store.
+
+    Args:
+        names (np.ndarray): (I,) image names, e.g. "image_00001".
+        sources (np.ndarray): (I,) label file each image's labels were read from.
+        splits (np.ndarray): (I,) split of each image, e.g. "train" or "val".
+        image_index (np.ndarray): (N,) image row of each label.
+        class_id (np.ndarray): (N,) class ID of each label.
+        bbox (np.ndarray): (N, 4) normalized (center_x, center_y, width, height) of each label.
+        polygon_start (np.ndarray): (N + 1,) offsets of each label's polygon in `points`.
+        points (np.ndarray): (M, 2) normalized polygon points of all labels.
+    """
+
+    COLUMNS = ["names", "sources", "splits", "image_index", "class_id", "bbox", "polygon_start", "points"]
+
+    def __init__(self, names, sources, splits, image_index, class_id, bbox, polygon_start, points):
+        self.names = np.asarray(names, dtype=str)
+        self.sources = np.asarray(sources, dtype=str)
+        self.splits = np.asarray(splits, dtype=str)
+        self.image_index = np.asarray(image_index, dtype=np.int64)
+        self.class_id = np.asarray(class_id, dtype=np.int64)
+        self.bbox = np.asarray(bbox, dtype=np.float64).reshape(-1, 4)
+        self.polygon_start = np.asarray(polygon_start, dtype=np.int64)
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self._rows = None
+
+    @classmethod
+    def from_folder(cls, label_folder, split="train"):
+        """
+        Read every YOLO label of a folder (following its label manifest, if any).
+
+        Args:
+            label_folder (str): Folder containing YOLO label files and/or a label manifest.
+            split (str): Split to assign to the images.
+
+        Returns:
+            LabelStore
+        """
+        manifest = load_label_manifest(label_folder)
+        names, sources, image_index, class_id, bbox, polygon_sizes, points = [], [], [], [], [], [], []
+        for label_name in list_labels(label_folder):
+            source_path = resolve_label_path(label_folder, label_name, manifest)
+            with open(source_path, "r") as f:
+                labels = parse_yolo_label(f.read())
+            for label in labels:
+                image_index.append(len(names))
+                class_id.append(label.class_id)
+                bbox.append(label.bbox)
+                polygon_sizes.append(len(label.polygon))
+                points.append(label.polygon)
+            names.append(os.path.splitext(label_name)[0])
+            sources.append(os.path.abspath(source_path))
+        polygon_start = np.concatenate([[0], np.cumsum(polygon_sizes, dtype=np.int64)])
+        return cls(names, sources, [split] * len(names), image_index, class_id, bbox, polygon_start,
+                   np.concatenate(points) if points else np.zeros((0, 2)))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns:
+            LabelStore: The store saved at `path`.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            return cls(*(data[column] for column in cls.COLUMNS))
+
+    def save(self, path):
+        """
+        Save the store as a compressed .npz file.
+
+        Args:
+            path (str): File to write; written to a temporary file first, so an existing store is
+                only replaced once the new one is complete.
+        """
+        # np.savez adds ".npz" to names without it, so the temporary name keeps the extension
+        replace_file(path, lambda temp_path: np.savez_compressed(temp_path, **{column: getattr(self, column) for column in self.COLUMNS}),
+                     ".tmp.npz")
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def label_count(self):
+        return len(self.class_id)
+
+    def _label_rows(self):
+        # Labels are stored grouped by image, so each image's labels are one slice
+        if self._rows is None:
+            order = np.argsort(self.image_index, kind="stable")
+            bounds = np.searchsorted(self.image_index[order], np.arange(len(self.names) + 1))
+            self._rows = (order, bounds)
+        return self._rows
+
+    def select(self, mask):
+        """
+        Keep a subset of the images together with their labels.
+
+        Args:
+            mask (np.ndarray): (I,) boolean mask or array of image rows to keep.
+
+        Returns:
+            LabelStore
+        """
+        keep = np.zeros(len(self.names), dtype=bool)
+        keep[mask] = True
+        new_row = np.cumsum(keep) - 1
+        label_keep = keep[self.image_index]
+        sizes = np.diff(self.polygon_start)[label_keep]
+        point_keep = np.repeat(label_keep, np.diff(self.polygon_start))
+        return LabelStore(self.names[keep], self.sources[keep], self.splits[keep],
+                          new_row[self.image_index[label_keep]], self.class_id[label_keep], self.bbox[label_keep],
+                          np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]), self.points[point_keep])
+
+    def split(self, name):
+        """
+        Returns:
+            LabelStore: The images of one split.
+        """
+        return self.select(self.splits == name)
+
+    @staticmethod
+    def concatenate(stores):
+        """
+        Join several stores, e.g. the train, val and test labels of a dataset.
+
+        Args:
+            stores (list): LabelStore instances. An image name may only repeat in different splits.
+
+        Returns:
+            LabelStore
+        """
+        names = np.concatenate([store.names for store in stores])
+        splits = np.concatenate([store.splits for store in stores])
+        if len(np.unique(np.char.add(np.char.add(splits, "/"), names))) != len(names):
+            raise ValueError("Image names repeat within a split; renumber them first")
+        image_offsets = np.cumsum([0] + [len(store) for store in stores])
+        point_offsets = np.cumsum([0] + [len(store.points) for store in stores])
+        return LabelStore(
+            names,
+            np.concatenate([store.sources for store in stores]),
+            splits,
+            np.concatenate([store.image_index + offset for store, offset in zip(stores, image_offsets)]),
+            np.concatenate([store.class_id for store in stores]),
+            np.concatenate([store.bbox for store in stores]),
+            np.concatenate([[0]] + [store.polygon_start[1:] + offset for store, offset in zip(stores, point_offsets)]),
+            np.concatenate([store.points for store in stores]))
+
+    def renumber(self, prefix="image", start=1):
+        """
+        Rename the images to `<prefix>_<number>` in row order, like merge_test_val.py names files.
+
+        Args:
+            prefix (str): Name prefix.
+            start (int): Number of the first image.
+
+        Returns:
+            LabelStore: The renamed store (the columns are shared, not copied).
+        """
+        numbers = np.char.zfill(np.arange(start, start + len(self.names)).astype(str), 5)
+        return self.rename(np.char.add(prefix + "_", numbers))
+
+    def rename(self, names, split=None):
+        """
+        Give the images new names, and optionally move them all to one split.
+
+        Args:
+            names (np.ndarray): (I,) new image names, in row order.
+            split (str, optional): New split of every image. The splits are kept if None.
+
+        Returns:
+            LabelStore: The renamed store (the label columns are shared, not copied).
+        """
+        splits = self.splits if split is None else [split] * len(self.names)
+        return LabelStore(names, self.sources, splits, self.image_index, self.class_id, self.bbox,
+                          self.polygon_start, self.points)
+
+    def pixel_boxes(self, width, height):
+        """
+        Convert every bbox to (x_min, y_min, width, height) in pixels at once, as COCO stores them.
+
+        Args:
+            width (int): Frame width.
+            height (int): Frame height.
+
+        Returns:
+            np.ndarray: (N, 4) boxes.
+        """
+        boxes = self.bbox * (width, height, width, height)
+        boxes[:, :2] -= boxes[:, 2:] / 2
+        return boxes
+
+    def polygon_areas(self, width, height):
+        """
+        Compute the area of every polygon at once (shoelace formula over the shared point array).
+
+        Args:
+            width (int): Frame width.
+            height (int): Frame height.
+
+        Returns:
+            np.ndarray: (N,) areas in square pixels; 0 for labels without a polygon.
+        """
+        points = self.points * (width, height)
+        areas = np.zeros(len(self.class_id))
+        sizes = np.diff(self.polygon_start)
+        has_polygon = sizes > 0
+        if not len(points):
+            return areas
+        # The next point of the last point of each polygon is its first point
+        next_index = np.arange(1, len(points) + 1)
+        ends = self.polygon_start[1:][has_polygon]
+        next_index[ends - 1] = self.polygon_start[:-1][has_polygon]
+        next_points = points[next_index]
+        cross = points[:, 0] * next_points[:, 1] - points[:, 1] * next_points[:, 0]
+        areas[has_polygon] = 0.5 * np.abs(np.add.reduceat(cross, self.polygon_start[:-1][has_polygon]))
+        return areas
+
+    def _format_values(self, view, decimals):
+        """Format the numbers of every label for a view in one pass, returning one string per label."""
+        def to_strings(values):
+            if decimals is None:
+                return values.astype(str)
+            return np.char.mod(f"%.{decimals}f", values)
+
+        columns = [self.class_id.astype(str)]
+        if view in ("yolo", "bbox"):
+            columns.append(np.array([" ".join(row) for row in to_strings(self.bbox)], dtype=object))
+        if view in ("yolo", "segment"):
+            point_strings = to_strings(self.points.reshape(-1))
+            starts = self.polygon_start * 2
+            columns.append(np.array([" ".join(point_strings[starts[i]:starts[i + 1]])
+                                     for i in range(len(self.class_id))], dtype=object))
+        lines = []
+        for parts in zip(*columns):
+            lines.append(" ".join(part for part in parts if part))
+        if view == "segment":
+            # Like remove_bbox.py, labels without a polygon have no segment line
+            has_polygon = np.diff(self.polygon_start) > 0
+            lines = [line if keep else None for line, keep in zip(lines, has_polygon)]
+        return lines
+
+    def iter_text(self, view="yolo", decimals=None):
+        """
+        Produce the label file content of every image in a format.
+
+        Args:
+            view (str): "yolo" (bbox and polygon, as written by gen_masks.py), "bbox" (bbox only) or
+                "segment" (polygon only, as written by remove_bbox.py).
+            decimals (int, optional): Fixed number of decimal places; shortest exact form if None.
+
+        Yields:
+            tuple: (image name, label file content).
+        """
+        if view not in VIEWS:
+            raise ValueError(f"Unknown view {view}, expected one of {VIEWS}")
+        lines = self._format_values(view, decimals)
+        order, bounds = self._label_rows()
+        for row, name in enumerate(self.names):
+            yield name, "".join(lines[i] + "\n" for i in order[bounds[row]:bounds[row + 1]] if lines[i] is not None)
+
+    def iter_coco(self, width, height, image_extension=".png"):
+        """
+        Produce the COCO image and annotation entries of every image, one image at a time.
+
+        Boxes and areas are converted for all labels at once (see pixel_boxes and polygon_areas);
+        only the entries of the image being yielded are built. Labels without a polygon get the
+        area of their box and an empty segmentation.
+
+        Args:
+            width (int): Frame width of the images.
+            height (int): Frame height of the images.
+            image_extension (str): Extension of the image files.
+
+        Yields:
+            tuple: (image entry, list of its annotation entries), with IDs counted from 1 in row order.
+        """
+        boxes = self.pixel_boxes(width, height)
+        areas = self.polygon_areas(width, height)
+        has_polygon = np.diff(self.polygon_start) > 0
+        areas[~has_polygon] = boxes[~has_polygon, 2] * boxes[~has_polygon, 3]
+        points = self.points * (width, height)
+        order, bounds = self._label_rows()
+        annotation_id = 0
+        for row, name in enumerate(self.names):
+            annotations = []
+            for i in order[bounds[row]:bounds[row + 1]]:
+                annotation_id += 1
+                polygon = points[self.polygon_start[i]:self.polygon_start[i + 1]]
+                annotations.append({
+                    "id": annotation_id,
+                    "image_id": row + 1,
+                    "category_id": int(self.class_id[i]),
+                    "bbox": boxes[i].tolist(),
+                    "area": float(areas[i]),
+                    "iscrowd": 0,
+                    "segmentation": [polygon.reshape(-1).tolist()] if len(polygon) else [],
+                })
+            yield {"id": row + 1, "file_name": name + image_extension, "width": width, "height": height}, annotations
+
+    def export_coco(self, output_path, width, height, names=None, image_extension=".png"):
+        """
+        Write the store as a COCO instance segmentation file, in the layout of export_coco.py.
+
+        The file is written while the entries are produced (see iter_coco), images first and
+        annotations second, so the entries are produced twice rather than held in memory.
+
+        Args:
+            output_path (str): COCO JSON file to write.
+            width (int): Frame width of the images.
+            height (int): Frame height of the images.
+            names (list, optional): Category names indexed by class ID. The ID is used as name if not given.
+            image_extension (str): Extension of the image files.
+
+        Returns:
+            int: Number of annotations written.
+        """
+        entries = lambda: self.iter_coco(width, height, image_extension)
+        write_coco(output_path, (image for image, _ in entries()),
+                   (annotation for _, annotations in entries() for annotation in annotations),
+                   np.unique(self.class_id).tolist(), names)
+        return len(self.class_id)
+
+    def text(self, name, view="yolo", decimals=None, split=None):
+        """
+        Format the labels of a single image (see iter_text).
+
+        Args:
+            name (str): Image name.
+            view (str): Format of the labels.
+            decimals (int, optional): Fixed number of decimal places; shortest exact form if None.
+            split (str, optional): Split of the image, needed if the name occurs in several splits.
+
+        Returns:
+            str: Label file content.
+        """
+        found = self.names == name
+        if split is not None:
+            found &= self.splits == split
+        rows = np.flatnonzero(found)
+        if len(rows) != 1:
+            raise KeyError(f"{name} is in {len(rows)} splits" if len(rows) else name)
+        return next(self.select(rows).iter_text(view, decimals))[1]
+
+    def export(self, label_folder, view="yolo", decimals=None):
+        """
+        Write the store out as one YOLO label file per image.
+
+        Args:
+            label_folder (str): Folder to write `<name>.txt` files to.
+            view (str): Format of the files (see iter_text).
+            decimals (int, optional): Fixed number of decimal places; shortest exact form if None.
+
+        Returns:
+            int: Number of files written.
+        """
+        os.makedirs(label_folder, exist_ok=True)
+        written = 0
+        for name, text in self.iter_text(view, decimals):
+            # Replaced rather than modified, so labels hardlinked from another dataset are not changed
+            replace_text(os.path.join(label_folder, name + ".txt"), text)
+            written += 1
+        return written
+
+    def summary(self):
+        """
+        Returns:
+            str: Image and label counts per split.
+        """
+        lines = [f"{len(self.names)} images, {len(self.class_id)} labels, {len(self.points)} polygon points"]
+        label_splits = self.splits[self.image_index]
+        for split in np.unique(self.splits):
+            lines.append(f"  {split}: {np.sum(self.splits == split)} images, {np.sum(label_splits == split)} labels")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, inspect and export columnar label stores.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Read YOLO label folders into a label store.")
+    build_parser.add_argument("store_path", type=str, help="Label store to write.")
+    build_parser.add_argument("label_folders", type=str, nargs="+", help="Folders containing YOLO label files.")
+    build_parser.add_argument("--splits", type=str, nargs="+", default=None,
+                              help="Split of each label folder (defaults to the folder name).")
+
+    export_parser = subparsers.add_parser("export", help="Write a label store out as YOLO label files.")
+    export_parser.add_argument("store_path", type=str, help="Label store to read.")
+    export_parser.add_argument("label_folder", type=str, help="Folder to write the label files to.")
+    export_parser.add_argument("--view", choices=VIEWS, default="yolo", help="Format of the label files.")
+    export_parser.add_argument("--split", type=str, default=None, help="Only export the images of this split.")
+    export_parser.add_argument("--decimals", type=int, default=None, help="Fixed number of decimal places.")
+
+    coco_parser = subparsers.add_parser("coco", help="Write a label store out as a COCO JSON file.")
+    coco_parser.add_argument("store_path", type=str, help="Label store to read.")
+    coco_parser.add_argument("output_path", type=str, help="COCO JSON file to write.")
+    coco_parser.add_argument("--width", type=int, default=1280, help="Frame width of the images.")
+    coco_parser.add_argument("--height", type=int, default=1024, help="Frame height of the images.")
+    coco_parser.add_argument("--split", type=str, default=None, help="Only export the images of this split.")
+    coco_parser.add_argument("--names", type=str, nargs="+", default=None, help="Category names, indexed by class ID.")
+    coco_parser.add_argument("--image_extension", type=str, default=".png", help="Extension of the image files.")
+
+    info_parser = subparsers.add_parser("info", help="Print the image and label counts of a label store.")
+    info_parser.add_argument("store_path", type=str, help="Label store to read.")
+
+    args = parser.parse_args()
+    start_time = time.time()
+    if args.command == "build":
+        splits = args.splits or [os.path.basename(os.path.normpath(folder)) for folder in args.label_folders]
+        if len(splits) != len(args.label_folders):
+            parser.error("--splits needs one split per label folder")
+        store = LabelStore.concatenate([LabelStore.from_folder(folder, split)
+                                        for folder, split in zip(args.label_folders, splits)])
+        store.save(args.store_path)
+        print(store.summary())
+    elif args.command == "export":
+        store = LabelStore.load(args.store_path)
+        if args.split is not None:
+            store = store.split(args.split)
+        written = store.export(args.label_folder, args.view, args.decimals)
+        print(f"Wrote {written} {args.view} label files to {args.label_folder}.")
+    elif args.command == "coco":
+        store = LabelStore.load(args.store_path)
+        if args.split is not None:
+            store = store.split(args.split)
+        written = store.export_coco(args.output_path, args.width, args.height, args.names, args.image_extension)
+        print(f"Exported {len(store)} images and {written} annotations to {args.output_path}.")
+    else:
+        print(LabelStore.load(args.store_path).summary())
+    print(f"Done in {time.time() - start_time:.2f} seconds.")
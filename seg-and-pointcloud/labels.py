@@ -0,0 +1,189 @@
+import csv
+import os
+import shutil
+from collections import namedtuple
+
+import numpy as np
+
+# Name of the manifest written in place of per-image label files
+LABEL_MANIFEST = "labels_manifest.csv"
+
+
+def replace_file(file_path, write, suffix=".tmp"):
+    """
+    Replace a file with new content, atomically.
+
+    The content is written to a temporary file that is renamed over the old one, so a reader never
+    sees a partial file, and a label hardlinked from another dataset is unlinked rather than modified.
+
+    Args:
+        file_path (str): File to replace.
+        write (callable): Writes the new content to the temporary path it is given.
+        suffix (str): Suffix of the temporary file name.
+    """
+    temp_path = file_path + suffix
+    write(temp_path)
+    os.replace(temp_path, file_path)
+
+
+def replace_text(file_path, text):
+    """
+    Replace a file with the given text (see replace_file).
+
+    Args:
+        file_path (str): File to replace.
+        text (str): New content.
+    """
+    def write(temp_path):
+        with open(temp_path, "w") as file:
+            file.write(text)
+    replace_file(file_path, write)
+
+
+def link_or_copy(source_path, destination_path):
+    """
+    Hardlink a file to a new name, falling back to a copy when a link is not possible.
+
+    Args:
+        source_path (str): Existing file.
+        destination_path (str): New name. Replaced if it already exists.
+    """
+    if os.path.lexists(destination_path):
+        os.remove(destination_path)
+    try:
+        os.link(source_path, destination_path)
+    except OSError:
+        # e.g. source and destination are on different filesystems
+        shutil.copyfile(source_path, destination_path)
+
+
+def write_label_manifest(label_folder, entries):
+    """
+    Write a manifest mapping label file names to the source label files they share.
+
+    Source paths are stored relative to the label folder, so the folder can be moved together
+    with its sources.
+
+    Args:
+        label_folder (str): Folder the label files would have been written to.
+        entries (iterable): (label file name, source label path) pairs.
+    """
+    with open(os.path.join(label_folder, LABEL_MANIFEST), "w", newline="") as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(["label", "source"])
+        for label_name, source_path in entries:
+            csvwriter.writerow([label_name, os.path.relpath(source_path, label_folder)])
+
+
+def load_label_manifest(label_folder):
+    """
+    Read the label manifest of a folder.
+
+    Args:
+        label_folder (str): Folder that may contain a label manifest.
+
+    Returns:
+        dict: Label file name -> absolute source label path, or None if the folder has no manifest.
+    """
+    manifest_path = os.path.join(label_folder, LABEL_MANIFEST)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, "r", newline="") as csvfile:
+        return {row["label"]: os.path.normpath(os.path.join(label_folder, row["source"]))
+                for row in csv.DictReader(csvfile)}
+
+
+def list_labels(label_folder):
+    """
+    List the label file names of a folder, including the ones that only exist in its manifest.
+
+    Args:
+        label_folder (str): Folder containing YOLO label files and/or a label manifest.
+
+    Returns:
+        list: Sorted label file names.
+    """
+    names = {f for f in os.listdir(label_folder) if f.endswith(".txt")}
+    manifest = load_label_manifest(label_folder)
+    if manifest is not None:
+        names.update(manifest)
+    return sorted(names)
+
+
+def resolve_label_path(label_folder, label_name, manifest=None):
+    """
+    Find the file that holds a label, looking for a real file first and then in the manifest.
+
+    Args:
+        label_folder (str): Folder containing YOLO label files and/or a label manifest.
+        label_name (str): Label file name, e.g. "image_00001.txt".
+        manifest (dict, optional): Already loaded manifest of the folder.
+
+    Returns:
+        str: Path to the label file.
+    """
+    label_path = os.path.join(label_folder, label_name)
+    if os.path.exists(label_path):
+        return label_path
+    if manifest is None:
+        manifest = load_label_manifest(label_folder) or {}
+    if label_name not in manifest:
+        raise FileNotFoundError(f"No label file or manifest entry for {label_path}")
+    return manifest[label_name]
+
+
+YoloLabel = namedtuple("YoloLabel", ["class_id", "bbox", "polygon"])
+
+
+def parse_yolo_label(text):
+    """
+    Parse the lines of a YOLO label file as written by gen_masks.py.
+
+    Args:
+        text (str): Content of the label file. Each line holds a class id, a normalized
+            (center_x, center_y, width, height) bounding box and optional polygon points.
+
+    Returns:
+        list: One YoloLabel per line, with bbox of shape (4,) and polygon of shape (N, 2).
+    """
+    labels = []
+    for line in text.splitlines():
+        parts = line.split()
+        if not parts:
+            continue
+        values = np.array(parts[1:], dtype=np.float64)
+        labels.append(YoloLabel(int(parts[0]), values[:4], values[4:].reshape(-1, 2)))
+    return labels
+
+
+def format_yolo_label(labels):
+    """
+    Write YoloLabel entries back out in the YOLO text format.
+
+    Args:
+        labels (list): YoloLabel entries.
+
+    Returns:
+        str: Label file content.
+    """
+    lines = []
+    for label in labels:
+        values = np.concatenate([label.bbox, np.asarray(label.polygon).reshape(-1)])
+        lines.append(" ".join([str(label.class_id)] + [str(float(v)) for v in values]) + "\n")
+    return "".join(lines)
+
+
+def read_yolo_label(label_folder, label_name, manifest=None):
+    """
+    Read and parse a label, resolving it through the folder's label manifest if needed.
+
+    Args:
+        label_folder (str): Folder containing YOLO label files and/or a label manifest.
+        label_name (str): Label file name, e.g. "image_00001.txt".
+        manifest (dict, optional): Already loaded manifest of the folder.
+
+    Returns:
+        list: YoloLabel entries.
+    """
+    with open(resolve_label_path(label_folder, label_name, manifest), "r") as f:
+        return parse_yolo_label(f.read())
@@ -0,0 +1,225 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+# File written to the mask folder in place of the _mask.png files
+MASK_STORE = "masks.rle"
+# First bytes of a mask store file
+MAGIC = b"RLEMASK1"
+
+
+def encode_rle(mask):
+    """
+    Run-length encode a binary mask the way COCO does.
+
+    Args:
+        mask (np.ndarray): (H, W) mask, non-zero on the object.
+
+    Returns:
+        np.ndarray: Run lengths of the pixels in column-major order, alternating between
+            background and object and starting with background (possibly a run of 0).
+    """
+    flat = (np.asarray(mask) != 0).ravel(order="F")
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate([[0], changes, [flat.size]]))
+    if flat.size and flat[0]:
+        counts = np.concatenate([[0], counts])
+    return counts
+
+
+def decode_rle(counts, height, width):
+    """
+    Expand COCO run lengths back into a mask.
+
+    Args:
+        counts (np.ndarray): Run lengths from encode_rle.
+        height (int): Height of the mask.
+        width (int): Width of the mask.
+
+    Returns:
+        np.ndarray: (H, W) uint8 mask, 255 on the object and 0 elsewhere.
+    """
+    values = np.zeros(len(counts), dtype=np.uint8)
+    values[1::2] = 255
+    return np.repeat(values, counts).reshape((height, width), order="F")
+
+
+def rle_to_string(counts):
+    """
+    Compress run lengths into the COCO RLE string format (as used by pycocotools).
+
+    Each count is stored as the difference to the count two runs before it, in 5-bit groups
+    offset into printable ASCII.
+
+    Args:
+        counts (np.ndarray): Run lengths from encode_rle.
+
+    Returns:
+        str: Compressed counts.
+    """
+    chars = []
+    counts = [int(c) for c in counts]
+    for i, x in enumerate(counts):
+        if i > 2:
+            x -= counts[i - 2]
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return "".join(chars)
+
+
+def rle_from_string(string):
+    """
+    Decompress a COCO RLE string.
+
+    Args:
+        string (str): Compressed counts from rle_to_string.
+
+    Returns:
+        np.ndarray: Run lengths.
+    """
+    counts = []
+    p = 0
+    while p < len(string):
+        x = 0
+        k = 0
+        more = True
+        while more:
+            c = ord(string[p]) - 48
+            x |= (c & 0x1f) << (5 * k)
+            more = c & 0x20
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return np.array(counts, dtype=np.int64)
+
+
+class MaskStoreWriter:
+    """
+    Write binary masks as COCO RLE strings into a single file.
+
+    The file starts with MAGIC, followed by the compressed masks one after the other, a JSON index
+    (name -> offset, length, height, width) and the 8-byte offset of the index, so a reader can
+    find any mask without reading the others.
+
+    Args:
+        path (str): File to write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+
+    def write(self, name, mask):
+        """
+        Append a mask.
+
+        Args:
+            name (str): Name of the mask, e.g. the stem of its image.
+            mask (np.ndarray): (H, W) mask, non-zero on the object.
+        """
+        height, width = mask.shape[:2]
+        self.write_rle(name, rle_to_string(encode_rle(mask)).encode("ascii"), height, width)
+
+    def write_rle(self, name, rle, height, width):
+        """
+        Append a mask that is already compressed, e.g. one copied from another store.
+
+        Args:
+            name (str): Name of the mask.
+            rle (bytes): COCO RLE string, ASCII encoded.
+            height (int): Height of the mask.
+            width (int): Width of the mask.
+        """
+        self.index[name] = [self._file.tell(), len(rle), height, width]
+        self._file.write(rle)
+
+    def close(self):
+        index_offset = self._file.tell()
+        self._file.write(json.dumps(self.index).encode("utf-8"))
+        self._file.write(struct.pack("<Q", index_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MaskStore:
+    """
+    Random access to the masks of a file written by MaskStoreWriter.
+
+    Only the index is read when the store is opened; every mask is read and decoded on its own.
+
+    Args:
+        path (str): Mask store file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a mask store")
+            f.seek(-8, os.SEEK_END)
+            end = f.tell()
+            (index_offset,) = struct.unpack("<Q", f.read(8))
+            f.seek(index_offset)
+            self.index = json.loads(f.read(end - index_offset).decode("utf-8"))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def names(self):
+        """
+        Returns:
+            list: Names of the masks, in the order they were written.
+        """
+        return list(self.index)
+
+    def read_rle(self, name):
+        """
+        Read the compressed form of a mask.
+
+        Args:
+            name (str): Name of the mask.
+
+        Returns:
+            dict: COCO RLE {"size": [height, width], "counts": str}.
+        """
+        offset, length, height, width = self.index[name]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            counts = f.read(length).decode("ascii")
+        return {"size": [height, width], "counts": counts}
+
+    def read(self, name):
+        """
+        Read and decode a mask.
+
+        Args:
+            name (str): Name of the mask.
+
+        Returns:
+            np.ndarray: (H, W) uint8 mask, 255 on the object and 0 elsewhere, like the _mask.png files.
+        """
+        rle = self.read_rle(name)
+        height, width = rle["size"]
+        return decode_rle(rle_from_string(rle["counts"]), height, width)
@@ -1,49 +1,207 @@
 import os
+import re
+import csv
 import shutil
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-def merge_datasets_into_val(val_image_folder, val_label_folder, test_image_folder, test_label_folder):
+import numpy as np
+
+from label_store import LABEL_STORE, LabelStore
+from labels import list_labels, load_label_manifest, resolve_label_path, write_label_manifest
+
+# Record of the merged test pairs, kept in the validation label folder
+MERGE_MANIFEST = "merge_manifest.csv"
+MERGE_MODES = ["hardlink", "copy", "manifest", "store"]
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def file_index(stem):
+    """
+    Returns:
+        int: The number at the end of a file stem such as "image_00012", or None if it has none.
+    """
+    match = re.search(r"(\d+)$", stem)
+    return int(match.group(1)) if match else None
+
+
+def pair_by_stem(image_folder, label_folder):
+    """
+    Pair the images of a folder with their labels by file stem.
+
+    Args:
+        image_folder (str): Folder with the images.
+        label_folder (str): Folder with the YOLO labels and/or a label manifest.
+
+    Returns:
+        list: (stem, image path, label path) for every stem that has both, sorted by stem. Label
+            paths are resolved through the label manifest.
+    """
+    images = {os.path.splitext(f)[0]: os.path.join(image_folder, f)
+              for f in sorted(os.listdir(image_folder)) if f.lower().endswith(IMAGE_EXTENSIONS)}
+    manifest = load_label_manifest(label_folder)
+    labels = {os.path.splitext(f)[0]: resolve_label_path(label_folder, f, manifest) for f in list_labels(label_folder)}
+    for stem in sorted(images.keys() ^ labels.keys()):
+        print(f"Skipping {stem}: {'no label' if stem in images else 'no image'}.")
+    return [(stem, images[stem], labels[stem]) for stem in sorted(images.keys() & labels.keys())]
+
+
+def load_merge_manifest(val_label_folder):
+    """
+    Returns:
+        dict: Source image path -> (image name, label name, source image, source label) of every
+            test pair merged before.
+    """
+    manifest_path = os.path.join(val_label_folder, MERGE_MANIFEST)
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, "r", newline="") as csvfile:
+        return {row["source_image"]: (row["image"], row["label"], row["source_image"], row["source_label"])
+                for row in csv.DictReader(csvfile)}
+
+
+def is_current(source_path, destination_path):
+    """
+    Check whether a destination already holds a source file, as a hardlink or as a copy with the
+    same size and modification time.
+    """
+    if not os.path.exists(destination_path):
+        return False
+    if os.path.samefile(source_path, destination_path):
+        return True
+    source, destination = os.stat(source_path), os.stat(destination_path)
+    return source.st_size == destination.st_size and source.st_mtime_ns == destination.st_mtime_ns
+
+
+def place_file(source_path, destination_path, mode="hardlink"):
     """
-    Merges test images and masks into the validation dataset folders sequentially.
+    Hardlink or copy a file, unless the destination already holds it.
+
+    Copies keep the modification time of the source, so is_current recognizes them later.
+
+    Args:
+        source_path (str): Existing file.
+        destination_path (str): New name.
+        mode (str): "hardlink" (falls back to a copy across filesystems) or "copy".
+
+    Returns:
+        int: 1 if the file was placed, 0 if it was already current.
+    """
+    if is_current(source_path, destination_path):
+        return 0
+    if os.path.lexists(destination_path):
+        os.remove(destination_path)
+    if mode == "hardlink":
+        try:
+            os.link(source_path, destination_path)
+            return 1
+        except OSError:
+            # e.g. source and destination are on different filesystems
+            pass
+    shutil.copy2(source_path, destination_path)
+    return 1
+
+
+def merge_into_store(val_store, test_label_folder, new_names):
+    """
+    Add test labels to the validation split of a label store under new names.
+
+    The labels are read into columns once and renamed there; images merged before under the
+    same names are replaced, so merging again does not duplicate them.
+
+    Args:
+        val_store (LabelStore): Store holding the validation labels.
+        test_label_folder (str): Folder with the test YOLO labels (a label manifest is also understood).
+        new_names (dict): Test label stem -> image name in the validation split.
+
+    Returns:
+        LabelStore: The merged store.
+    """
+    test_store = LabelStore.from_folder(test_label_folder, "val")
+    test_store = test_store.select(np.isin(test_store.names, list(new_names)))
+    test_store = test_store.rename([new_names[name] for name in test_store.names], "val")
+    keep = ~((val_store.splits == "val") & np.isin(val_store.names, test_store.names))
+    return LabelStore.concatenate([val_store.select(keep), test_store])
+
+
+def merge_datasets_into_val(val_image_folder, val_label_folder, test_image_folder, test_label_folder,
+                            mode="hardlink", workers=8):
+    """
+    Merges test images and labels into the validation dataset folders sequentially.
+
+    Test images are paired with their labels by file stem, and each pair gets the next free
+    `image_XXXXX` name after the highest number in the validation folders, for the image and the
+    label alike. Files are hardlinked rather than copied where possible; the copies that are
+    needed run on a thread pool. Every merged pair is recorded in `merge_manifest.csv` in the
+    validation label folder, so running the merge again only places files that are missing or
+    out of date, under the names they got the first time.
 
     Args:
         val_image_folder (str): Path to the validation images folder.
-        val_label_folder (str): Path to the validation masks folder (labels).
+        val_label_folder (str): Path to the validation labels folder.
         test_image_folder (str): Path to the test images folder.
-        test_label_folder (str): Path to the test masks folder (labels).
+        test_label_folder (str): Path to the test labels folder (a label manifest is also understood).
+        mode (str): "hardlink" or "copy" for the images and labels, "manifest" to hardlink the
+            images and add the labels to the label manifest of the validation folder, or "store" to
+            hardlink the images and add the labels to the `labels.npz` label store of the validation
+            folder under their new names (see merge_into_store), without writing label files.
+        workers (int): Number of threads placing files.
 
     Output:
-        - All images and masks from test are merged into the `val` folder structure.
+        - All images and labels from test are merged into the `val` folder structure.
     """
+    pairs = pair_by_stem(test_image_folder, test_label_folder)
+    merged = load_merge_manifest(val_label_folder)
+    val_manifest = load_label_manifest(val_label_folder) or {}
 
-    # Helper function to rename and copy files
-    def rename_and_copy(source_folder, destination_folder, start_index, prefix):
-        index = start_index
-        for filename in sorted(os.listdir(source_folder)):
-            # Only process relevant file types
-            if filename.endswith((".png", ".jpg", ".jpeg", ".txt")):  # Adjust as needed
-                ext = os.path.splitext(filename)[-1]
-                new_name = f"{prefix}_{index:05d}{ext}"
-                shutil.copy(os.path.join(source_folder, filename), os.path.join(destination_folder, new_name))
-                index += 1
-        return index
+    # Every existing name is considered, not only the last one in sorted order
+    indices = [file_index(os.path.splitext(f)[0]) for f in os.listdir(val_image_folder)]
+    indices += [file_index(os.path.splitext(f)[0]) for f in list_labels(val_label_folder)]
+    store_path = os.path.join(val_label_folder, LABEL_STORE)
+    if mode == "store":
+        val_store = LabelStore.load(store_path) if os.path.isfile(store_path) else LabelStore.from_folder(val_label_folder, "val")
+        indices += [file_index(name) for name in val_store.names]
+    next_index = max([i for i in indices if i is not None], default=0) + 1
 
-    # Get the current highest index in the validation folders
-    val_images = sorted(os.listdir(val_image_folder))
-    val_labels = sorted(os.listdir(val_label_folder))
+    entries = []
+    tasks = []
+    for stem, image_path, label_path in pairs:
+        source_image = os.path.abspath(image_path)
+        if source_image in merged:
+            image_name, label_name = merged[source_image][:2]
+        else:
+            name = f"image_{next_index:05d}"
+            next_index += 1
+            image_name, label_name = name + os.path.splitext(image_path)[1], name + ".txt"
+        entries.append((image_name, label_name, source_image, os.path.abspath(label_path)))
+        tasks.append((image_path, os.path.join(val_image_folder, image_name),
+                      "copy" if mode == "copy" else "hardlink"))
+        if mode == "manifest":
+            val_manifest[label_name] = os.path.abspath(label_path)
+        elif mode != "store":
+            tasks.append((label_path, os.path.join(val_label_folder, label_name), mode))
 
-    # Calculate the starting index for new files
-    current_max_index = 1
-    if val_images:
-        current_max_index = int(os.path.splitext(val_images[-1])[0].split("_")[-1]) + 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        placed = sum(executor.map(lambda task: place_file(*task), tasks))
 
-    # Process test images
-    next_index = rename_and_copy(test_image_folder, val_image_folder, current_max_index, "image")
+    if mode == "manifest":
+        write_label_manifest(val_label_folder, sorted(val_manifest.items()))
+    elif mode == "store":
+        new_names = {stem: os.path.splitext(entry[1])[0] for (stem, _, _), entry in zip(pairs, entries)}
+        merge_into_store(val_store, test_label_folder, new_names).save(store_path)
 
-    # Process test masks (labels)
-    rename_and_copy(test_label_folder, val_label_folder, current_max_index, "mask")
+    # The record keeps earlier merges from other test folders too
+    recorded = {entry[2]: entry for entry in entries}
+    for source_image, entry in merged.items():
+        recorded.setdefault(source_image, entry)
+    with open(os.path.join(val_label_folder, MERGE_MANIFEST), "w", newline="") as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(["image", "label", "source_image", "source_label"])
+        for entry in sorted(recorded.values()):
+            csvwriter.writerow(entry)
 
-    print(f"Merging complete! Images and masks merged into: {val_image_folder} and {val_label_folder}")
+    print(f"Merged {len(pairs)} test pairs ({placed} files placed, {len(tasks) - placed} already current).")
+    print(f"Merging complete! Images and labels merged into: {val_image_folder} and {val_label_folder}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Merge test dataset into validation dataset folders.")
@@ -51,12 +209,17 @@ if __name__ == "__main__":
     parser.add_argument("--val_label_folder", type=str, required=True, help="Path to validation labels folder")
     parser.add_argument("--test_image_folder", type=str, required=True, help="Path to test images folder")
     parser.add_argument("--test_label_folder", type=str, required=True, help="Path to test labels folder")
-    
+    parser.add_argument("--mode", choices=MERGE_MODES, default="hardlink",
+                        help="Hardlink or copy the files, or add the labels to the validation label manifest or label store.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of threads placing files.")
+
     args = parser.parse_args()
-    
+
     merge_datasets_into_val(
         args.val_image_folder,
         args.val_label_folder,
         args.test_image_folder,
-        args.test_label_folder
+        args.test_label_folder,
+        args.mode,
+        args.workers
     )
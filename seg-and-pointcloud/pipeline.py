@@ -0,0 +1,195 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a pipeline, run on its own threads and timed per item.
+
+    Calling the stage runs its function and records the time spent, so the same stage objects
+    report throughput whether they are driven by run_pipeline or by a plain loop. A function that
+    returns None drops the item.
+
+    Args:
+        name (str): Name used in the throughput report.
+        func (callable): Function applied to each item.
+        threads (int): Number of threads run_pipeline starts for this stage.
+        discard (callable, optional): Called instead of func on items that are drained after an
+            error, e.g. to give back resources held by the item.
+    """
+
+    def __init__(self, name, func, threads=1, discard=None):
+        self.name = name
+        self.func = func
+        self.threads = max(1, threads)
+        self.discard = discard
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, item):
+        start = time.perf_counter()
+        result = self.func(item)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.items += 1
+            self.busy += elapsed
+        return result
+
+    def stats(self):
+        """
+        Returns:
+            tuple: (name, threads, items, busy seconds), which can be summed across processes.
+        """
+        return self.name, self.threads, self.items, self.busy
+
+
+def run_pipeline(items, stages, queue_size=16):
+    """
+    Push items through the stages, with every stage running concurrently on its own threads.
+
+    Consecutive stages are joined by bounded queues, so a slow stage holds back the ones before it
+    instead of letting work pile up in memory. If a stage raises, the remaining items are drained
+    without being processed and the first exception is re-raised.
+
+    Args:
+        items (iterable): Inputs to the first stage.
+        stages (list): Stage objects, in order.
+        queue_size (int): Capacity of each queue between stages.
+    """
+    queues = [queue.Queue(queue_size) for _ in stages]
+    errors = []
+    running = [stage.threads for stage in stages]
+    running_lock = threading.Lock()
+
+    def feed():
+        for item in items:
+            if errors:
+                break
+            queues[0].put(item)
+        for _ in range(stages[0].threads):
+            queues[0].put(_DONE)
+
+    def work(k):
+        stage = stages[k]
+        in_queue = queues[k]
+        out_queue = queues[k + 1] if k + 1 < len(stages) else None
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                break
+            if errors:
+                if stage.discard is not None:
+                    stage.discard(item)
+                continue
+            try:
+                result = stage(item)
+            except BaseException as e:
+                errors.append(e)
+                continue
+            if out_queue is not None and result is not None:
+                out_queue.put(result)
+
+        # The last thread of a stage to finish closes the next stage's input
+        with running_lock:
+            running[k] -= 1
+            last = running[k] == 0
+        if last and out_queue is not None:
+            for _ in range(stages[k + 1].threads):
+                out_queue.put(_DONE)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for k, stage in enumerate(stages):
+        threads += [threading.Thread(target=work, args=(k,), daemon=True) for _ in range(stage.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def merge_stage_stats(*stats_lists):
+    """
+    Sum stage statistics from several runs (e.g. one per worker process).
+
+    Args:
+        *stats_lists: Lists of Stage.stats() tuples with the same stage order.
+
+    Returns:
+        list: Combined (name, threads, items, busy seconds) tuples.
+    """
+    merged = []
+    for entries in zip(*stats_lists):
+        name, threads = entries[0][0], sum(e[1] for e in entries)
+        merged.append((name, threads, sum(e[2] for e in entries), sum(e[3] for e in entries)))
+    return merged
+
+
+def format_stage_report(stats, wall_time):
+    """
+    Describe the throughput of each stage and point out the bottleneck.
+
+    Args:
+        stats (list): (name, threads, items, busy seconds) tuples.
+        wall_time (float): Elapsed time of the whole run in seconds.
+
+    Returns:
+        str: Multi-line report.
+    """
+    lines = ["Stage throughput:"]
+    capacities = []
+    for name, threads, items, busy in stats:
+        # Items per second the stage could sustain with all of its threads kept busy
+        capacity = items * threads / busy if busy > 0 else float("inf")
+        utilization = busy / (threads * wall_time) if wall_time > 0 else 0.0
+        capacities.append(capacity)
+        lines.append(f"  {name:<10} {threads:>3} threads  {items:>7} items  {busy:8.2f} s busy  "
+                     f"{capacity:8.1f} items/s capacity  {utilization:6.1%} utilized")
+    if stats:
+        lines.append(f"  Bottleneck: {stats[int(np.argmin(capacities))][0]}")
+    return "\n".join(lines)
+
+
+class BufferPool:
+    """
+    Fixed number of reusable image buffers shared between pipeline threads.
+
+    acquire blocks once every buffer is in use, which also bounds the number of composites that
+    are waiting to be encoded.
+
+    Args:
+        max_buffers (int): Maximum number of buffers allocated.
+    """
+
+    def __init__(self, max_buffers):
+        self.max_buffers = max_buffers
+        self._free = []
+        self._allocated = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, shape, dtype=np.uint8):
+        with self._cond:
+            while True:
+                for idx, buffer in enumerate(self._free):
+                    if buffer.shape == shape and buffer.dtype == dtype:
+                        return self._free.pop(idx)
+                if self._allocated < self.max_buffers:
+                    self._allocated += 1
+                    return np.empty(shape, dtype=dtype)
+                if self._free:
+                    # Every buffer has the wrong shape, so replace a free one
+                    self._free.pop(0)
+                    return np.empty(shape, dtype=dtype)
+                self._cond.wait()
+
+    def release(self, buffer):
+        with self._cond:
+            self._free.append(buffer)
+            self._cond.notify()
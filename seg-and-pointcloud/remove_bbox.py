@@ -1,10 +1,42 @@
 import os
 import argparse
 
+from labels import LABEL_MANIFEST, load_label_manifest, replace_text, write_label_manifest
+from label_store import LabelStore
+
+
+def strip_bbox_lines(file_path, file_name):
+    """
+    Read a YOLO annotation file and drop the bounding box columns of every line.
+
+    Args:
+        file_path (str): Path to the YOLO annotation file.
+        file_name (str): Name used in messages about skipped lines.
+
+    Returns:
+        list: Updated lines, each ending in a newline.
+    """
+    updated_lines = []
+    with open(file_path, "r") as file:
+        for line in file:
+            parts = line.strip().split()
+            if len(parts) > 5:  # Ensure there is mask information
+                # Keep label_id and mask information (remove bbox)
+                updated_line = f"{parts[0]} " + " ".join(parts[5:])
+                updated_lines.append(updated_line + "\n")
+            else:
+                print(f"Skipping file {file_name} due to insufficient data on line: {line.strip()}")
+    return updated_lines
+
+
 def remove_bbox_info(folder_path):
     """
     Removes bounding box information from YOLO format files, keeping only label_id and mask information.
 
+    If the folder has a label manifest, each distinct source label it points to is stripped once
+    into a `sources` subfolder and the manifest is rewritten to point there; the original sources
+    are left untouched.
+
     Args:
         folder_path (str): Path to the folder containing YOLO annotation files.
 
@@ -14,27 +46,64 @@ def remove_bbox_info(folder_path):
     for file_name in os.listdir(folder_path):
         if file_name.endswith(".txt"):
             file_path = os.path.join(folder_path, file_name)
-            updated_lines = []
-
-            with open(file_path, "r") as file:
-                for line in file:
-                    parts = line.strip().split()
-                    if len(parts) > 5:  # Ensure there is mask information
-                        # Keep label_id and mask information (remove bbox)
-                        updated_line = f"{parts[0]} " + " ".join(parts[5:])
-                        updated_lines.append(updated_line)
-                    else:
-                        print(f"Skipping file {file_name} due to insufficient data on line: {line.strip()}")
-
-            # Write the updated content back to the file
-            with open(file_path, "w") as file:
-                file.write("\n".join(updated_lines) + "\n")
+            updated_lines = strip_bbox_lines(file_path, file_name)
+
+            # Replaced rather than modified, so labels hardlinked from another dataset are not changed
+            replace_text(file_path, "".join(updated_lines))
+
+    manifest = load_label_manifest(folder_path)
+    if manifest is not None:
+        sources_folder = os.path.join(folder_path, "sources")
+        os.makedirs(sources_folder, exist_ok=True)
+        stripped = {}
+        for source_path in sorted(set(manifest.values())):
+            if os.path.dirname(source_path) == sources_folder:
+                # Already stripped by a previous run
+                stripped[source_path] = source_path
+                continue
+            # Sources from different folders may share a name, so number them
+            new_path = os.path.join(sources_folder, f"{len(stripped):05d}_{os.path.basename(source_path)}")
+            replace_text(new_path, "".join(strip_bbox_lines(source_path, os.path.basename(source_path))))
+            stripped[source_path] = new_path
+        write_label_manifest(folder_path, [(label, stripped[source]) for label, source in sorted(manifest.items())])
+        print(f"Rewrote {LABEL_MANIFEST} to point at {len(stripped)} stripped source labels.")
 
     print("Bounding box information removed from all files.")
 
+
+def remove_bbox_with_store(folder_path, store_path, split=None):
+    """
+    Write segmentation-only label files from a label store, which keeps the full labels.
+
+    If the store does not exist yet, the folder's labels are read into it first. The files are
+    then formatted from the store's columns, so the bboxes can be brought back at any time with
+    `python label_store.py export <store_path> <folder_path>`.
+
+    Args:
+        folder_path (str): Path to the folder containing YOLO annotation files.
+        store_path (str): Label store to read, or to create from the folder.
+        split (str, optional): Only write the labels of this split of the store.
+    """
+    if os.path.isfile(store_path):
+        store = LabelStore.load(store_path)
+    else:
+        store = LabelStore.from_folder(folder_path, split or "train")
+        store.save(store_path)
+        print(f"Saved the full labels to {store_path}.")
+    if split is not None:
+        store = store.split(split)
+    written = store.export(folder_path, view="segment")
+    print(f"Bounding box information removed from {written} files.")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Remove bounding box information from YOLO annotation files.")
     parser.add_argument("folder_path", type=str, help="Path to the folder containing YOLO annotation files.")
+    parser.add_argument("--store", type=str, default=None,
+                        help="Label store that keeps the full labels (created from the folder if missing).")
+    parser.add_argument("--split", type=str, default=None, help="Only write the labels of this split of the store.")
     args = parser.parse_args()
 
-    remove_bbox_info(args.folder_path)
+    if args.store is not None:
+        remove_bbox_with_store(args.folder_path, args.store, args.split)
+    else:
+        remove_bbox_info(args.folder_path)
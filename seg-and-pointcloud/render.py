@@ -11,7 +11,9 @@ import tqdm
 import csv
 import random
 import mathutils
-import bpy_extras
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from mesh_geometry import FrameGeometry, MeshBuffer, load_hull
 
 """
     script for generating training data with glare, blur, and domain randomized backgrounds.
@@ -47,6 +49,18 @@ RES_Y = 1024
 #background strength defaults 
 BACKGROUND_STRENGTH_DEFAULT = 0.312
 GLARE_TYPES = ['FOG_GLOW', 'SIMPLE_STAR', 'STREAKS', 'GHOSTS']
+# write the YOLO labels and masks from the render in memory (see render_labels.py), in place of running gen_masks.py
+# (needs opencv-python installed in blender's python)
+RENDER_LABELS = False
+LABEL_CLASS_ID = 0
+MASK_FORMAT = "rle" # "rle" for one masks.rle file, "png" for a _mask.png per image
+# camera distance (m) and image offset ranges frames are sampled from
+DISTANCE_RANGE = (20, 850)
+OFFSET_RANGE = (0.05, 0.95)
+# frames are checked before rendering, and resampled if the spacecraft is out of frame or outside these limits
+MIN_BOX_AREA = 0.001 # smallest bounding box area, as a fraction of the image
+MAX_TRUNCATION = 0.25 # largest fraction of the spacecraft's projected box the image may cut off
+MAX_RESAMPLES = 20 # how often to resample a frame before skipping it
 ###
 
 trial_number=1
@@ -104,109 +118,15 @@ def set_filter_nodes(filters, node_tree):
     
     return result_dict
 
-def line_from_points(x1,y1, x2,y2):
-    '''Generate a line from two points. 
-    
-    Get the line that passes through the two points that are given.
-    
-    args:
-        x1: The x coordinate of the first point.
-        y1: The y coordinate of the first point.
-        x2: The x coordinate of the second point.
-        y2: The y coordinate of the second point.
-        
-    returns:
-        m: The slope of the line.
-        b: The y-intercept of the line.
-    '''
-    if(x2-x1 == 0):
-        return -100000000, -10000000
-    m = (y2-y1) /(x2-x1)
-    b = y1-m*x1
-    return m,b
-
-def BoundingBox(obj,cam, imageNum):
-    '''Get the bounding box around the spacecraft.
+def resample_frame(frame):
+    '''Draw a new pose, distance and offset for a frame, from the same distributions as the sequence.
 
-    Construct the bounding box around the spacecraft by adding edge vertices and finding the minimum/maximum vertices. This is done by first looking at the edges and finding the ones that are on the boundary of the image, and then adding vertices on the edge of the image. Then, all vertices are then compared after being projected on the image, and the maximum/minimum values are then returned.
-    
     args:
-        obj: The spacecraft object we want the bounding box around.
-        cam: The camera object which is taking the image.
-
-    returns:
-        X_min: The minimum x coordinate pixel for the bounding box around the spacecraft.
-        Y_min: The minimum y coordinate pixel for the bounding box around the spacecraft.
-        X_max: The maximum x coordinate pixel for the bounding box around the spacecraft.
-        Y_max: The maximum y coordinate pixel for the bounding box around the spacecraft.
+        frame: The starfish frame to modify.
     '''
-    in_image = []
-    #first, go through, and add all cases of points being outside of the image.
-    for edge in obj.data.edges:
-        verts = [obj.data.vertices[v].co for v in edge.vertices]
-        for i in range(len(verts)):
-            verts[i] = obj.matrix_world @ verts[i]
-        coords_2d = [bpy_extras.object_utils.world_to_camera_view(bpy.context.scene, cam, coord) for coord in verts]
-        one_true = False
-        one_false = False
-        points = []
-        for x, y, d in coords_2d:
-            my_x = RES_X*x
-            my_y = RES_Y-RES_Y*y
-            points.append(tuple((my_x, my_y)))
-            if my_x<=RES_X and my_x>=0 and my_y <=RES_Y and my_y >=0:
-                one_true = True
-            else:
-                one_false = True
-        if one_false and one_true:
-            #first, get the line.
-            m, b = line_from_points(points[0][0], points[0][1], points[1][0], points[1][1])
-
-            #get the x=0 intersect, y=0 intersect, x=RES_X, y=RES_Y
-            #find which one is (a) within the other boundary, and (b) between the two points.
-            #x=0 intersect:
-            if b<min(RES_Y, max(points[0][1], points[1][1])) and b>max(0, min(points[0][1], points[1][1])) :
-                in_image.append(tuple((0,b)))
-            #y=0 intersect
-            elif -b/m<min(RES_X, max(points[0][0], points[1][0])) and -b/m>max(0, min(points[1][0], points[1][0])):
-                in_image.append(tuple((-b/m,0)))
-            #x=RES_X y = m*RES_X+b
-            elif m*RES_X+b<min(RES_Y, max(points[0][1], points[1][1])) and m*RES_X+b>max(0, min(points[0][1], points[1][1])):
-                in_image.append(tuple((RES_X,m*RES_X+b)))
-            elif (RES_Y-b)/m<min(RES_X, max(points[0][0], points[1][0])) and (RES_Y-b)/m>max(0, min(points[0][0], points[1][0])):
-                in_image.append(tuple(((RES_Y-b)/m,RES_Y)))
-        
-
-
-
-    #get the vertices
-    mat = obj.matrix_world
-    verts = [vert.co for vert in obj.data.vertices]
-    for i in range(len(verts)):
-        verts[i] = obj.matrix_world @ verts[i]
-
-    #rotate the coords into the 2d camera view.
-    coords_2d = [bpy_extras.object_utils.world_to_camera_view(bpy.context.scene, cam, coord) for coord in verts]
-
-    for x, y, d in coords_2d:
-        my_x = int(RES_X*x)
-        my_y = int(RES_Y-RES_Y*y)
-        if my_x<=RES_X and my_x>=0 and my_y <=RES_Y and my_y >=0:
-            in_image.append(tuple((RES_X*x,RES_Y-RES_Y*y)))
-
-    Y_max = int(max(in_image, key = lambda i : i[1])[1])
-    X_max = int(max(in_image, key = lambda i : i[0])[0])
-    Y_min = int(min(in_image, key = lambda i : i[1])[1])
-    X_min = int(min(in_image, key = lambda i : i[0])[0])
-
-    in_image.clear()
-
-    return(
-        X_min,
-        Y_min,
-        X_max,
-        Y_max
-    )
+    frame.pose = starfish.utils.random_rotations(1)[0]
+    frame.distance = np.random.uniform(*DISTANCE_RANGE)
+    frame.offset = np.random.uniform(*OFFSET_RANGE, size=(2,))
 
 def generate(num,
              filters,
@@ -215,7 +135,7 @@ def generate(num,
              spacecraft_dir=spacecraft_directory):
     '''Generate a bunch of images.
     
-    This is the main body of this script, and actually generates the images. It must be run with the `no_spacecraft.blend` scene. It first creates a sequence of scene configurations using Starfish, modifies the lighting if we are not using random lighting, finds the bounding box around the spacecraft, and updates the output csv file.
+    This is the main body of this script, and actually generates the images. It must be run with the `no_spacecraft.blend` scene. It first creates a sequence of scene configurations using Starfish, checks each frame's bounding box before rendering (resampling the frames where the spacecraft is out of frame, too small or cut off too much), modifies the lighting if we are not using random lighting, finds the bounding box around the spacecraft, and updates the output csv file.
 
     args:
         num: The number of images to render.
@@ -226,6 +146,11 @@ def generate(num,
     #where does the image save
     output_node = bpy.data.scenes["Render"].node_tree.nodes["File Output"]
     output_node.base_path = output_path
+    if RENDER_LABELS:
+        from render_labels import RenderLabelWriter, link_viewer, output_stem, viewer_alpha
+        link_viewer(bpy.data.scenes["Render"])
+        label_writer = RenderLabelWriter(os.path.join(output_path, "labels"), os.path.join(output_path, "masks"),
+                                         LABEL_CLASS_ID, mask_format=MASK_FORMAT)
 
     # remove all animation
     for scene in bpy.data.scenes:
@@ -256,8 +181,8 @@ def generate(num,
         lighting=starfish.utils.random_rotations(num),
         background=starfish.utils.random_rotations(num),
         #NOTE: sc must be within ~200m of camera
-        distance=np.random.uniform(20, 850, size=(num,)),   ### important: how far are you away from the upper stage (m)
-        offset=np.random.uniform(low=0.05, high=0.95, size=(num,2))
+        distance=np.random.uniform(*DISTANCE_RANGE, size=(num,)),   ### important: how far are you away from the upper stage (m)
+        offset=np.random.uniform(*OFFSET_RANGE, size=(num,2))
     )
 
     #Load in a new spacecraft...
@@ -282,6 +207,10 @@ def generate(num,
     spacecraft = bpy.data.objects[sc_name]
     spacecraft.parent = bpy.data.objects["spacecraft"]
     spacecraft.hide_render=False
+    # all meshes of the spacecraft in one vertex buffer, and its convex hull cached next to its fbx file
+    bpy.context.view_layer.update()
+    spacecraft_mesh = MeshBuffer(spacecraft)
+    hull = load_hull(fp, spacecraft_mesh)
 
     bpy.data.scenes['Render'].render.resolution_x = RES_X
     bpy.data.scenes['Render'].render.resolution_y = RES_Y
@@ -304,6 +233,12 @@ def generate(num,
             csvwriter=csv.writer(csvfile)
             csvwriter.writerow(['image', 'label spacecraft', 'label background','xmin', 'ymin', 'xmax', 'ymax'])
 
+    # frames rejected before rendering, by reason, and the render times of the accepted ones
+    culled = {"out of frame": 0, "too small": 0, "truncated": 0}
+    skipped = 0
+    render_times = []
+    cull_time = 0
+
     # render images
     for i, frame in enumerate(sequence):
         #first set the lighting strength, if generating random lighting
@@ -313,8 +248,27 @@ def generate(num,
         #get background image for lighting
         background_image = np.random.choice(images_list)
         b = background_vector[background_image]
-        #set up scene to get correct lighting position (will need to setup again later)
+        #set up the pose of the frame, and project the spacecraft once for the lighting and the labels
+        cull_start = time.perf_counter()
         frame.setup(bpy.data.scenes['Render'], bpy.data.objects["spacecraft"], bpy.data.objects["Camera_Real"], bpy.data.objects["Sun"])
+        geometry = FrameGeometry(spacecraft_mesh, bpy.context.scene.camera, bpy.context.scene, RES_X, RES_Y, hull)
+        #resample frames that would not be worth rendering
+        reason = geometry.cull_reason(MIN_BOX_AREA, MAX_TRUNCATION)
+        resamples = 0
+        while reason is not None and resamples < MAX_RESAMPLES:
+            culled[reason] += 1
+            resamples += 1
+            resample_frame(frame)
+            frame.setup(bpy.data.scenes['Render'], bpy.data.objects["spacecraft"], bpy.data.objects["Camera_Real"], bpy.data.objects["Sun"])
+            geometry = FrameGeometry(spacecraft_mesh, bpy.context.scene.camera, bpy.context.scene, RES_X, RES_Y, hull)
+            reason = geometry.cull_reason(MIN_BOX_AREA, MAX_TRUNCATION)
+        cull_time += time.perf_counter() - cull_start
+        if resamples:
+            print(f"frame {i}: resampled {resamples} times")
+        if reason is not None:
+            print(f"frame {i}: skipped, still {reason} after {MAX_RESAMPLES} resamples")
+            skipped += 1
+            continue
         off_x = 0
         off_y = 0
         image = bpy.data.images.load(filepath =  background_dir + '/' + background_image)
@@ -337,17 +291,13 @@ def generate(num,
                     bpy.data.scenes["Render"].node_tree.nodes["Crop"].max_y = image.size[1]
             bpy.data.scenes['Render'].node_tree.nodes['Image'].image = image
 
-        #bounding box. We need to get this here so that we can ge the center of the spacecraft...
-        #TODO: fails when the spacecraft loaded is a parent object of multiple meshes.
-
         if not RANDOM_LIGHTING:
-            box = BoundingBox(spacecraft, bpy.context.scene.camera)
-            box = np.array([box[0], box[1], box[2], box[3]])
+            box = np.array(geometry.box)
 
             #TODO: need to set this up so that we move the point depending on what part of the image we crop...
             if(b["in_image"]):
                 #get the center of the bounding box...
-                centerBox = np.array([box[0]+(box[2]-box[0])/2, box[1]+(box[3]-box[1])/2])
+                centerBox = geometry.center
                 print(centerBox)
                 xy_light = np.array([-centerBox[0]+b["x"]-off_x, centerBox[1]-b["y"]-off_y])
                 print(off_x)
@@ -362,8 +312,8 @@ def generate(num,
             rotation_matrix = (vt-vf).to_track_quat('Z','Y').to_matrix().to_4x4()
             e = rotation_matrix.decompose()[1]
             frame.lighting = starfish.utils.to_quat(e)
-        #actually setup scene, with correct lighting.
-        frame.setup(bpy.data.scenes['Render'], bpy.data.objects["spacecraft"], bpy.data.objects["Camera_Real"], bpy.data.objects["Sun"])
+            #setup scene again to apply the lighting. The pose does not change, so the geometry stays valid.
+            frame.setup(bpy.data.scenes['Render'], bpy.data.objects["spacecraft"], bpy.data.objects["Camera_Real"], bpy.data.objects["Sun"])
 
         # create name for the current image (unique to that image)
         output_node.file_slots[0].path = "image_#" + str(i)
@@ -373,10 +323,14 @@ def generate(num,
         #frame.augmentations = set_filter_nodes(filters, bpy.data.scenes["Render"].node_tree)
         
         # render
+        render_start = time.perf_counter()
         bpy.ops.render.render(scene="Render")
-        # get the bounding box... again 
-        box = BoundingBox(spacecraft, bpy.context.scene.camera, i)
-        box = np.array([box[0], box[1], box[2], box[3]])
+        render_times.append(time.perf_counter() - render_start)
+        # labels and mask of the image, from the render still in memory
+        if RENDER_LABELS:
+            label_writer.write(output_stem(output_node, bpy.data.scenes["Render"]), viewer_alpha())
+        # the bounding box of the frame, projected before rendering
+        box = np.array(geometry.box)
         minx = box[0]
         miny = box[1]
         maxx = box[2]
@@ -390,6 +344,28 @@ def generate(num,
             csvwriter=csv.writer(csvfile)
             csvwriter.writerow(bbox)
 
+    if RENDER_LABELS:
+        label_writer.close()
+
+    # every rejected frame would have cost about one render
+    rejected = sum(culled.values())
+    mean_render = float(np.mean(render_times)) if render_times else 0.0
+    stats = {
+        "rendered": len(render_times),
+        "skipped": skipped,
+        "rejected": rejected,
+        "rejected_by_reason": culled,
+        "min_box_area": MIN_BOX_AREA,
+        "max_truncation": MAX_TRUNCATION,
+        "mean_render_seconds": mean_render,
+        "culling_seconds": cull_time,
+        "estimated_seconds_saved": rejected*mean_render - cull_time,
+    }
+    with open(os.path.join(output_node.base_path, 'culling_stats.json'), 'w') as json_file:
+        json.dump(stats, json_file, indent=4)
+    print(f"Rendered {len(render_times)} frames, rejected {rejected} before rendering ({', '.join(f'{n} {r}' for r, n in culled.items())}), skipped {skipped}.")
+    print(f"Culling took {cull_time:.1f} s and saved about {stats['estimated_seconds_saved']:.0f} s of rendering ({mean_render:.1f} s per render).")
+
 
 def main():
     generate(NUMBER_OF_IMAGES, lighting_effect_types,spacecraft_name, background_image_directory, spacecraft_directory)
@@ -11,9 +11,11 @@ import tqdm
 import csv
 import random
 import mathutils
-import bpy_extras
 import time
 
+# render_labels.py is imported from this folder when RENDER_LABELS is set
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
 """
     script for generating training data with glare, blur, and domain randomized backgrounds.
 """
@@ -46,6 +48,11 @@ RES_Y = 1024
 #background strength defaults 
 BACKGROUND_STRENGTH_DEFAULT = 0.312
 GLARE_TYPES = ['FOG_GLOW', 'SIMPLE_STAR', 'STREAKS', 'GHOSTS']
+# write the YOLO labels and masks from the render in memory (see render_labels.py), in place of running gen_masks.py
+# (needs opencv-python installed in blender's python)
+RENDER_LABELS = False
+LABEL_CLASS_ID = 0
+MASK_FORMAT = "rle" # "rle" for one masks.rle file, "png" for a _mask.png per image
 IMG_NUM = 0
 ###
 output_path ="./output/trial_0"   #### use edit this ####
@@ -106,110 +113,6 @@ def set_filter_nodes(filters, node_tree):
     
     return result_dict
 
-def line_from_points(x1,y1, x2,y2):
-    '''Generate a line from two points. 
-    
-    Get the line that passes through the two points that are given.
-    
-    args:
-        x1: The x coordinate of the first point.
-        y1: The y coordinate of the first point.
-        x2: The x coordinate of the second point.
-        y2: The y coordinate of the second point.
-        
-    returns:
-        m: The slope of the line.
-        b: The y-intercept of the line.
-    '''
-    if(x2-x1 == 0):
-        return -100000000, -10000000
-    m = (y2-y1) /(x2-x1)
-    b = y1-m*x1
-    return m,b
-
-def BoundingBox(obj,cam, imageNum):
-    '''Get the bounding box around the spacecraft.
-
-    Construct the bounding box around the spacecraft by adding edge vertices and finding the minimum/maximum vertices. This is done by first looking at the edges and finding the ones that are on the boundary of the image, and then adding vertices on the edge of the image. Then, all vertices are then compared after being projected on the image, and the maximum/minimum values are then returned.
-    
-    args:
-        obj: The spacecraft object we want the bounding box around.
-        cam: The camera object which is taking the image.
-
-    returns:
-        X_min: The minimum x coordinate pixel for the bounding box around the spacecraft.
-        Y_min: The minimum y coordinate pixel for the bounding box around the spacecraft.
-        X_max: The maximum x coordinate pixel for the bounding box around the spacecraft.
-        Y_max: The maximum y coordinate pixel for the bounding box around the spacecraft.
-    '''
-    in_image = []
-    #first, go through, and add all cases of points being outside of the image.
-    for edge in obj.data.edges:
-        verts = [obj.data.vertices[v].co for v in edge.vertices]
-        for i in range(len(verts)):
-            verts[i] = obj.matrix_world @ verts[i]
-        coords_2d = [bpy_extras.object_utils.world_to_camera_view(bpy.context.scene, cam, coord) for coord in verts]
-        one_true = False
-        one_false = False
-        points = []
-        for x, y, d in coords_2d:
-            my_x = RES_X*x
-            my_y = RES_Y-RES_Y*y
-            points.append(tuple((my_x, my_y)))
-            if my_x<=RES_X and my_x>=0 and my_y <=RES_Y and my_y >=0:
-                one_true = True
-            else:
-                one_false = True
-        if one_false and one_true:
-            #first, get the line.
-            m, b = line_from_points(points[0][0], points[0][1], points[1][0], points[1][1])
-
-            #get the x=0 intersect, y=0 intersect, x=RES_X, y=RES_Y
-            #find which one is (a) within the other boundary, and (b) between the two points.
-            #x=0 intersect:
-            if b<min(RES_Y, max(points[0][1], points[1][1])) and b>max(0, min(points[0][1], points[1][1])) :
-                in_image.append(tuple((0,b)))
-            #y=0 intersect
-            elif -b/m<min(RES_X, max(points[0][0], points[1][0])) and -b/m>max(0, min(points[1][0], points[1][0])):
-                in_image.append(tuple((-b/m,0)))
-            #x=RES_X y = m*RES_X+b
-            elif m*RES_X+b<min(RES_Y, max(points[0][1], points[1][1])) and m*RES_X+b>max(0, min(points[0][1], points[1][1])):
-                in_image.append(tuple((RES_X,m*RES_X+b)))
-            elif (RES_Y-b)/m<min(RES_X, max(points[0][0], points[1][0])) and (RES_Y-b)/m>max(0, min(points[0][0], points[1][0])):
-                in_image.append(tuple(((RES_Y-b)/m,RES_Y)))
-        
-
-
-
-    #get the vertices
-    mat = obj.matrix_world
-    verts = [vert.co for vert in obj.data.vertices]
-    for i in range(len(verts)):
-        verts[i] = obj.matrix_world @ verts[i]
-
-    #rotate the coords into the 2d camera view.
-    coords_2d = [bpy_extras.object_utils.world_to_camera_view(bpy.context.scene, cam, coord) for coord in verts]
-
-    for x, y, d in coords_2d:
-        my_x = int(RES_X*x)
-        my_y = int(RES_Y-RES_Y*y)
-        if my_x<=RES_X and my_x>=0 and my_y <=RES_Y and my_y >=0:
-            in_image.append(tuple((RES_X*x,RES_Y-RES_Y*y)))
-
-    Y_max = int(max(in_image, key = lambda i : i[1])[1])
-    X_max = int(max(in_image, key = lambda i : i[0])[0])
-    Y_min = int(min(in_image, key = lambda i : i[1])[1])
-    X_min = int(min(in_image, key = lambda i : i[0])[0])
-
-    in_image.clear()
-
-    return(
-        X_min,
-        Y_min,
-        X_max,
-        Y_max
-    )
-
 
 def clear_render_result():
     """Clear the last render result from memory."""
@@ -246,6 +149,11 @@ def generate(num,
     start_time = time.time()
     output_node = bpy.data.scenes["Render"].node_tree.nodes["File Output"]
     output_node.base_path = output_path
+    if RENDER_LABELS:
+        from render_labels import RenderLabelWriter, link_viewer, output_stem, viewer_alpha
+        link_viewer(bpy.data.scenes["Render"])
+        label_writer = RenderLabelWriter(os.path.join(output_path, "labels"), os.path.join(output_path, "masks"),
+                                         LABEL_CLASS_ID, mask_format=MASK_FORMAT)
 
     # remove all animation
     for scene in bpy.data.scenes:
@@ -361,7 +269,6 @@ def generate(num,
             bpy.data.scenes['Render'].node_tree.nodes['Image'].image = image
 
         #bounding box. We need to get this here so that we can ge the center of the spacecraft...
-        #TODO: fails when the spacecraft loaded is a parent object of multiple meshes.
 
         frame.setup(bpy.data.scenes['Render'], bpy.data.objects["spacecraft"], bpy.data.objects["Camera_Real"], bpy.data.objects["Sun"])
 
@@ -371,6 +278,9 @@ def generate(num,
         
         # render
         bpy.ops.render.render(scene="Render")
+        # labels and mask of the image, from the render still in memory
+        if RENDER_LABELS:
+            label_writer.write(output_stem(output_node, bpy.data.scenes["Render"]), viewer_alpha())
         
         # remove imported objects
         print(objects_before)
@@ -385,6 +295,8 @@ def generate(num,
             
             
             
+    if RENDER_LABELS:
+        label_writer.close()
     end_time = time.time()
     print(end_time - start_time)
 
@@ -0,0 +1,131 @@
+"""
+    YOLO labels and masks straight from the render result, while Blender still holds it in memory.
+    Used by render_fbx.py and render.py (with RENDER_LABELS = True) in place of writing the images and running gen_masks.py over them.
+"""
+
+import os
+import re
+
+import bpy
+import cv2
+import numpy as np
+
+from gen_masks import label_alpha
+from mask_store import MASK_STORE, MaskStoreWriter
+from sprites import alpha_bounds
+
+
+def link_viewer(scene):
+    '''Connect the rendered layer to a Viewer node, so its pixels can be read after each render.
+
+    The Viewer node gets the render layer before any compositing, so its alpha is the coverage of the spacecraft even when a background is composited behind it (the film must be transparent, as it is for the PNG renders gen_masks.py reads).
+
+    args:
+        scene: The scene that is rendered.
+    '''
+    tree = scene.node_tree
+    layers = next(node for node in tree.nodes if node.type == 'R_LAYERS')
+    viewer = next((node for node in tree.nodes if node.type == 'VIEWER'), None)
+    if viewer is None:
+        viewer = tree.nodes.new('CompositorNodeViewer')
+    viewer.use_alpha = True
+    tree.links.new(layers.outputs['Image'], viewer.inputs['Image'])
+    if 'Alpha' in viewer.inputs and 'Alpha' in layers.outputs:
+        tree.links.new(layers.outputs['Alpha'], viewer.inputs['Alpha'])
+
+
+def viewer_alpha():
+    '''Read the alpha channel of the last render from the Viewer node (see `link_viewer`).
+
+    returns:
+        alpha: (H, W) float32 array, top row first as in the saved image.
+    '''
+    image = bpy.data.images['Viewer Node']
+    width, height = image.size
+    pixels = np.empty(width*height*4, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    # blender stores the rows bottom up
+    return pixels.reshape(height, width, 4)[::-1, :, 3]
+
+
+def output_stem(output_node, scene, slot=0):
+    '''Get the file name (without extension) a File Output node gives the image of the current frame.
+
+    args:
+        output_node: The File Output node.
+        scene: The scene whose current frame is written.
+        slot: The file slot of the image.
+
+    returns:
+        stem: The path of the slot with its last run of "#" replaced by the zero padded frame number, or the frame number appended as 4 digits if it has none.
+    '''
+    path = output_node.file_slots[slot].path
+    frame = scene.frame_current
+    runs = list(re.finditer(r"#+", path))
+    if not runs:
+        return f"{path}{frame:04d}"
+    last = runs[-1]
+    return path[:last.start()] + str(frame).zfill(len(last.group())) + path[last.end():]
+
+
+class RenderLabelWriter:
+    '''Write the YOLO label and mask of each render, as gen_masks.py would write them from the saved image.
+
+    The alpha of the render is quantized to 8 bits as in the PNG, so the object pixels, bounding box, polygon and mask are the ones gen_masks.py gets from the file, without decoding it again.
+
+    args:
+        label_folder: The folder for the YOLO label files.
+        mask_folder: The folder for the masks (a masks.rle mask store, or one _mask.png per image).
+        class_id: The class ID of the YOLO labels.
+        polygons: How to write the polygons of spacecraft with several parts (see `gen_masks.POLYGON_MODES`).
+        epsilon: Polygon simplification tolerance in pixels.
+        max_vertices: Largest number of points of a polygon line.
+        decimals: Number of decimal places of the coordinates (full precision if None).
+        mask_format: "rle" or "png" (see `gen_masks.MASK_FORMATS`).
+    '''
+
+    def __init__(self, label_folder, mask_folder, class_id=0, polygons="merged", epsilon=0.0, max_vertices=None,
+                 decimals=None, mask_format="rle"):
+        os.makedirs(label_folder, exist_ok=True)
+        os.makedirs(mask_folder, exist_ok=True)
+        self.label_folder = label_folder
+        self.mask_folder = mask_folder
+        self.class_id = class_id
+        self.options = dict(polygons=polygons, epsilon=epsilon, max_vertices=max_vertices, decimals=decimals)
+        self.mask_format = mask_format
+        self.store_path = os.path.join(mask_folder, MASK_STORE)
+        self.store = MaskStoreWriter(self.store_path + ".tmp") if mask_format == "rle" else None
+        self.written = 0
+        self.empty = 0
+
+    def write(self, stem, alpha):
+        '''Label one render.
+
+        args:
+            stem: The file name of the image without extension.
+            alpha: (H, W) float alpha of the render, top row first (see `viewer_alpha`).
+
+        returns:
+            bbox: (x, y, w, h) pixel bounding box of the spacecraft, or None if it covers no pixel.
+        '''
+        alpha_channel = (np.clip(alpha, 0, 1)*255 + 0.5).astype(np.uint8)
+        mask, lines, _ = label_alpha(alpha_channel, self.class_id, **self.options)
+        if self.store is not None:
+            self.store.write(stem, mask)
+        else:
+            cv2.imwrite(os.path.join(self.mask_folder, f"{stem}_mask.png"), mask)
+        self.written += 1
+        if not lines:
+            self.empty += 1
+            return None
+        with open(os.path.join(self.label_folder, f"{stem}.txt"), "w") as f:
+            f.write("".join(lines))
+        y0, y1, x0, x1 = alpha_bounds(alpha_channel)
+        return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+    def close(self):
+        '''Finish the mask store and print a summary.'''
+        if self.store is not None:
+            self.store.close()
+            os.replace(self.store_path + ".tmp", self.store_path)
+        print(f"Labeled {self.written} renders in memory ({self.empty} without spacecraft pixels): {self.label_folder}, {self.mask_folder}")
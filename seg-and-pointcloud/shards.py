@@ -0,0 +1,212 @@
+import csv
+import io
+import os
+import re
+import tarfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from labels import parse_yolo_label
+
+# Suffix of the index a ShardWriter keeps next to its shards
+SHARD_INDEX_SUFFIX = "_index.csv"
+# Shard file names, `<prefix>-000000.tar` etc.
+SHARD_PATTERN = re.compile(r"^(.+)-\d{6}\.tar$")
+
+
+def remove_shards(folder, prefix=None):
+    """
+    Delete the shards and indexes left in a folder by earlier ShardWriters.
+
+    Args:
+        folder (str): Folder written by ShardWriter.
+        prefix (str, optional): Only delete the shards and index of this prefix. All of them if None.
+
+    Returns:
+        int: Number of files deleted.
+    """
+    if not os.path.isdir(folder):
+        return 0
+    removed = 0
+    for file_name in os.listdir(folder):
+        match = SHARD_PATTERN.match(file_name)
+        file_prefix = match.group(1) if match else file_name[:-len(SHARD_INDEX_SUFFIX)] if file_name.endswith(SHARD_INDEX_SUFFIX) else None
+        if file_prefix is not None and (prefix is None or file_prefix == prefix):
+            os.remove(os.path.join(folder, file_name))
+            removed += 1
+    return removed
+
+
+class ShardWriter:
+    """
+    Append samples to a sequence of tar shards, starting a new shard when the current one is full.
+
+    Each sample is a key and a set of files stored as `<key>.<extension>` members, one after the
+    other, so a shard can be read front to back without seeking. A sample is never split across
+    shards. Every member is also recorded in `<prefix>_index.csv` (key, extension, shard, byte
+    offset and size of the data), which allows random access to single samples. Writes are
+    serialized, so one writer can be shared by several threads. Shards and an index of the same
+    prefix left by an earlier run are deleted first, so they cannot be read as part of this one.
+
+    Args:
+        folder (str): Folder to write the shards and the index to.
+        prefix (str): Shard file name prefix; the shards are named `<prefix>-000000.tar` etc.
+        max_bytes (int): Size limit of a shard. A single sample larger than the limit gets a shard
+            of its own.
+    """
+
+    def __init__(self, folder, prefix="shards", max_bytes=2**30):
+        os.makedirs(folder, exist_ok=True)
+        remove_shards(folder, prefix)
+        self.folder = folder
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.shards = 0
+        self.samples = 0
+        self._tar = None
+        self._shard_name = None
+        self._mtime = time.time()
+        self._lock = threading.Lock()
+        self._index_file = open(os.path.join(folder, prefix + SHARD_INDEX_SUFFIX), "w", newline="")
+        self._index = csv.writer(self._index_file)
+        self._index.writerow(["key", "extension", "shard", "offset", "size"])
+
+    def _open_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+        self._shard_name = f"{self.prefix}-{self.shards:06d}.tar"
+        self._tar = tarfile.open(os.path.join(self.folder, self._shard_name), "w", format=tarfile.USTAR_FORMAT)
+        self.shards += 1
+
+    def write(self, key, files):
+        """
+        Append one sample.
+
+        Args:
+            key (str): Sample name, e.g. "image_00001". Must not contain a ".".
+            files (dict): File extension (e.g. "png") -> file content as bytes.
+        """
+        # Each member takes a 512 byte header plus its data padded to 512 bytes
+        sample_bytes = sum(512 + -(-len(data) // 512) * 512 for data in files.values())
+        with self._lock:
+            if self._tar is None:
+                self._open_shard()
+            elif self._tar.offset > 0:
+                # A closed tar ends with two empty blocks and is padded to a whole record
+                end = self._tar.offset + sample_bytes + 1024
+                if -(-end // tarfile.RECORDSIZE) * tarfile.RECORDSIZE > self.max_bytes:
+                    self._open_shard()
+            for extension, data in files.items():
+                info = tarfile.TarInfo(f"{key}.{extension}")
+                info.size = len(data)
+                info.mtime = self._mtime
+                self._tar.addfile(info, io.BytesIO(data))
+                # The data ends at the current offset, before its padding
+                offset = self._tar.offset - -(-len(data) // 512) * 512
+                self._index.writerow([key, extension, self._shard_name, offset, len(data)])
+            self.samples += 1
+
+    def close(self):
+        with self._lock:
+            if self._tar is not None:
+                self._tar.close()
+                self._tar = None
+            self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def list_shards(folder):
+    """
+    Returns:
+        list: Sorted paths of the tar shards in a folder.
+    """
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(".tar")]
+
+
+def iter_shards(folder):
+    """
+    Read the samples of every shard in a folder sequentially.
+
+    Each shard is streamed front to back, which is the fast access pattern for network and
+    shared filesystems.
+
+    Args:
+        folder (str): Folder written by ShardWriter.
+
+    Yields:
+        tuple: (key, files) with files mapping extension -> bytes.
+    """
+    for shard_path in list_shards(folder):
+        key, files = None, {}
+        with tarfile.open(shard_path, "r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                member_key, extension = member.name.split(".", 1)
+                if member_key != key:
+                    if files:
+                        yield key, files
+                    key, files = member_key, {}
+                files[extension] = tar.extractfile(member).read()
+        if files:
+            yield key, files
+
+
+def load_shard_index(folder):
+    """
+    Read the indexes of all the shard writers of a folder.
+
+    Args:
+        folder (str): Folder written by ShardWriter.
+
+    Returns:
+        dict: Key -> {extension: (shard path, offset, size)}.
+    """
+    index = {}
+    for index_name in sorted(f for f in os.listdir(folder) if f.endswith(SHARD_INDEX_SUFFIX)):
+        with open(os.path.join(folder, index_name), "r", newline="") as csvfile:
+            for row in csv.DictReader(csvfile):
+                index.setdefault(row["key"], {})[row["extension"]] = (
+                    os.path.join(folder, row["shard"]), int(row["offset"]), int(row["size"]))
+    return index
+
+
+def read_sample(index, key):
+    """
+    Read a single sample from the shards without scanning them.
+
+    Args:
+        index (dict): Shard index from load_shard_index.
+        key (str): Sample name.
+
+    Returns:
+        dict: Extension -> bytes.
+    """
+    files = {}
+    for extension, (shard_path, offset, size) in index[key].items():
+        with open(shard_path, "rb") as shard:
+            shard.seek(offset)
+            files[extension] = shard.read(size)
+    return files
+
+
+def decode_sample(files):
+    """
+    Decode a composite sample written by gen_seg_pipe.py.
+
+    Args:
+        files (dict): Extension -> bytes, with a "png" image and a "txt" YOLO label.
+
+    Returns:
+        tuple: (image, labels) with the decoded image and a list of YoloLabel entries.
+    """
+    image = cv2.imdecode(np.frombuffer(files["png"], dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    return image, parse_yolo_label(files["txt"].decode())
@@ -0,0 +1,151 @@
+import os
+import json
+import argparse
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# Index of a sprite folder: sprite file name -> offset and size of the frame it was cropped from
+SPRITE_INDEX = "sprites.json"
+
+Sprite = namedtuple("Sprite", ["image", "x", "y", "frame_width", "frame_height"])
+
+
+def alpha_bounds(alpha):
+    """
+    Find the bounding region of the non-transparent pixels in an alpha channel.
+
+    Args:
+        alpha (np.ndarray): Single channel alpha image.
+
+    Returns:
+        tuple: (y0, y1, x0, x1) half-open bounds of the object, or None if the image is fully transparent.
+    """
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+
+def crop_to_alpha(image):
+    """
+    Crop an RGBA render to the bounding box of its non-transparent pixels.
+
+    Args:
+        image (np.ndarray): Image with an alpha channel.
+
+    Returns:
+        Sprite: The crop and its offset in the frame. A fully transparent render gives a single
+            transparent pixel at (0, 0).
+    """
+    frame_height, frame_width = image.shape[:2]
+    bounds = alpha_bounds(image[:, :, 3])
+    if bounds is None:
+        return Sprite(np.zeros((1, 1, 4), dtype=image.dtype), 0, 0, frame_width, frame_height)
+    y0, y1, x0, x1 = bounds
+    return Sprite(image[y0:y1, x0:x1], int(x0), int(y0), frame_width, frame_height)
+
+
+def load_sprite_index(folder):
+    """
+    Read the sprite index of a folder.
+
+    Args:
+        folder (str): Folder that may contain sprites.
+
+    Returns:
+        dict: Sprite file name -> {"x", "y", "frame_width", "frame_height"}, or None if the folder
+            is not a sprite folder.
+    """
+    index_path = os.path.join(folder, SPRITE_INDEX)
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path, "r") as json_file:
+        return json.load(json_file)
+
+
+def sprite_from_entry(image, entry):
+    """
+    Attach the sprite index entry of a decoded sprite image to it.
+
+    Args:
+        image (np.ndarray): Decoded sprite image.
+        entry (dict): Entry of the sprite in the sprite index.
+
+    Returns:
+        Sprite
+    """
+    return Sprite(image, entry["x"], entry["y"], entry["frame_width"], entry["frame_height"])
+
+
+def expand_sprite(sprite):
+    """
+    Paste a sprite back into a transparent frame of its original size.
+
+    Args:
+        sprite (Sprite): Sprite to expand.
+
+    Returns:
+        np.ndarray: Full-frame image.
+    """
+    image = sprite.image
+    frame = np.zeros((sprite.frame_height, sprite.frame_width) + image.shape[2:], dtype=image.dtype)
+    frame[sprite.y:sprite.y + image.shape[0], sprite.x:sprite.x + image.shape[1]] = image
+    return frame
+
+
+def make_sprites(image_folder, sprite_folder):
+    """
+    Crop every RGBA render in a folder to its alpha bounding box and write the crops as a sprite folder.
+
+    Args:
+        image_folder (str): Path to the folder containing rendered images with alpha channels.
+        sprite_folder (str): Path to save the sprites and their index.
+    """
+    os.makedirs(sprite_folder, exist_ok=True)
+
+    index = {}
+    render_bytes = 0
+    sprite_bytes = 0
+    frame_area = 0
+    sprite_area = 0
+    for image_name in sorted(os.listdir(image_folder)):
+        if image_name.endswith(".png"):
+            image_path = os.path.join(image_folder, image_name)
+            image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+            if image is None or image.ndim != 3 or image.shape[-1] != 4:
+                print(f"Skipping {image_name}: no alpha channel.")
+                continue
+
+            sprite = crop_to_alpha(image)
+            sprite_path = os.path.join(sprite_folder, image_name)
+            cv2.imwrite(sprite_path, sprite.image)
+            index[image_name] = {
+                "x": sprite.x,
+                "y": sprite.y,
+                "frame_width": sprite.frame_width,
+                "frame_height": sprite.frame_height,
+            }
+
+            render_bytes += os.path.getsize(image_path)
+            sprite_bytes += os.path.getsize(sprite_path)
+            frame_area += sprite.frame_width * sprite.frame_height
+            sprite_area += sprite.image.shape[0] * sprite.image.shape[1]
+
+    with open(os.path.join(sprite_folder, SPRITE_INDEX), "w") as json_file:
+        json.dump(index, json_file, indent=4)
+
+    if index:
+        print(f"Wrote {len(index)} sprites covering {sprite_area / frame_area:.1%} of the frame area, "
+              f"{sprite_bytes / 2**20:.1f} MiB instead of {render_bytes / 2**20:.1f} MiB.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crop transparent renders to their alpha bounding box.")
+    parser.add_argument("image_folder", type=str, help="Path to the folder containing rendered images with alpha channels.")
+    parser.add_argument("sprite_folder", type=str, help="Path to save the cropped sprites and sprites.json index.")
+
+    args = parser.parse_args()
+    make_sprites(args.image_folder, args.sprite_folder)